@@ -0,0 +1,69 @@
+# aggregate.py
+#
+# Hash aggregation state, shared by the executor and the parallel workers.
+# aggregates holds (output key, function, input key or None for COUNT(*));
+# a group keeps a [count, value] pair per aggregate, and pairs built over
+# different parts of the input can be merged.
+
+
+def new_states(aggregates):
+    return [[0, None] for _ in aggregates]
+
+
+def update(states, aggregates, get):
+    # Fold one input row into a group; get(key) reads one of its values
+    for state, (_, func, column) in zip(states, aggregates):
+        if column is None:
+            state[0] += 1
+            continue
+        value = get(column)
+        if value is None:
+            continue
+        state[0] += 1
+        current = state[1]
+        if current is None:
+            state[1] = value
+        elif func in ("SUM", "AVG"):
+            state[1] = current + value
+        elif func == "MIN" and value < current or func == "MAX" and value > current:
+            state[1] = value
+
+
+def merge(groups, other, aggregates):
+    # Add the groups of other, aggregated over other rows, into groups
+    for key, states in other.items():
+        mine = groups.get(key)
+        if mine is None:
+            groups[key] = states
+            continue
+        for state, (count, value), (_, func, _) in zip(mine, states, aggregates):
+            state[0] += count
+            current = state[1]
+            if value is None:
+                continue
+            if current is None:
+                state[1] = value
+            elif func in ("SUM", "AVG"):
+                state[1] = current + value
+            elif func == "MIN" and value < current or func == "MAX" and value > current:
+                state[1] = value
+    return groups
+
+
+def finish(func, count, value):
+    if func == "COUNT":
+        return count
+    if func == "AVG":
+        return value / count if count else None
+    return value
+
+
+def result_rows(groups, group_keys, aggregates):
+    if not groups and not group_keys:
+        # An aggregate without GROUP BY always yields one row, even over no input
+        groups[()] = new_states(aggregates)
+    for key, states in groups.items():
+        row = dict(zip(group_keys, key))
+        for (name, func, _), (count, value) in zip(aggregates, states):
+            row[name] = finish(func, count, value)
+        yield row
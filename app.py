@@ -1,5 +1,29 @@
-from flask import Flask, render_template_string, request, redirect
-from repl import db  # use the same Database instance from repl.py
+import json
+import os
+from itertools import chain, takewhile
+from urllib.parse import urlencode
+
+from flask import (
+    Flask, Response, abort, jsonify, redirect, render_template_string, request, stream_template_string,
+    stream_with_context,
+)
+from metrics import Metrics
+
+# With RDBMS_SERVER=host:port every dashboard process shares the database
+# hosted by server.py; otherwise the app uses the one from repl.py in-process
+if os.environ.get("RDBMS_SERVER"):
+    from client import Client
+
+    db = Client(os.environ["RDBMS_SERVER"], pool_size=int(os.environ.get("RDBMS_POOL_SIZE", "8")))
+    # The server keeps the statement metrics
+    render_metrics = db.metrics
+else:
+    from repl import db
+
+    # Statement latency histograms and counters, served at /metrics for Prometheus
+    metrics = Metrics()
+    db.add_hook(metrics)
+    render_metrics = metrics.render
 
 app = Flask(__name__)
 
@@ -76,6 +100,8 @@ INDEX_HTML = """
     button:hover { background: #1565c0; }
     a { color: #1976d2; text-decoration: none; font-weight: bold; }
     a:hover { text-decoration: underline; }
+    .card th a { color: inherit; }
+    .pager { display: flex; justify-content: space-between; margin-bottom: 10px; }
     .join-section {
       width: 100%;
       margin-top: 40px;
@@ -88,64 +114,40 @@ INDEX_HTML = """
       .container { flex-direction: column; align-items: center; }
     }
   </style>
-  <script>
-    function searchTable(inputId, tableId) {
-      const input = document.getElementById(inputId);
-      const filter = input.value.toLowerCase();
-      const table = document.getElementById(tableId);
-      const tr = table.getElementsByTagName("tr");
-      for (let i = 1; i < tr.length; i++) {
-        let visible = false;
-        const td = tr[i].getElementsByTagName("td");
-        for (let j = 0; j < td.length; j++) {
-          if (td[j].innerText.toLowerCase().indexOf(filter) > -1) visible = true;
-        }
-        tr[i].style.display = visible ? "" : "none";
-      }
-    }
-
-    function sortTable(tableId, colIndex) {
-      const table = document.getElementById(tableId);
-      let rows, switching, i, x, y, shouldSwitch, dir, switchcount = 0;
-      switching = true; dir = "asc";
-      while (switching) {
-        switching = false;
-        rows = table.rows;
-        for (i = 1; i < (rows.length - 1); i++) {
-          shouldSwitch = false;
-          x = rows[i].getElementsByTagName("TD")[colIndex];
-          y = rows[i + 1].getElementsByTagName("TD")[colIndex];
-          if (dir == "asc") {
-            if (x.innerText.toLowerCase() > y.innerText.toLowerCase()) { shouldSwitch = true; break; }
-          } else if (dir == "desc") {
-            if (x.innerText.toLowerCase() < y.innerText.toLowerCase()) { shouldSwitch = true; break; }
-          }
-        }
-        if (shouldSwitch) {
-          rows[i].parentNode.insertBefore(rows[i + 1], rows[i]);
-          switching = true; switchcount++;
-        } else {
-          if (switchcount == 0 && dir == "asc") { dir = "desc"; switching = true; }
-        }
-      }
-    }
-  </script>
 </head>
 <body>
+  {% macro sort_header(page, prefix, column, label) -%}
+  <th><a href="{{ url({prefix ~ '_sort': column, prefix ~ '_dir': 'desc' if page.sort == column and not page.descending else 'asc', prefix ~ '_after': None, prefix ~ '_skip': None, prefix ~ '_null_after': None}) }}">
+    {{ label }}{% if page.sort == column %} {{ '&#9660;' if page.descending else '&#9650;' }}{% endif %}
+  </a></th>
+  {%- endmacro %}
+  {% macro pager(page, prefix) -%}
+  <div class="pager">
+    {% if page.paged %}<a href="{{ url({prefix ~ '_after': None, prefix ~ '_skip': None, prefix ~ '_null_after': None}) }}">&laquo; First page</a>{% else %}<span></span>{% endif %}
+    {% if page.next %}<a href="{{ url(page.next) }}">Next &raquo;</a>{% endif %}
+  </div>
+  {%- endmacro %}
+  {% macro search(page, prefix) -%}
+  <form method="GET" action="/">
+    <input type="hidden" name="{{ prefix }}_sort" value="{{ page.sort }}">
+    <input type="hidden" name="{{ prefix }}_dir" value="{{ 'desc' if page.descending else 'asc' }}">
+    <input type="text" name="{{ prefix }}_q" value="{{ page.q }}" placeholder="{{ page.sort }} starts with...">
+  </form>
+  {%- endmacro %}
   <header><h1>Mini-RDBMS Dashboard</h1></header>
 
   <div class="container">
     <div class="card">
       <h2>Users</h2>
-      <input type="text" id="userSearch" placeholder="Search Users..." onkeyup="searchTable('userSearch','usersTable')">
+      {{ search(users, 'users') }}
       <table id="usersTable">
         <tr>
-          <th onclick="sortTable('usersTable',0)">ID</th>
-          <th onclick="sortTable('usersTable',1)">Name</th>
-          <th onclick="sortTable('usersTable',2)">Email</th>
+          {{ sort_header(users, 'users', 'id', 'ID') }}
+          {{ sort_header(users, 'users', 'name', 'Name') }}
+          {{ sort_header(users, 'users', 'email', 'Email') }}
           <th>Actions</th>
         </tr>
-        {% for user in users %}
+        {% for user in users.rows %}
         <tr>
           <td>{{ user['id'] }}</td>
           <td>{{ user['name'] }}</td>
@@ -157,6 +159,7 @@ INDEX_HTML = """
         </tr>
         {% endfor %}
       </table>
+      {{ pager(users, 'users') }}
       <h3>Add User</h3>
       <form method="POST" action="/add_user">
         <input name="name" placeholder="Name" required>
@@ -167,15 +170,15 @@ INDEX_HTML = """
 
     <div class="card">
       <h2>Orders</h2>
-      <input type="text" id="orderSearch" placeholder="Search Orders..." onkeyup="searchTable('orderSearch','ordersTable')">
+      {{ search(orders, 'orders') }}
       <table id="ordersTable">
         <tr>
-          <th onclick="sortTable('ordersTable',0)">ID</th>
-          <th onclick="sortTable('ordersTable',1)">User ID</th>
-          <th onclick="sortTable('ordersTable',2)">Item</th>
+          {{ sort_header(orders, 'orders', 'id', 'ID') }}
+          {{ sort_header(orders, 'orders', 'user_id', 'User ID') }}
+          {{ sort_header(orders, 'orders', 'item', 'Item') }}
           <th>Actions</th>
         </tr>
-        {% for order in orders %}
+        {% for order in orders.rows %}
         <tr class="{{ 'highlight' if order['id'] > recent_threshold else '' }}">
           <td>{{ order['id'] }}</td>
           <td>{{ order['user_id'] }}</td>
@@ -186,6 +189,7 @@ INDEX_HTML = """
         </tr>
         {% endfor %}
       </table>
+      {{ pager(orders, 'orders') }}
       <h3>Add Order</h3>
       <form method="POST" action="/add_order">
         <input name="user_id" placeholder="User ID" required>
@@ -205,7 +209,7 @@ INDEX_HTML = """
         <th>Order ID</th>
         <th>Item</th>
       </tr>
-      {% for row in join_rows %}
+      {% for row in join_rows.rows %}
       <tr>
         <td>{{ row['users.id'] }}</td>
         <td>{{ row['users.name'] }}</td>
@@ -215,6 +219,7 @@ INDEX_HTML = """
       </tr>
       {% endfor %}
     </table>
+    {{ pager(join_rows, 'join') }}
   </div>
 </body>
 </html>
@@ -245,63 +250,328 @@ EDIT_USER_HTML = """
 </html>
 """
 
+def ensure(text, exists):
+    # Run a CREATE statement unless exists(schema) says it already ran; another
+    # dashboard process sharing the server may get there first
+    if exists(db.schema()):
+        return
+    try:
+        db.execute(text)
+    except ValueError:
+        if not exists(db.schema()):
+            raise
+
 # Ensure tables exist
-if "users" not in db.tables:
-    db.create_table("users", {"id": "INT", "name": "TEXT", "email": "TEXT"}, primary_key="id", unique_keys=["email"])
-if "orders" not in db.tables:
-    db.create_table("orders", {"id": "INT", "user_id": "INT", "item": "TEXT"}, primary_key="id")
+ensure(
+    "CREATE TABLE users (id INT PRIMARY KEY AUTO_INCREMENT, name TEXT, email TEXT UNIQUE)",
+    lambda schema: "users" in schema["tables"],
+)
+ensure(
+    "CREATE TABLE orders (id INT PRIMARY KEY AUTO_INCREMENT, user_id INT, item TEXT)",
+    lambda schema: "orders" in schema["tables"],
+)
+# Data directories from before the ids were AUTO_INCREMENT hold tables without
+# a sequence, where inserting without an id fails; their sequence starts past the largest id
+for table_name in ("users", "orders"):
+    ensure(
+        f"ALTER TABLE {table_name} MODIFY id AUTO_INCREMENT",
+        lambda schema, table_name=table_name: schema["tables"][table_name]["auto_increment"] == "id",
+    )
+# Columns the dashboard can sort and search on, with the type of their values.
+# Each gets an ordered index so a page is a range scan that stops after LIMIT rows.
+PAGE_SIZE = 25
+SORTABLE = {
+    "users": {"id": int, "name": str, "email": str},
+    "orders": {"id": int, "user_id": int, "item": str},
+}
+def has_ordered_index(table_name, column):
+    return lambda schema: any(
+        index["ordered"] and index["column"] == column for index in schema["tables"][table_name]["indexes"].values()
+    )
+
+for table_name, columns in SORTABLE.items():
+    for column in columns:
+        ensure(
+            f"CREATE ORDERED INDEX {table_name}_{column}_ordered ON {table_name}({column})",
+            has_ordered_index(table_name, column),
+        )
+# The dashboard join is kept up to date on every write instead of recomputed per page view
+ensure(
+    "CREATE MATERIALIZED VIEW users_orders AS SELECT * FROM users JOIN orders ON users.id = orders.user_id",
+    lambda schema: "users_orders" in schema["views"],
+)
+# The join page is an ordered scan of this index from the last order id shown
+ensure(
+    "CREATE ORDERED INDEX users_orders_order_id ON users_orders(orders.id)",
+    lambda schema: any(index["column"] == "orders.id" for index in schema["views"]["users_orders"]["indexes"].values()),
+)
+
+SELECT_USER = db.prepare("SELECT * FROM users WHERE id = ?")
+# Answered from the ordered index on id without a scan
+LAST_ID = {
+    "users": db.prepare("SELECT MAX(id) AS id FROM users"),
+    "orders": db.prepare("SELECT MAX(id) AS id FROM orders"),
+}
+# Ids come from the tables' AUTO_INCREMENT sequences
+INSERT_USER = db.prepare("INSERT INTO users (name, email) VALUES (?, ?)")
+UPDATE_USER = db.prepare("UPDATE users SET name = ?, email = ? WHERE id = ?")
+DELETE_USER = db.prepare("DELETE FROM users WHERE id = ?")
+INSERT_ORDER = db.prepare("INSERT INTO orders (user_id, item) VALUES (?, ?)")
+DELETE_ORDER = db.prepare("DELETE FROM orders WHERE id = ?")
+
+def last_id(table_name):
+    return LAST_ID[table_name].execute()[0]["id"] or 0
+
+def url(changes):
+    # The current dashboard URL with some query parameters replaced (None removes one)
+    args = request.args.to_dict()
+    for key, value in changes.items():
+        if value is None:
+            args.pop(key, None)
+        else:
+            args[key] = value
+    return "/?" + urlencode(args) if args else "/"
+
+def fetch_page(table_name, args):
+    # One page of a table, searched, sorted and cut by the engine. Rows come in
+    # (sort IS NULL, sort, id) order, the whole order reversed when descending,
+    # so NULL sort values come last (first when descending). Paging is keyset
+    # based: a cursor into the other rows is the last sort value shown plus how
+    # many rows with that value were shown, so the next page seeks to it in the
+    # ordered index instead of counting past an offset; a cursor into the NULL
+    # rows is the last id shown.
+    prefix = f"{table_name}_"
+    columns = SORTABLE[table_name]
+    sort = args.get(prefix + "sort", "id")
+    if sort not in columns:
+        sort = "id"
+    descending = args.get(prefix + "dir") == "desc"
+    convert = columns[sort]
+    search = args.get(prefix + "q", "").strip()
+    try:
+        after = args.get(prefix + "after")
+        after = None if after is None else convert(after)
+        skip = int(args.get(prefix + "skip") or 0)
+        null_after = args.get(prefix + "null_after")
+        null_after = None if null_after is None else int(null_after)
+    except ValueError:
+        abort(400, f"Invalid {table_name} page cursor")
+    if skip < 0 or (skip and after is None) or (after is not None and null_after is not None):
+        abort(400, f"Invalid {table_name} page cursor")
+    if skip:
+        # The skip counts rows equal to the cursor value, so it can never
+        # exceed how many there are; a larger one would only make the page scan further
+        run = db.execute(f"SELECT COUNT(*) AS n FROM {table_name} WHERE {sort} = ?", (after,))[0]["n"]
+        skip = min(skip, run)
+    direction = "DESC" if descending else "ASC"
+    wanted = PAGE_SIZE + 1
 
-def next_id(table_name):
-    rows = db.select_all_from(table_name)
-    return max([r["id"] for r in rows], default=0) + 1
+    def value_rows(limit):
+        # Rows with a sort value, from the cursor on
+        conditions = [f"{sort} IS NOT NULL"]
+        params = []
+        if search:
+            # The search is a prefix match on the sort column (an exact match
+            # for numbers), so it is a range scan on the same ordered index
+            if convert is int:
+                conditions.append(f"{sort} = ?")
+                params.append(int(search) if search.lstrip("-").isdigit() else None)
+            else:
+                conditions += [f"{sort} >= ?", f"{sort} < ?"]
+                params += [search, search + "\U0010ffff"]
+        if after is not None:
+            conditions.append(f"{sort} {'<=' if descending else '>='} ?")
+            params.append(after)
+        text = f"SELECT * FROM {table_name} WHERE {' AND '.join(conditions)} ORDER BY {sort} {direction} LIMIT ?"
+        rows = db.execute(text, (*params, skip + limit))
+        # Drop the rows equal to the cursor value that the previous page already showed
+        shown = 0
+        while shown < min(skip, len(rows)) and rows[shown][sort] == after:
+            shown += 1
+        return rows[shown:], shown
+
+    def null_rows(limit):
+        # Rows without a sort value, in id order; they never match a search
+        if search:
+            return []
+        text = f"SELECT * FROM {table_name} WHERE {sort} IS NULL"
+        params = []
+        if null_after is not None:
+            text += f" AND id {'<' if descending else '>'} ?"
+            params.append(null_after)
+        return db.execute(text + f" ORDER BY id {direction} LIMIT ?", (*params, limit))
+
+    shown = 0
+    if descending:
+        rows = null_rows(wanted) if after is None else []
+        if len(rows) < wanted:
+            more, shown = value_rows(wanted - len(rows))
+            rows += more
+    else:
+        rows = []
+        if null_after is None:
+            rows, shown = value_rows(wanted)
+        if len(rows) < wanted:
+            rows += null_rows(wanted - len(rows))
+
+    next_args = None
+    if len(rows) > PAGE_SIZE:
+        rows = rows[:PAGE_SIZE]
+        last = rows[-1][sort]
+        if last is None:
+            next_args = {prefix + "null_after": rows[-1]["id"], prefix + "after": None, prefix + "skip": None}
+        else:
+            ties = sum(1 for _ in takewhile(lambda row: row[sort] == last, reversed(rows)))
+            if ties == len(rows) and last == after:
+                ties += shown
+            next_args = {prefix + "after": last, prefix + "skip": ties, prefix + "null_after": None}
+    return {
+        "rows": rows,
+        "sort": sort,
+        "descending": descending,
+        "q": search,
+        "paged": after is not None or null_after is not None,
+        "next": next_args,
+    }
+
+def fetch_join_page(args):
+    # The join view is paged by order id, which is unique in it, from its ordered index
+    try:
+        after = int(args["join_after"]) if "join_after" in args else None
+    except ValueError:
+        abort(400, "Invalid join page cursor")
+    text = "SELECT * FROM users_orders"
+    params = []
+    if after is not None:
+        text += " WHERE orders.id > ?"
+        params.append(after)
+    rows = db.execute(text + " ORDER BY orders.id LIMIT ?", (*params, PAGE_SIZE + 1))
+    next_args = {"join_after": rows[PAGE_SIZE - 1]["orders.id"]} if len(rows) > PAGE_SIZE else None
+    return {"rows": rows[:PAGE_SIZE], "paged": after is not None, "next": next_args}
 
 @app.route("/")
 def index():
-    users = db.select_all_from("users")
-    orders = db.select_all_from("orders")
-    recent_threshold = max([o["id"] for o in orders], default=0) - 2
-    join_rows = []
-    for u in users:
-        for o in orders:
-            if u["id"] == o["user_id"]:
-                combined = {f"users.{k}": v for k, v in u.items()}
-                combined.update({f"orders.{k}": v for k, v in o.items()})
-                join_rows.append(combined)
-    return render_template_string(INDEX_HTML, users=users, orders=orders, join_rows=join_rows, recent_threshold=recent_threshold)
+    # Only the requested page of each table is fetched and rendered
+    users = fetch_page("users", request.args)
+    orders = fetch_page("orders", request.args)
+    recent_threshold = last_id("orders") - 2
+    join_rows = fetch_join_page(request.args)
+    return stream_template_string(
+        INDEX_HTML, users=users, orders=orders, join_rows=join_rows, recent_threshold=recent_threshold, url=url
+    )
 
 @app.route("/add_user", methods=["POST"])
 def add_user():
-    new_id = next_id("users")
     name = request.form["name"]
     email = request.form["email"]
-    db.insert_into("users", [new_id, name, email])
+    INSERT_USER.execute((name, email))
     return redirect("/")
 
 @app.route("/edit_user/<int:user_id>", methods=["GET","POST"])
 def edit_user(user_id):
-    users = db.select_all_from("users")
-    user = next((u for u in users if u["id"] == user_id), None)
+    users = SELECT_USER.execute((user_id,))
+    user = users[0] if users else None
     if not user: return "User not found"
     if request.method == "POST":
-        db.update("users", {"name": request.form["name"], "email": request.form["email"]}, where={"id": user_id})
+        UPDATE_USER.execute((request.form["name"], request.form["email"], user_id))
         return redirect("/")
     return render_template_string(EDIT_USER_HTML, user=user)
 
 @app.route("/delete_user/<int:user_id>")
 def delete_user(user_id):
-    db.delete_from("users", where={"id": user_id})
+    DELETE_USER.execute((user_id,))
     return redirect("/")
 
 @app.route("/add_order", methods=["POST"])
 def add_order():
-    new_id = next_id("orders")
-    db.insert_into("orders", [new_id, int(request.form["user_id"]), request.form["item"]])
+    INSERT_ORDER.execute((int(request.form["user_id"]), request.form["item"]))
     return redirect("/")
 
 @app.route("/delete_order/<int:order_id>")
 def delete_order(order_id):
-    db.delete_from("orders", where={"id": order_id})
+    DELETE_ORDER.execute((order_id,))
     return redirect("/")
 
+# JSON API. Results are streamed as a JSON array, or as NDJSON (one row per
+# line) with ?format=ndjson or an Accept: application/x-ndjson header.
+
+def json_rows(rows, ndjson):
+    if ndjson:
+        # The status is sent by now, so a failure ends the stream with an error line
+        try:
+            for row in rows:
+                yield json.dumps(row) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        return
+    yield "["
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + "\n" + json.dumps(row)
+    yield "\n]\n"
+
+def api_error(message, status=400):
+    response = jsonify({"error": message})
+    response.status_code = status
+    return response
+
+def query_response(statement, params):
+    # Conditional requests: the ETag comes from the versions of the tables the
+    # query reads, so an unchanged result is answered 304 without running it
+    etag = statement.etag(params)
+    headers = {"ETag": f'"{etag}"'}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    ndjson = request.args.get("format") == "ndjson" or "application/x-ndjson" in request.headers.get("Accept", "")
+    rows = statement.stream(params)
+    # Run the query up to its first row before answering, so errors found
+    # by then still get a 400 instead of a broken 200
+    first = next(rows, None)
+    rows = iter(()) if first is None else chain([first], rows)
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    return Response(stream_with_context(json_rows(rows, ndjson)), mimetype=mimetype, headers=headers)
+
+@app.route("/api/tables/<name>")
+def api_table(name):
+    schema = db.schema()
+    if name not in schema["tables"] and name not in schema["views"]:
+        return api_error(f"Table {name} does not exist", 404)
+    text = f"SELECT * FROM {name}"
+    params = ()
+    if "limit" in request.args:
+        text += " LIMIT ?"
+        params = (request.args.get("limit", type=int) or 0,)
+    try:
+        return query_response(db.prepare(text), params)
+    except ValueError as e:
+        return api_error(str(e))
+
+@app.route("/api/query", methods=["GET", "POST"])
+def api_query():
+    # GET /api/query?sql=...&params=[...] or POST {"sql": "...", "params": [...]}
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        text, params = body.get("sql"), body.get("params", [])
+    else:
+        text = request.args.get("sql")
+        try:
+            params = json.loads(request.args.get("params", "[]"))
+        except ValueError:
+            return api_error("params must be a JSON array")
+    if not text:
+        return api_error("Missing sql")
+    if not isinstance(params, list):
+        return api_error("params must be a JSON array")
+    try:
+        statement = db.prepare(text)
+        if statement.kind != "select":
+            return api_error("Only SELECT statements can be run through the API")
+        return query_response(statement, tuple(params))
+    except ValueError as e:
+        return api_error(str(e))
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,285 @@
+# bench.py
+#
+# Benchmarks the engine on synthetic users/orders datasets:
+#
+#   python bench.py                                  # 10k, 100k and 1M rows -> bench_results.json
+#   python bench.py --sizes 10000 --ops 200 -o base.json
+#   python bench.py --sizes 10000 --ops 200 --compare base.json
+#   python bench.py --compare base.json new.json     # compare two saved runs
+#
+# Each size runs in its own process so peak memory is that size's alone.
+# Inserts go through Database.insert_into and everything else through
+# Database.execute with literal SQL, the path the REPL takes.
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from rdbms import Database
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+ITEMS = ["pen", "book", "lamp", "desk", "mug", "chair", "phone", "bag"]
+
+# (name, what the statement does, whether it reads every row); statements
+# that scan are run fewer times on large tables so a size finishes in minutes
+BENCHMARKS = [
+    ("insert", "Database.insert_into one user", False),
+    ("pk_lookup", "SELECT * FROM users WHERE id = ?", False),
+    ("filter_indexed", "SELECT * FROM orders WHERE user_id = ?  (hash index)", False),
+    ("filter_range", "SELECT * FROM users WHERE age BETWEEN ? AND ? LIMIT 100  (ordered index)", False),
+    ("filter_scan", "SELECT id, name FROM users WHERE name = ? AND email LIKE ?  (full scan)", True),
+    ("join_inner", "users JOIN orders ON users.id = orders.user_id WHERE users.id = ?", False),
+    ("join_left", "users LEFT JOIN orders ON users.id = orders.user_id WHERE users.age = ? LIMIT 50", False),
+    ("join_scan", "users JOIN orders ... WHERE orders.amount > ?  (hash join over a scan)", True),
+    ("update", "UPDATE users SET age = ? WHERE id = ?", False),
+    ("update_scan", "UPDATE orders SET item = ? WHERE amount = ?  (full scan)", True),
+    ("delete", "DELETE FROM orders WHERE id = ?", False),
+]
+
+
+def build(db, size, rng):
+    # size users and size orders; 1% of users have no orders
+    db.execute("CREATE TABLE users (id INT PRIMARY KEY, name TEXT, email TEXT UNIQUE, age INT)")
+    db.execute("CREATE TABLE orders (id INT PRIMARY KEY, user_id INT, item TEXT, amount INT)")
+    db.insert_many("users", [(i, f"user{i % 5000}", f"user{i}@example.com", rng.randrange(18, 90)) for i in range(size)])
+    with_orders = max(1, size * 99 // 100)
+    db.insert_many(
+        "orders",
+        [(i, rng.randrange(with_orders), rng.choice(ITEMS), rng.randrange(1, 10_000)) for i in range(size)],
+    )
+    db.execute("CREATE INDEX orders_user_id ON orders(user_id)")
+    db.execute("CREATE ORDERED INDEX users_age ON users(age)")
+
+
+def statements(name, size, rng, count):
+    # count (callable, args) pairs for one benchmark, generated before timing starts
+    users = size
+    if name == "insert":
+        return [("insert", (users + i, f"new{i}", f"new{i}@example.com", rng.randrange(18, 90))) for i in range(count)]
+    if name == "pk_lookup":
+        return [(f"SELECT * FROM users WHERE id = {rng.randrange(users)}",) for _ in range(count)]
+    if name == "filter_indexed":
+        return [(f"SELECT * FROM orders WHERE user_id = {rng.randrange(users)}",) for _ in range(count)]
+    if name == "filter_range":
+        return [
+            (f"SELECT * FROM users WHERE age BETWEEN {age} AND {age + 2} LIMIT 100",)
+            for age in (rng.randrange(18, 88) for _ in range(count))
+        ]
+    if name == "filter_scan":
+        return [
+            (f"SELECT id, name FROM users WHERE name = 'user{rng.randrange(5000)}' AND email LIKE '%{rng.randrange(10)}@example.com'",)
+            for _ in range(count)
+        ]
+    if name == "join_inner":
+        return [
+            (f"SELECT users.name, orders.item FROM users JOIN orders ON users.id = orders.user_id WHERE users.id = {rng.randrange(users)}",)
+            for _ in range(count)
+        ]
+    if name == "join_left":
+        return [
+            (f"SELECT users.name, orders.item FROM users LEFT JOIN orders ON users.id = orders.user_id WHERE users.age = {rng.randrange(18, 90)} LIMIT 50",)
+            for _ in range(count)
+        ]
+    if name == "join_scan":
+        return [
+            (f"SELECT users.name, orders.amount FROM users JOIN orders ON users.id = orders.user_id WHERE orders.amount > {rng.randrange(9_900, 10_000)}",)
+            for _ in range(count)
+        ]
+    if name == "update":
+        return [(f"UPDATE users SET age = {rng.randrange(18, 90)} WHERE id = {rng.randrange(users)}",) for _ in range(count)]
+    if name == "update_scan":
+        return [
+            (f"UPDATE orders SET item = '{rng.choice(ITEMS)}' WHERE amount = {rng.randrange(1, 10_000)}",)
+            for _ in range(count)
+        ]
+    if name == "delete":
+        return [(f"DELETE FROM orders WHERE id = {i}",) for i in rng.sample(range(size), min(count, size))]
+    raise ValueError(f"Unknown benchmark: {name}")
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies, total):
+    ordered = sorted(latencies)
+    ms = 1000
+    return {
+        "ops": len(ordered),
+        "seconds": total,
+        "ops_per_sec": len(ordered) / total if total else None,
+        "mean_ms": sum(ordered) / len(ordered) * ms,
+        "p50_ms": percentile(ordered, 0.50) * ms,
+        "p95_ms": percentile(ordered, 0.95) * ms,
+        "p99_ms": percentile(ordered, 0.99) * ms,
+        "max_ms": ordered[-1] * ms,
+    }
+
+
+def peak_memory():
+    # Peak resident set size of this process in bytes, None where unknown
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_size(size, ops, scan_ops, seed, only=None, data_dir=None):
+    rng = random.Random(seed)
+    db = Database(data_dir, result_cache_bytes=0)  # every run reaches the executor
+    start = time.perf_counter()
+    build(db, size, rng)
+    result = {"size": size, "build_seconds": time.perf_counter() - start, "benchmarks": {}}
+    clock = time.perf_counter
+    for name, _, scans in BENCHMARKS:
+        if only and name not in only:
+            continue
+        work = statements(name, size, rng, scan_ops if scans else ops)
+        latencies = []
+        begin = clock()
+        for item in work:
+            t = clock()
+            if item[0] == "insert":
+                db.insert_into("users", item[1])
+            else:
+                db.execute(item[0])
+            latencies.append(clock() - t)
+        result["benchmarks"][name] = summarize(latencies, clock() - begin)
+    db.close()
+    result["peak_memory_bytes"] = peak_memory()
+    return result
+
+
+def run(sizes, ops, scan_ops, seed, only=None, data_dir=None):
+    report = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "ops": ops,
+        "scan_ops": scan_ops,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sizes": [],
+    }
+    for size in sizes:
+        # A fresh interpreter per size keeps peak memory and heap state independent
+        command = [sys.executable, os.path.abspath(__file__), "--worker", "--sizes", str(size),
+                   "--ops", str(ops), "--scan-ops", str(scan_ops), "--seed", str(seed)]
+        if only:
+            command += ["--only", ",".join(only)]
+        if data_dir:
+            command += ["--data-dir", os.path.join(data_dir, str(size))]
+        print(f"size {size:,} ...", file=sys.stderr, flush=True)
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        report["sizes"].append(json.loads(output))
+    return report
+
+
+def print_report(report):
+    for entry in report["sizes"]:
+        memory = entry.get("peak_memory_bytes")
+        memory = f", peak memory {memory / 2 ** 20:.0f} MB" if memory else ""
+        print(f"\n{entry['size']:,} rows (built in {entry['build_seconds']:.1f} s{memory})")
+        print(f"  {'benchmark':<16}{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, r in entry["benchmarks"].items():
+            print(f"  {name:<16}{r['ops_per_sec']:>12,.0f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}")
+
+
+def compare(baseline, current, threshold):
+    # Regressions: throughput down or p95 latency up by more than threshold
+    # (a fraction) for a benchmark both reports ran at the same size
+    regressions = []
+    before = {entry["size"]: entry for entry in baseline["sizes"]}
+    for entry in current["sizes"]:
+        old = before.get(entry["size"])
+        if old is None:
+            continue
+        print(f"\n{entry['size']:,} rows vs. baseline")
+        for name, new in entry["benchmarks"].items():
+            base = old["benchmarks"].get(name)
+            if base is None:
+                continue
+            speed = new["ops_per_sec"] / base["ops_per_sec"] - 1
+            p95 = new["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+            flag = ""
+            if speed < -threshold or p95 > threshold:
+                flag = "  REGRESSION"
+                regressions.append((entry["size"], name, speed, p95))
+            elif speed > threshold:
+                flag = "  faster"
+            print(f"  {name:<16} throughput {speed:+7.1%}  p95 {p95:+7.1%}{flag}")
+        old_memory, new_memory = old.get("peak_memory_bytes"), entry.get("peak_memory_bytes")
+        if old_memory and new_memory:
+            change = new_memory / old_memory - 1
+            flag = "  REGRESSION" if change > threshold else ""
+            if flag:
+                regressions.append((entry["size"], "peak_memory", change, 0.0))
+            print(f"  {'peak memory':<16} {change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Mini-RDBMS engine")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated row counts (default 10k, 100k and 1M)")
+    parser.add_argument("--ops", type=int, default=1000, help="operations per benchmark")
+    parser.add_argument("--scan-ops", type=int, default=20, help="operations per full-scan benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", help="comma-separated benchmark names")
+    parser.add_argument("--data-dir", help="run with a write-ahead log in this directory (default in memory)")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a saved result file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before flagging (0.10 = 10%%)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("results", nargs="?", help="with --compare, a saved result file to compare instead of running")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    only = args.only.split(",") if args.only else None
+    if only:
+        unknown = set(only) - {name for name, _, _ in BENCHMARKS}
+        if unknown:
+            parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    if args.worker:
+        json.dump(run_size(sizes[0], args.ops, args.scan_ops, args.seed, only, args.data_dir), sys.stdout)
+        return 0
+
+    if args.compare and args.results:
+        with open(args.results) as f:
+            report = json.load(f)
+    else:
+        data_dir = None
+        if args.data_dir:
+            data_dir = tempfile.mkdtemp(dir=args.data_dir)
+        report = run(sizes, args.ops, args.scan_ops, args.seed, only, data_dir)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    print_report(report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+        print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
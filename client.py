@@ -0,0 +1,250 @@
+# client.py
+#
+# Client of server.py, shaped like the parts of Database the dashboard uses:
+#
+#   db = Client("127.0.0.1:5433")
+#   db.execute("SELECT * FROM users WHERE id = ?", (1,))
+#   stmt = db.prepare("INSERT INTO users (name, email) VALUES (?, ?)")
+#   stmt.execute(("ann", "ann@example.com"))
+#   db.execute_batch([(text, params), ...])   # one request, run as a unit
+#   db.pipeline([(text, params), ...])        # many requests, one round trip
+#
+# Connections are pooled and shared by threads, each used by one at a time.
+# Errors the server reports are raised as ServerError, a ValueError like the
+# engine's own.
+import socket
+import threading
+from contextlib import contextmanager
+
+import protocol
+
+
+def parse_address(address):
+    # "host:port", or ":port" / "port" for the local host
+    host, _, port = str(address).rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class Connection:
+    def __init__(self, host, port, timeout=30.0):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile("rb")
+        self.next_id = 0
+
+    def send(self, requests):
+        # Write every request before reading any answer; returns their ids
+        ids = []
+        frames = []
+        for request in requests:
+            self.next_id += 1
+            ids.append(self.next_id)
+            frames.append(protocol.encode({"id": self.next_id, **request}))
+        self.sock.sendall(b"".join(frames))
+        return ids
+
+    def read_exactly(self, size):
+        data = self.file.read(size)
+        if len(data) < size:
+            raise ConnectionError("The server closed the connection")
+        return data
+
+    def receive(self, request_id):
+        message = protocol.decode(self.read_exactly(protocol.frame_size(self.read_exactly(protocol.HEADER.size))))
+        if message.get("id") != request_id:
+            raise ConnectionError(f"Expected the answer to request {request_id}, got {message.get('id')}")
+        return message
+
+    def results(self, request_id):
+        # The frames answering one request: a streamed result yields several
+        while True:
+            message = self.receive(request_id)
+            yield message
+            if not message.get("more"):
+                return
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class ServerError(ValueError):
+    pass
+
+
+def check(message):
+    if "error" in message:
+        raise ServerError(message["error"])
+    return message
+
+
+def read_result(connection, request_id):
+    # The result of an execute request, gathered from all of its frames
+    rows = []
+    for message in connection.results(request_id):
+        check(message)
+        if "columns" not in message:
+            return message["result"]
+        rows += protocol.unpack_rows(message)
+    return rows
+
+
+class ConnectionPool:
+    # Up to size open connections; a thread asking for one when all are busy
+    # waits for one to come back
+    def __init__(self, host, port, size=8, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.opened = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while not self.idle and self.opened >= self.size:
+                self.cond.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.opened += 1
+        try:
+            return Connection(self.host, self.port, self.timeout)
+        except BaseException:
+            self.discard(None)
+            raise
+
+    def release(self, connection):
+        with self.cond:
+            self.idle.append(connection)
+            self.cond.notify()
+
+    def discard(self, connection):
+        # A connection left mid-answer (or broken) cannot be reused
+        if connection is not None:
+            connection.close()
+        with self.cond:
+            self.opened -= 1
+            self.cond.notify()
+
+    @contextmanager
+    def connection(self):
+        # A connection for one exchange. Only an error the server answered
+        # with leaves it usable; after any other the answers may be out of step.
+        connection = self.acquire()
+        try:
+            yield connection
+        except ServerError:
+            self.release(connection)
+            raise
+        except BaseException:
+            self.discard(connection)
+            raise
+        self.release(connection)
+
+    def close(self):
+        with self.cond:
+            idle, self.idle = self.idle, []
+            self.opened -= len(idle)
+        for connection in idle:
+            connection.close()
+
+
+class RemoteStatement:
+    # A statement the server has parsed (and keeps in its plan cache), run by its text
+    def __init__(self, client, text, kind, param_count):
+        self.client = client
+        self.text = text
+        self.kind = kind
+        self.param_count = param_count
+
+    def _check_params(self, params):
+        if len(params) != self.param_count:
+            raise ValueError(f"Expected {self.param_count} parameter(s), got {len(params)}")
+
+    def execute(self, params=()):
+        self._check_params(params)
+        return self.client.execute(self.text, params)
+
+    def stream(self, params=()):
+        self._check_params(params)
+        return self.client.stream(self.text, params)
+
+    def etag(self, params=()):
+        return self.client.request({"op": "etag", "sql": self.text, "params": list(params)})["result"]
+
+
+class Client:
+    def __init__(self, address="127.0.0.1:5433", pool_size=8, timeout=30.0):
+        host, port = parse_address(address)
+        self.pool = ConnectionPool(host, port, pool_size, timeout)
+
+    def request(self, request):
+        with self.pool.connection() as connection:
+            (request_id,) = connection.send([request])
+            return check(connection.receive(request_id))
+
+    def execute(self, text, params=()):
+        # Rows for SELECT and EXPLAIN, a row count for INSERT/UPDATE/DELETE and None for DDL
+        with self.pool.connection() as connection:
+            (request_id,) = connection.send([{"op": "execute", "sql": text, "params": list(params)}])
+            return read_result(connection, request_id)
+
+    def stream(self, text, params=()):
+        # Rows as their frames arrive, holding a connection until the last
+        connection = self.pool.acquire()
+        done = False
+        try:
+            (request_id,) = connection.send([{"op": "execute", "sql": text, "params": list(params)}])
+            for message in connection.results(request_id):
+                done = not message.get("more")
+                check(message)
+                if "columns" not in message:
+                    raise ValueError("Only statements returning rows can be streamed")
+                yield from protocol.unpack_rows(message)
+        finally:
+            if done:
+                self.pool.release(connection)
+            else:
+                self.pool.discard(connection)
+
+    def execute_batch(self, items):
+        # See Database.execute_batch
+        statements = [[text, list(params)] for text, params in items]
+        message = self.request({"op": "batch", "statements": statements})
+        return [protocol.unpack_result(result) for result in message["results"]]
+
+    def pipeline(self, items):
+        # Run (text, params) pairs as separate requests sent together, on one
+        # connection so they run in order; the first error is raised once every
+        # answer has been read
+        with self.pool.connection() as connection:
+            ids = connection.send([{"op": "execute", "sql": text, "params": list(params)} for text, params in items])
+            results = []
+            error = None
+            for request_id in ids:
+                try:
+                    results.append(read_result(connection, request_id))
+                except ServerError as e:
+                    error = error or e
+                    results.append(None)
+        if error is not None:
+            raise error
+        return results
+
+    def prepare(self, text):
+        message = self.request({"op": "prepare", "sql": text})
+        return RemoteStatement(self, text, message["kind"], message["params"])
+
+    def schema(self):
+        return self.request({"op": "schema"})["result"]
+
+    def metrics(self):
+        # The server's metrics in the Prometheus text format
+        return self.request({"op": "metrics"})["result"]
+
+    def ping(self):
+        return self.request({"op": "ping"})["result"]
+
+    def close(self):
+        self.pool.close()
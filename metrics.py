@@ -0,0 +1,170 @@
+# metrics.py
+import json
+import threading
+import time
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class QueryStats:
+    # What one statement cost. The engine fills one in per statement and hands
+    # it to every instrumentation hook when the statement finishes.
+    def __init__(self, kind, text=None, params=()):
+        self.kind = kind
+        self.text = text
+        self.params = tuple(params)
+        self.started = time.time()
+        self.parse_time = 0.0
+        self.plan_time = 0.0
+        self.execute_time = 0.0
+        self.rows_scanned = 0   # rows read from tables, columns, indexes and views
+        self.rows_returned = 0  # rows a SELECT produced, or rows a write changed
+        self.index_hits = 0     # index lookups and scans, one per probe
+        self.memory = None      # peak bytes allocated, when tracemalloc is tracing
+        self.cache_hit = False
+        self.error = None
+        # Engine bookkeeping while the statement runs
+        self.plans = []
+        self.clock = None
+        self.memory_base = None
+        self.outer = None
+
+    @property
+    def total_time(self):
+        return self.parse_time + self.plan_time + self.execute_time
+
+    def count_plan(self, node):
+        # Add up what the scan operators of an executed plan tree read
+        for part in node.walk():
+            if not part.scan:
+                continue
+            if part.op.startswith("Index"):
+                self.index_hits += part.loops
+            if part.examined is not None:
+                self.rows_scanned += part.examined * part.loops
+            else:
+                self.rows_scanned += part.actual_rows
+
+    def as_dict(self):
+        return {
+            "time": self.started, "kind": self.kind, "sql": self.text, "params": list(self.params),
+            "parse_ms": self.parse_time * 1000, "plan_ms": self.plan_time * 1000,
+            "execute_ms": self.execute_time * 1000, "total_ms": self.total_time * 1000,
+            "rows_scanned": self.rows_scanned, "rows_returned": self.rows_returned,
+            "index_hits": self.index_hits, "memory": self.memory, "cache_hit": self.cache_hit,
+            "error": self.error,
+        }
+
+    def summary(self):
+        text = (
+            f"Time: {self.total_time * 1000:.3f} ms (parse {self.parse_time * 1000:.3f}, "
+            f"plan {self.plan_time * 1000:.3f}, execute {self.execute_time * 1000:.3f}); "
+            f"rows scanned {self.rows_scanned}, returned {self.rows_returned}, index hits {self.index_hits}"
+        )
+        if self.cache_hit:
+            text += ", cached"
+        if self.memory is not None:
+            text += f", memory {self.memory / 1024:.1f} KB"
+        return text
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        # (upper bound label, observations at or below it), as Prometheus buckets are
+        total = 0
+        for bound, count in zip([*map(repr, self.bounds), "+Inf"], self.counts):
+            total += count
+            yield bound, total
+
+
+def labels(**values):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in values.items()) + "}"
+
+
+class Metrics:
+    # Instrumentation hook aggregating statements by kind: a latency histogram
+    # and running totals, rendered in the Prometheus text exposition format
+    COUNTERS = (
+        ("statements_total", "Statements run.", lambda s: 1),
+        ("statement_errors_total", "Statements that raised an error.", lambda s: s.error is not None),
+        ("result_cache_hits_total", "SELECTs answered from the result cache.", lambda s: s.cache_hit),
+        ("rows_scanned_total", "Rows read by scan and index operators.", lambda s: s.rows_scanned),
+        ("rows_returned_total", "Rows returned by SELECT or changed by writes.", lambda s: s.rows_returned),
+        ("index_hits_total", "Index lookups and scans.", lambda s: s.index_hits),
+    )
+    PHASES = ("parse", "plan", "execute")
+
+    def __init__(self, prefix="rdbms", buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.latency = {}
+        self.counters = {name: {} for name, _, _ in self.COUNTERS}
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        with self.lock:
+            kind = record.kind
+            if kind not in self.latency:
+                self.latency[kind] = Histogram(self.buckets)
+            self.latency[kind].observe(record.total_time)
+            for name, _, value in self.COUNTERS:
+                counter = self.counters[name]
+                counter[kind] = counter.get(kind, 0) + int(value(record))
+            for phase in self.PHASES:
+                key = (kind, phase)
+                self.phases[key] = self.phases.get(key, 0.0) + getattr(record, f"{phase}_time")
+
+    def render(self):
+        name = f"{self.prefix}_statement_duration_seconds"
+        lines = [
+            f"# HELP {name} Statement latency by statement type.",
+            f"# TYPE {name} histogram",
+        ]
+        with self.lock:
+            for kind, histogram in sorted(self.latency.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f"{name}_bucket{labels(kind=kind, le=bound)} {count}")
+                lines.append(f"{name}_sum{labels(kind=kind)} {histogram.sum!r}")
+                lines.append(f"{name}_count{labels(kind=kind)} {histogram.count}")
+            name = f"{self.prefix}_statement_phase_seconds_total"
+            lines += [f"# HELP {name} Time spent parsing, planning and executing.", f"# TYPE {name} counter"]
+            for (kind, phase), seconds in sorted(self.phases.items()):
+                lines.append(f"{name}{labels(kind=kind, phase=phase)} {seconds!r}")
+            for counter, help_text, _ in self.COUNTERS:
+                name = f"{self.prefix}_{counter}"
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for kind, value in sorted(self.counters[counter].items()):
+                    lines.append(f"{name}{labels(kind=kind)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class SlowQueryLog:
+    # Instrumentation hook appending every statement slower than threshold
+    # seconds to a file, one JSON object per line
+    def __init__(self, path, threshold=0.1):
+        self.path = path
+        self.threshold = threshold
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        if record.total_time < self.threshold:
+            return
+        line = json.dumps(record.as_dict(), default=repr) + "\n"
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
@@ -0,0 +1,256 @@
+# pager.py
+#
+# Fixed-size pages of memory-mapped data files and the LRU buffer pool that
+# caches them, for the "paged" table storage (storage.PagedStore).
+#
+# A store's rows are split into logical pages, each holding whole rows. A
+# logical page is written as one extent of consecutive PAGE_SIZE physical
+# pages (a single one unless updates have grown it), and the page table maps
+# logical pages to extents. Resident pages live decoded in the buffer pool;
+# a page changed there is only written back when it is evicted or flushed.
+#
+# Files in a data directory follow shadow paging: a physical page the last
+# checkpoint's snapshot refers to is never overwritten, a changed page being
+# written elsewhere instead, so after a crash the snapshot's page table still
+# reads the file as it was and the write-ahead log is replayed on top.
+import marshal
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+
+PAGE_SIZE = 8192
+# Share of a page new rows fill, leaving room for updates to grow rows in place
+FILL_FACTOR = 0.9
+HEADER = struct.Struct("<I")  # encoded length of the page's rows
+
+
+def encode_rows(rows):
+    return marshal.dumps(rows)
+
+
+def row_size(row):
+    # Bytes a row adds to its page's encoding, near enough for filling pages
+    return len(marshal.dumps(row))
+
+
+class Frame:
+    # A resident page: its rows (tuples), their estimated encoded size and
+    # whether they differ from the page's copy on disk
+    __slots__ = ("rows", "size", "dirty")
+
+    def __init__(self, rows, size, dirty=False):
+        self.rows = rows
+        self.size = size
+        self.dirty = dirty
+
+
+class PageFile:
+    # The data file of one store. Only the buffer pool calls these methods,
+    # holding its lock.
+    def __init__(self, path=None):
+        self.path = path
+        if path is None:
+            self.file = tempfile.TemporaryFile()
+        else:
+            # Whatever the file holds is garbage until load() names the pages a snapshot uses
+            self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        self.durable = path is not None
+        self.map = None
+        self.size = 0     # physical pages mapped
+        self.end = 0      # physical pages handed out, from the start of the file
+        self.free = []    # physical pages below end that nothing uses
+        self.extents = array("q")  # per logical page: first physical page, or -1 before its first write
+        self.lengths = array("q")  # per logical page: physical pages in its extent
+        # Physical pages the last checkpoint refers to, and those of them no
+        # longer in use, which become free once the next checkpoint is written
+        self.stable = set()
+        self.released = []
+
+    def allocate(self, count):
+        if count == 1 and self.free:
+            return self.free.pop()
+        start = self.end
+        self.end += count
+        if self.end > self.size:
+            self.grow(max(self.end, self.size * 2, 64))
+        return start
+
+    def grow(self, pages):
+        self.file.truncate(pages * PAGE_SIZE)
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.file.fileno(), pages * PAGE_SIZE)
+        self.size = pages
+
+    def release(self, logical):
+        start, count = self.extents[logical], self.lengths[logical]
+        for page in range(start, start + count) if start >= 0 else ():
+            if page in self.stable:
+                self.released.append(page)
+            else:
+                self.free.append(page)
+        self.extents[logical] = -1
+        self.lengths[logical] = 0
+
+    def add_page(self):
+        self.extents.append(-1)
+        self.lengths.append(0)
+        return len(self.extents) - 1
+
+    def drop_pages(self, first):
+        # Forget the logical pages from first on
+        for logical in range(first, len(self.extents)):
+            self.release(logical)
+        del self.extents[first:]
+        del self.lengths[first:]
+
+    def read(self, logical):
+        start = self.extents[logical]
+        if start < 0:
+            return []
+        offset = start * PAGE_SIZE
+        (length,) = HEADER.unpack_from(self.map, offset)
+        offset += HEADER.size
+        return marshal.loads(self.map[offset:offset + length])
+
+    def write(self, logical, rows):
+        data = encode_rows(rows)
+        count = -(-(HEADER.size + len(data)) // PAGE_SIZE)
+        start = self.extents[logical]
+        if start < 0 or count > self.lengths[logical] or start in self.stable:
+            self.release(logical)
+            start = self.allocate(count)
+            self.extents[logical] = start
+            self.lengths[logical] = count
+        offset = start * PAGE_SIZE
+        HEADER.pack_into(self.map, offset, len(data))
+        self.map[offset + HEADER.size:offset + HEADER.size + len(data)] = data
+
+    def sync(self):
+        if self.map is not None:
+            self.map.flush()
+        os.fsync(self.file.fileno())
+
+    def dump(self):
+        return self.extents.tobytes(), self.lengths.tobytes()
+
+    def load(self, state):
+        extents, lengths = state
+        self.extents = array("q")
+        self.extents.frombytes(extents)
+        self.lengths = array("q")
+        self.lengths.frombytes(lengths)
+        used = set()
+        for start, count in zip(self.extents, self.lengths):
+            used.update(range(start, start + count))
+        self.end = max(used) + 1 if used else 0
+        self.free = [page for page in range(self.end) if page not in used]
+        self.stable = used if self.durable else set()
+        self.released = []
+        pages = os.fstat(self.file.fileno()).st_size // PAGE_SIZE
+        if pages < self.end:
+            raise ValueError(f"Data file {self.path} is shorter than its snapshot")
+        if pages:
+            self.map = mmap.mmap(self.file.fileno(), pages * PAGE_SIZE)
+            self.size = pages
+
+    def checkpointed(self):
+        # The snapshot naming the current pages is on disk: they become the
+        # stable ones, and the pages only the previous snapshot used are free
+        if not self.durable:
+            return
+        self.stable = set()
+        for start, count in zip(self.extents, self.lengths):
+            self.stable.update(range(start, start + count))
+        self.free += self.released
+        self.released = []
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+class BufferPool:
+    # At most capacity resident pages over all the files opened through it,
+    # least recently used evicted first, written back if changed. Files are
+    # kept in directory, or are anonymous temporary files without one.
+    def __init__(self, capacity=4096, directory=None):
+        self.capacity = max(1, capacity)
+        self.directory = directory
+        self.frames = OrderedDict()  # (file, logical page) -> Frame
+        self.files = []
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def open(self, name):
+        path = None if self.directory is None else os.path.join(self.directory, f"{name}.pages")
+        pages = PageFile(path)
+        self.files.append(pages)
+        return pages
+
+    def fetch(self, pages, logical, keep=True):
+        # The frame of a page, read in if it is not resident. A page read
+        # with keep=False (by a sequential scan) is not cached, so one pass
+        # over a large table does not push every other page out of the pool.
+        # Callers hold the lock.
+        frame = self.frames.get((pages, logical))
+        if frame is not None:
+            self.hits += 1
+            self.frames.move_to_end((pages, logical))
+            return frame
+        self.misses += 1
+        rows = pages.read(logical)
+        frame = Frame(rows, sum(map(row_size, rows)))
+        if keep:
+            self.put(pages, logical, frame)
+        return frame
+
+    def put(self, pages, logical, frame):
+        self.frames[(pages, logical)] = frame
+        self.frames.move_to_end((pages, logical))
+        while len(self.frames) > self.capacity:
+            (owner, page), evicted = self.frames.popitem(last=False)
+            if evicted.dirty:
+                owner.write(page, evicted.rows)
+                self.writes += 1
+
+    def discard(self, pages, first):
+        # Drop the resident logical pages of a file from first on, unwritten
+        for key in [key for key in self.frames if key[0] is pages and key[1] >= first]:
+            del self.frames[key]
+
+    def flush(self, pages):
+        # Write back every changed resident page of a file
+        for (owner, logical), frame in self.frames.items():
+            if owner is pages and frame.dirty:
+                owner.write(logical, frame.rows)
+                frame.dirty = False
+                self.writes += 1
+        pages.sync()
+
+    def checkpointed(self):
+        with self.lock:
+            for pages in self.files:
+                pages.checkpointed()
+
+    def stats(self):
+        return {
+            "capacity": self.capacity, "resident": len(self.frames),
+            "dirty": sum(frame.dirty for frame in self.frames.values()),
+            "hits": self.hits, "misses": self.misses, "writes": self.writes,
+        }
+
+    def close(self):
+        with self.lock:
+            self.frames.clear()
+            for pages in self.files:
+                pages.close()
+            self.files = []
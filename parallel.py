@@ -0,0 +1,408 @@
+# parallel.py
+#
+# Opt-in parallel execution (Database(parallel_workers=n)). A large columnar
+# table is copied once per version into shared memory; worker processes
+# attach to it, each takes a range of row ids, and runs a filter, a partial
+# hash aggregation or the probe side of a hash join over it. The parent
+# merges the parts in row id order, and the planner only splits the table a
+# serial join would be driven by, so results come in the serial executor's order.
+import multiprocessing
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from multiprocessing import resource_tracker, shared_memory
+
+import aggregate
+import predicate
+from storage import COMPARISONS, ColumnStore, IntColumn, TextColumn
+
+# Shared tables a worker keeps attached, most recently used last
+ATTACHED_TABLES = 8
+
+
+def create_segment(data):
+    # A new shared memory segment holding a copy of a buffer, as (segment, (name, bytes))
+    raw = memoryview(data).cast("B")
+    segment = shared_memory.SharedMemory(create=True, size=max(1, len(raw)))
+    segment.buf[:len(raw)] = raw
+    return segment, (segment.name, len(raw))
+
+
+def open_segment(name):
+    # Attaching must not register the segment with the resource tracker, which
+    # Python before 3.13 does, or the segment would be unlinked when the worker exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedTable:
+    # Parent side: the column buffers of one version of a table in shared
+    # memory. INT columns share their values and NULL bitmap, TEXT columns
+    # their codes and dictionary (as UTF-8 text plus offsets); deleted rows
+    # are a bitmap. spec is the picklable description workers attach with.
+    def __init__(self, table):
+        self.table = table
+        self.version = table.version
+        self.segments = []
+        columns = {}
+        for name, column in table.store.columns.items():
+            if isinstance(column, IntColumn):
+                nulls = self.share(column.nulls) if column.null_count else None
+                columns[name] = ("INT", self.share(column.data), nulls)
+            else:
+                encoded = [text.encode() for text in column.dictionary]
+                offsets = array("q", [0])
+                for text in encoded:
+                    offsets.append(offsets[-1] + len(text))
+                dictionary = (self.share(b"".join(encoded)), self.share(offsets), len(encoded))
+                columns[name] = ("TEXT", self.share(column.data), dictionary)
+        deleted = None
+        if table.deleted:
+            bitmap = bytearray((len(table.store) + 7) >> 3)
+            for rid in table.deleted:
+                bitmap[rid >> 3] |= 1 << (rid & 7)
+            deleted = self.share(bitmap)
+        self.spec = (self.segments[0].name if self.segments else None, len(table.store), columns, deleted)
+
+    def share(self, data):
+        segment, ref = create_segment(data)
+        self.segments.append(segment)
+        return ref
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments = []
+
+
+class SharedView:
+    # Worker side: read-only access to a SharedTable by row id, with the same
+    # getter() interface as the stores so compiled predicates run unchanged.
+    # Columns are mapped when first used.
+    def __init__(self, spec):
+        _, self.count, self.columns, deleted = spec
+        self.segments = []
+        self.buffers = []
+        self.cache = {}
+        self.deleted = None if deleted is None else self.buffer(deleted)
+
+    def buffer(self, ref, fmt="B"):
+        name, size = ref
+        segment = open_segment(name)
+        self.segments.append(segment)
+        view = segment.buf[:size]
+        typed = view.cast(fmt)
+        self.buffers += [typed, view]
+        return typed
+
+    def column(self, name):
+        found = self.cache.get(name)
+        if found is None:
+            kind, data, extra = self.columns[name]
+            if kind == "INT":
+                found = (kind, self.buffer(data, "q"), None if extra is None else self.buffer(extra))
+            else:
+                blob, offsets, size = extra
+                blob = self.buffer(blob)
+                offsets = self.buffer(offsets, "q")
+                # The code -1 (NULL) picks the None at the end
+                values = [str(blob[offsets[i]:offsets[i + 1]], "utf-8") for i in range(size)] + [None]
+                found = (kind, self.buffer(data, "i"), values)
+            self.cache[name] = found
+        return found
+
+    def getter(self, name):
+        kind, data, extra = self.column(name)
+        if kind == "TEXT":
+            return lambda rid: extra[data[rid]]
+        if extra is None:
+            return data.__getitem__
+        return lambda rid: None if extra[rid >> 3] & (1 << (rid & 7)) else data[rid]
+
+    def rids(self, start, stop):
+        deleted = self.deleted
+        if deleted is None:
+            return range(start, stop)
+        return (rid for rid in range(start, stop) if not deleted[rid >> 3] & (1 << (rid & 7)))
+
+    def find(self, cond, start, stop):
+        # Row ids in [start, stop) meeting one comparison, read straight from
+        # the column buffer like the serial column scan
+        col, op, value = cond
+        if value is None:
+            return []
+        kind, data, extra = self.column(col)
+        compare = COMPARISONS[op]
+        if kind == "TEXT":
+            hits = set()
+            for code, text in enumerate(extra[:-1]):
+                try:
+                    if compare(text, value):
+                        hits.add(code)
+                except TypeError:
+                    pass
+            rids = [rid for rid, code in zip(range(start, stop), data[start:stop]) if code in hits]
+        else:
+            try:
+                rids = [rid for rid, v in zip(range(start, stop), data[start:stop]) if compare(v, value)]
+            except TypeError:
+                return []
+            if extra is not None:
+                rids = [rid for rid in rids if not extra[rid >> 3] & (1 << (rid & 7))]
+        deleted = self.deleted
+        if deleted is not None:
+            rids = [rid for rid in rids if not deleted[rid >> 3] & (1 << (rid & 7))]
+        return rids
+
+    def matching(self, conditions, start, stop):
+        # Live row ids in [start, stop) meeting every condition; a leading
+        # simple comparison is answered from its column buffer
+        if conditions and predicate.is_simple(conditions[0]):
+            rids, conditions = self.find(conditions[0], start, stop), conditions[1:]
+        else:
+            rids = self.rids(start, stop)
+        if conditions:
+            rids = filter(predicate.compile_filter(conditions, self.getter), rids)
+        return rids
+
+    def close(self):
+        self.cache = {}
+        self.deleted = None
+        try:
+            for buffer in self.buffers:
+                buffer.release()
+            for segment in self.segments:
+                segment.close()
+        except BufferError:
+            # Something still reads the buffers; the mapping goes with the process
+            pass
+        self.buffers = []
+        self.segments = []
+
+
+# Worker process state: views of the shared tables recently used, by spec key
+views = OrderedDict()
+
+
+def attach(spec):
+    view = views.get(spec[0])
+    if view is None:
+        view = views[spec[0]] = SharedView(spec)
+        while len(views) > ATTACHED_TABLES:
+            views.popitem(last=False)[1].close()
+    views.move_to_end(spec[0])
+    return view
+
+
+# Tasks, run in the worker processes
+
+def filter_part(spec, conditions, start, stop):
+    return array("q", attach(spec).matching(conditions, start, stop))
+
+
+def aggregate_part(spec, conditions, start, stop, group_keys, aggregates):
+    view = attach(spec)
+    getters = {}
+    for key in [*group_keys, *(column for _, _, column in aggregates)]:
+        if key is not None and key not in getters:
+            getters[key] = view.getter(key)
+    key_getters = [getters[key] for key in group_keys]
+    groups = {}
+    for rid in view.matching(conditions, start, stop):
+        key = tuple(get(rid) for get in key_getters)
+        states = groups.get(key)
+        if states is None:
+            states = groups[key] = aggregate.new_states(aggregates)
+        aggregate.update(states, aggregates, lambda column: getters[column](rid))
+    return groups
+
+
+def build_table(view, column, conditions):
+    # Hash table of the rows of a whole table meeting conditions, by join key
+    key_of = view.getter(column)
+    build = {}
+    for rid in view.matching(conditions, 0, view.count):
+        key = key_of(rid)
+        if key is not None:
+            build.setdefault(key, []).append(rid)
+    return build
+
+
+def join_part(outer_spec, outer_col, outer_conditions, start, stop,
+              inner_spec, inner_col, inner_conditions, left, aggregation=None):
+    # Hash join of the outer rows in [start, stop) against every inner row,
+    # each worker building its own copy of the (smaller) inner hash table.
+    # Returns (outer row ids, inner row ids, -1 for a LEFT JOIN's unmatched
+    # rows) or, with aggregation = (group keys, aggregates, key owners), the
+    # partial groups of the joined rows.
+    outer = attach(outer_spec)
+    inner = attach(inner_spec)
+    build = build_table(inner, inner_col, inner_conditions)
+    key_of = outer.getter(outer_col)
+    pairs = ((rid, build.get(key_of(rid), ())) for rid in outer.matching(outer_conditions, start, stop))
+    if aggregation is None:
+        outer_rids, inner_rids = array("q"), array("q")
+        for o_rid, matches in pairs:
+            if matches:
+                outer_rids.extend([o_rid] * len(matches))
+                inner_rids.extend(matches)
+            elif left:
+                outer_rids.append(o_rid)
+                inner_rids.append(-1)
+        return outer_rids, inner_rids
+
+    group_keys, aggregates, owners = aggregation
+    getters = {}
+    for key, (side, column) in owners.items():
+        getters[key] = (side, (outer if side == "outer" else inner).getter(column))
+    groups = {}
+    for o_rid, matches in pairs:
+        if not matches:
+            if not left:
+                continue
+            matches = (None,)
+
+        for i_rid in matches:
+            def get(key):
+                side, read = getters[key]
+                rid = o_rid if side == "outer" else i_rid
+                return None if rid is None else read(rid)
+            key = tuple(get(k) for k in group_keys)
+            states = groups.get(key)
+            if states is None:
+                states = groups[key] = aggregate.new_states(aggregates)
+            aggregate.update(states, aggregates, get)
+    return groups
+
+
+def warm_up(_):
+    return os.getpid()
+
+
+def join_pairs(outer_rids, inner_rids):
+    # (outer row id, inner row ids) pairs from a join part's two arrays
+    for o_rid, group in groupby(zip(outer_rids, inner_rids), key=lambda pair: pair[0]):
+        yield o_rid, [i_rid for _, i_rid in group if i_rid >= 0]
+
+
+def start_context():
+    # fork keeps the parent's modules, but a child forked while other threads
+    # run (a web or TCP server's) can inherit a lock one of them held and hang.
+    # Then workers come from the forkserver, or are spawned, which re-imports
+    # the main module in each of them.
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.active_count() == 1:
+        return multiprocessing.get_context("fork")
+    if "forkserver" in methods:
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["parallel"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class ParallelExecutor:
+    # Parent side: the worker pool and the shared copies of the tables it has
+    # been given. Work is split into one row id range per worker.
+    def __init__(self, workers, min_rows=100_000):
+        self.workers = workers
+        self.min_rows = min_rows
+        self.pool = None
+        self.shared = {}
+        self.lock = threading.Lock()
+
+    def shareable(self, table):
+        # Only typed column buffers can be put in shared memory
+        store = table.store
+        return isinstance(store, ColumnStore) and all(
+            isinstance(column, (IntColumn, TextColumn)) for column in store.columns.values()
+        )
+
+    def accepts(self, table):
+        # A table worth splitting between the workers: small ones are not worth the dispatch
+        return len(table) >= self.min_rows and self.shareable(table)
+
+    def _pool(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=start_context())
+                # Start every worker now rather than when a query first needs it
+                list(self.pool.map(warm_up, range(self.workers)))
+            return self.pool
+
+    def start(self):
+        self._pool()
+
+    def export(self, table):
+        # The shared copy of table's current version, made on first use
+        with self.lock:
+            shared = self.shared.get(table.name)
+            if shared is None or shared.table is not table or shared.version != table.version:
+                if shared is not None:
+                    shared.close()
+                shared = self.shared[table.name] = SharedTable(table)
+            return shared.spec
+
+    def ranges(self, count):
+        step = -(-count // self.workers) or 1
+        return [(start, min(count, start + step)) for start in range(0, count, step)]
+
+    def filter(self, table, conditions):
+        # Row ids of table meeting conditions, in storage order
+        spec = self.export(table)
+        pool = self._pool()
+        parts = [pool.submit(filter_part, spec, conditions, start, stop) for start, stop in self.ranges(spec[1])]
+        for part in parts:
+            yield from part.result()
+
+    def aggregate(self, table, conditions, group_keys, aggregates):
+        spec = self.export(table)
+        pool = self._pool()
+        parts = [
+            pool.submit(aggregate_part, spec, conditions, start, stop, group_keys, aggregates)
+            for start, stop in self.ranges(spec[1])
+        ]
+        groups = {}
+        for part in parts:
+            aggregate.merge(groups, part.result(), aggregates)
+        yield from aggregate.result_rows(groups, group_keys, aggregates)
+
+    def join(self, outer, outer_col, outer_conditions, inner, inner_col, inner_conditions, left, aggregation=None):
+        # Hash join parts over ranges of the outer table: (outer row id, inner
+        # row ids) pairs in outer order, or with aggregation the merged groups
+        outer_spec = self.export(outer)
+        inner_spec = self.export(inner)
+        pool = self._pool()
+        parts = [
+            pool.submit(join_part, outer_spec, outer_col, outer_conditions, start, stop,
+                        inner_spec, inner_col, inner_conditions, left, aggregation)
+            for start, stop in self.ranges(outer_spec[1])
+        ]
+        if aggregation is None:
+            for part in parts:
+                yield from join_pairs(*part.result())
+            return
+        group_keys, aggregates, _ = aggregation
+        groups = {}
+        for part in parts:
+            aggregate.merge(groups, part.result(), aggregates)
+        yield from aggregate.result_rows(groups, group_keys, aggregates)
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(cancel_futures=True)
+                self.pool = None
+            for shared in self.shared.values():
+                shared.close()
+            self.shared = {}
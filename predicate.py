@@ -0,0 +1,235 @@
+# predicate.py
+import re
+from operator import itemgetter
+
+from storage import COMPARISONS
+
+# A predicate is a (column, op, value) triple. Comparisons, IN, IS NULL and
+# LIKE name a column; AND, OR and NOT have no column and hold their operands
+# in value (a list of predicates, or one predicate for NOT).
+RANGE_OPERATORS = {"=", "<", "<=", ">", ">="}
+COLUMN_OPERATORS = set(COMPARISONS) | {"IN", "NOT IN", "IS NULL", "IS NOT NULL", "LIKE", "NOT LIKE"}
+LOGICAL_OPERATORS = {"AND", "OR", "NOT"}
+MAX_CHAR = "\U0010ffff"
+
+
+def is_simple(cond):
+    # A plain column comparison, the kind indexes and column scans can answer
+    return cond[0] is not None and cond[1] in COMPARISONS
+
+
+def columns_of(cond):
+    col, op, value = cond
+    if op == "NOT":
+        return columns_of(value)
+    if op in ("AND", "OR"):
+        return set().union(*map(columns_of, value))
+    return {col}
+
+
+def rename(cond, name):
+    # The same predicate with every column passed through name()
+    col, op, value = cond
+    if op == "NOT":
+        return None, op, rename(value, name)
+    if op in ("AND", "OR"):
+        return None, op, [rename(part, name) for part in value]
+    return name(col), op, value
+
+
+def coerce(col, col_type, value):
+    # Convert a constant once to the type of the column it is compared with
+    if value is None:
+        return None
+    if col_type == "INT":
+        if isinstance(value, bool):
+            return int(value)
+        if isinstance(value, (int, float)):
+            return value
+        if isinstance(value, str):
+            try:
+                return int(value.strip())
+            except ValueError:
+                try:
+                    return float(value)
+                except ValueError:
+                    pass
+        raise ValueError(f"Cannot compare INT column {col} with {value!r}")
+    if col_type == "TEXT" and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+def check(cond, type_of):
+    # Validate a predicate against the column types (type_of returns None for
+    # an unknown column) and return it with its constants coerced
+    col, op, value = cond
+    if op == "NOT":
+        return None, op, check(value, type_of)
+    if op in ("AND", "OR"):
+        return None, op, [check(part, type_of) for part in value]
+    if op not in COLUMN_OPERATORS:
+        raise ValueError(f"Unsupported operator: {op}")
+    col_type = type_of(col)
+    if col_type is None:
+        raise ValueError(f"Unknown column: {col}")
+    if op in ("IS NULL", "IS NOT NULL"):
+        return col, op, None
+    if op in ("LIKE", "NOT LIKE"):
+        if col_type != "TEXT":
+            raise ValueError(f"LIKE needs a TEXT column: {col}")
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"LIKE needs a text pattern, got {value!r}")
+        return col, op, value
+    if op in ("IN", "NOT IN"):
+        return col, op, [coerce(col, col_type, v) for v in value]
+    return col, op, coerce(col, col_type, value)
+
+
+def like_regex(pattern):
+    # % matches any run of characters and _ any one character
+    parts = []
+    for ch in pattern:
+        parts.append(".*" if ch == "%" else "." if ch == "_" else re.escape(ch))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+def like_prefix(pattern):
+    # The literal prefix of a LIKE pattern before its first wildcard
+    match = re.match(r"[^%_]*", pattern)
+    return match.group()
+
+
+def prefix_range(col, prefix):
+    # col >= prefix AND col < (prefix with its last character bumped): exactly the strings starting with prefix
+    bounds = [(col, ">=", prefix)]
+    if prefix and prefix[-1] != MAX_CHAR:
+        bounds.append((col, "<", prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+    return bounds
+
+
+def expand(conditions):
+    # Add the range a LIKE 'prefix%' implies, so an ordered index can serve it;
+    # a pattern that is nothing but a prefix and a trailing % is replaced outright
+    result = []
+    for cond in conditions:
+        col, op, value = cond
+        if op == "LIKE" and value:
+            prefix = like_prefix(value)
+            if prefix:
+                result += prefix_range(col, prefix)
+                if value == prefix + "%":
+                    continue
+        result.append(cond)
+    return result
+
+
+def compile_test(cond, getter):
+    # Three-valued test: True, False, or None when a NULL makes the outcome unknown
+    col, op, value = cond
+    if op == "NOT":
+        inner = compile_test(value, getter)
+
+        def test(x):
+            result = inner(x)
+            return None if result is None else not result
+        return test
+    if op in ("AND", "OR"):
+        parts = [compile_test(part, getter) for part in value]
+        decisive = op == "OR"  # the operand value that settles the whole expression
+
+        def test(x):
+            result = not decisive
+            for part in parts:
+                outcome = part(x)
+                if outcome is decisive:
+                    return decisive
+                if outcome is None:
+                    result = None
+            return result
+        return test
+
+    get = getter(col)
+    if op == "IS NULL":
+        return lambda x: get(x) is None
+    if op == "IS NOT NULL":
+        return lambda x: get(x) is not None
+    if op in ("IN", "NOT IN"):
+        values = frozenset(v for v in value if v is not None)
+        has_null = None in value
+        negate = op == "NOT IN"
+
+        def test(x):
+            v = get(x)
+            if v is None:
+                return None
+            if v in values:
+                return not negate
+            return None if has_null else negate
+        return test
+    if value is None:
+        # Comparing with NULL is never true or false
+        return lambda x: None
+    if op in ("LIKE", "NOT LIKE"):
+        match = like_regex(value).fullmatch
+        negate = op == "NOT LIKE"
+
+        def test(x):
+            v = get(x)
+            return None if v is None else (match(v) is None) == negate
+        return test
+
+    compare = COMPARISONS[op]
+
+    def test(x):
+        v = get(x)
+        if v is None:
+            return None
+        try:
+            return compare(v, value)
+        except TypeError:
+            # Only reachable for columns of an untyped declared type
+            return False
+    return test
+
+
+def compile_filter(conditions, getter):
+    # One function accepting x when every condition is true. getter(column)
+    # returns a function reading that column from x (a row id or a row dict).
+    tests = [compile_test(cond, getter) for cond in conditions]
+    if not tests:
+        return lambda x: True
+    if len(tests) == 1:
+        test = tests[0]
+        return lambda x: test(x) is True
+    return lambda x: all(test(x) is True for test in tests)
+
+
+def literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def describe(cond):
+    # SQL text of a predicate, for EXPLAIN
+    col, op, value = cond
+    if op == "NOT":
+        return f"NOT {describe(value)}"
+    if op in ("AND", "OR"):
+        return "(" + f" {op} ".join(map(describe, value)) + ")"
+    if op in ("IS NULL", "IS NOT NULL"):
+        return f"{col} {op}"
+    if op in ("IN", "NOT IN"):
+        return f"{col} {op} (" + ", ".join(map(literal, value)) + ")"
+    return f"{col} {op} {literal(value)}"
+
+
+def describe_all(conditions):
+    return " AND ".join(map(describe, conditions))
+
+
+def row_filter(conditions):
+    return compile_filter(conditions, itemgetter)
@@ -0,0 +1,63 @@
+# protocol.py
+#
+# Wire format shared by server.py and client.py. Every message is a frame: a
+# 4-byte big-endian length, then that many bytes of UTF-8 JSON holding one
+# object. A request carries an "id" and an "op"; the server answers the
+# requests of a connection in the order they arrived, each response echoing
+# its id, so a client may send many requests before reading any answer.
+#
+#   {"op": "execute", "sql": ..., "params": [...]}  rows, a row count or null
+#   {"op": "batch", "statements": [[sql, params], ...]}  one result per statement,
+#       run as a unit by Database.execute_batch
+#   {"op": "prepare", "sql": ...}                    the statement's kind and parameter count
+#   {"op": "etag", "sql": ..., "params": [...]}      a SELECT's ETag
+#   {"op": "schema"}, {"op": "metrics"}, {"op": "ping"}
+#
+# A result holding rows is sent as {"columns": [...], "rows": [[...], ...]};
+# a large one spans several frames, all but the last marked "more". Anything
+# else is {"result": value}, and a failed request {"error": message}.
+import json
+import struct
+
+HEADER = struct.Struct(">I")
+MAX_FRAME = 64 * 1024 * 1024
+# Rows per frame of a streamed result
+CHUNK_ROWS = 1000
+
+
+def encode(message):
+    data = json.dumps(message, separators=(",", ":")).encode()
+    if len(data) > MAX_FRAME:
+        raise ValueError(f"Message of {len(data)} bytes exceeds the {MAX_FRAME} byte frame limit")
+    return HEADER.pack(len(data)) + data
+
+
+def decode(data):
+    return json.loads(data)
+
+
+def frame_size(header):
+    (size,) = HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"Frame of {size} bytes exceeds the {MAX_FRAME} byte limit")
+    return size
+
+
+def pack_result(result):
+    # A statement's result as the fields of a response; rows become one list
+    # of values each, under the column names of the first
+    if isinstance(result, list):
+        columns = list(result[0]) if result else []
+        return {"columns": columns, "rows": [list(row.values()) for row in result]}
+    return {"result": result}
+
+
+def unpack_rows(message):
+    columns = message["columns"]
+    return [dict(zip(columns, values)) for values in message["rows"]]
+
+
+def unpack_result(message):
+    if "columns" in message:
+        return unpack_rows(message)
+    return message["result"]
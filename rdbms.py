@@ -1,58 +1,3005 @@
 # rdbms.py
+import atexit
+import csv
+import hashlib
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from itertools import chain, islice
+from math import log2
+
+import aggregate
+import metrics
+import pager
+import parallel
+import predicate
+import sql
+import stats
+import wal
+from storage import STORAGE_TYPES, PagedStore
+
+# Streamed results of at most this many rows are also stored in the result cache
+STREAM_CACHE_ROWS = 10_000
+
+# Statements that change the catalog, taking its lock before any table lock
+CATALOG_KINDS = {"create_table", "create_view", "checkpoint"}
+
+# Planner costs: interpreter time per row for each kind of step, in units of
+# evaluating one compiled predicate on a row (measured at roughly 450 ns)
+SEQ_ROW = 0.1      # pull a row id from a full scan
+COLUMN_ROW = 0.2   # compare one value inside a column buffer scan
+INDEX_ROW = 0.5    # read one row id from an index
+PROBE = 2.0        # one index or hash-table lookup
+FILTER_ROW = 1.0   # evaluate one compiled predicate
+SORT_ROW = 0.05    # per row and per comparison level of a sort
+BUILD_ROW = 2.0    # add a row to a hash-join table
+OUTPUT_ROW = 3.0   # materialize a row dict
+PARALLEL_SETUP = 4000.0  # hand a query to the worker pool and collect its parts
+GATHER_ROW = 0.1   # pass one row id or group back from a worker
+
+
+def matches(row, conditions):
+    # SQL semantics: a comparison against NULL is never true
+    return predicate.row_filter(conditions)(row)
+
+
+def sort_key(column):
+    # NULLs sort after every value ascending and before them descending
+    return lambda row: (row[column] is None, row[column])
+
+
+def sort_cost(rows, limit=None):
+    rows = max(rows, 1)
+    return rows * SORT_ROW * max(1.0, log2(min(rows, limit or rows) + 1))
+
+
+class PlanNode:
+    # One operator of a query plan. EXPLAIN prints the tree with the planner's
+    # row and cost estimates (cost includes the operator's inputs). Under
+    # EXPLAIN ANALYZE each operator also counts the rows it produced and the
+    # time spent pulling them, its inputs' time included. Scan operators (the
+    # ones reading tables, indexes and views) can also just count rows, which
+    # is how statement instrumentation finds the rows a query scanned.
+    def __init__(self, op, detail=None, rows=None, cost=None, children=(), scan=False, examined=None):
+        self.op = op
+        self.detail = detail
+        self.rows = rows
+        self.cost = cost
+        self.children = list(children)
+        self.scan = scan
+        self.examined = examined  # rows a scan reads per loop, when not the rows it produces
+        self.analyze = False
+        self.counting = False
+        self.loops = 0
+        self.actual_rows = 0
+        self.elapsed = 0.0
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def measure(self, rows):
+        if self.analyze:
+            return self._measured(rows)
+        if self.counting:
+            return self._counted(rows)
+        return rows
+
+    def _counted(self, rows):
+        self.loops += 1
+        for row in rows:
+            self.actual_rows += 1
+            yield row
+
+    def _measured(self, rows):
+        self.loops += 1
+        rows = iter(rows)
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                row = next(rows)
+            except StopIteration:
+                self.elapsed += clock() - start
+                return
+            self.elapsed += clock() - start
+            self.actual_rows += 1
+            yield row
+
+    def count_probes(self, pairs):
+        # For an index probed inside a join: each probe is a loop, each match a row
+        if not (self.analyze or self.counting):
+            return pairs
+        return self._counted_probes(pairs)
+
+    def _counted_probes(self, pairs):
+        for rid, matches in pairs:
+            self.loops += 1
+            self.actual_rows += len(matches)
+            yield rid, matches
+
+    def lines(self, depth=0):
+        text = self.op if self.detail is None else f"{self.op}: {self.detail}"
+        if self.cost is not None:
+            text += f"  (cost={self.cost:.1f} rows={round(self.rows)})"
+        if self.analyze:
+            if not self.loops:
+                text += " (never executed)"
+            elif self.elapsed:
+                text += f" (actual rows={self.actual_rows} loops={self.loops} time={self.elapsed * 1000:.3f} ms)"
+            else:
+                # Timed as part of its parent
+                text += f" (actual rows={self.actual_rows} loops={self.loops})"
+        result = [("  " * depth + "-> " if depth else "") + text]
+        for child in self.children:
+            result += child.lines(depth + 1)
+        return result
+
+
+class QueryPlan:
+    # A planned query: the operator tree EXPLAIN shows, and build(), which
+    # assembles the lazy pipeline of those operators when the query runs
+    def __init__(self, node, build):
+        self.node = node
+        self.build = build
+
+    def __call__(self):
+        return self.build()
+
+    @classmethod
+    def source(cls, op, produce, detail=None, rows=None, cost=None, scan=False):
+        node = PlanNode(op, detail, rows, cost, scan=scan)
+        return cls(node, lambda: node.measure(produce()))
+
+    def then(self, op, step, detail=None, rows=None, cost=None):
+        # This plan followed by one more operator; step(input rows) returns its output rows
+        node = PlanNode(op, detail, rows, cost, [self.node])
+        build = self.build
+        return QueryPlan(node, lambda: node.measure(step(build())))
+
+
+def aggregate_detail(group_keys, aggregates, conditions=()):
+    detail = ", ".join(name for name, _, _ in aggregates)
+    if group_keys:
+        detail = f"{detail} group by {', '.join(group_keys)}"
+    if conditions:
+        detail = f"{detail} where {predicate.describe_all(conditions)}"
+    return detail
+
+
+def finish_rows(plan, order_key=None, descending=False, limit=None, keys=None):
+    # Sort, limit and project the rows of a plan, each as its own operator
+    rows, cost = plan.node.rows, plan.node.cost
+    if order_key is not None:
+        cost += sort_cost(rows, limit)
+        plan = plan.then(
+            f"Sort by {order_key}{' DESC' if descending else ''}",
+            lambda rows: sort_rows(rows, order_key, descending, limit),
+            None if limit is None else f"top {limit}", rows, cost,
+        )
+    if limit is not None:
+        rows = min(rows, limit)
+        plan = plan.then(f"Limit {limit}", lambda rows: limit_rows(rows, limit), rows=rows, cost=cost)
+    if keys is not None:
+        plan = plan.then("Project", lambda rows: project_rows(rows, keys), ", ".join(keys), rows, cost)
+    return plan
+
+
+# Query operators, Volcano style: each is a generator that pulls from its
+# input only when asked for a row, so a pipeline holds one row at a time and
+# LIMIT stops every operator below it once it has enough.
+
+def scan_table(table):
+    # Row ids of every live row, in storage order
+    return iter(table.rids())
+
+
+def scan_index(index, bounds, reverse=False):
+    return index.range(*bounds, reverse=reverse)
+
+
+def column_scan(table, cond):
+    # Evaluate one comparison over its column buffer, when first pulled
+    rids = table.store.scan(*cond)
+    deleted = table.deleted
+    if deleted:
+        rids = [rid for rid in rids if rid not in deleted]
+    yield from rids
+
+
+def index_lookup(index, cond):
+    # Row ids for "=" or IN through a hash index; NULL equals nothing, so it is never probed
+    _, op, value = cond
+    if op == "=":
+        yield from (index.lookup(value) if value is not None else ())
+        return
+    rids = set()
+    for item in set(value):
+        if item is not None:
+            rids.update(index.lookup(item))
+    yield from sorted(rids)
+
+
+def index_scan(index, bounds, descending=False, nulls=False):
+    # Row ids of an ordered index range in key order; with nulls the NULL
+    # rows come last ascending and first descending
+    rids = scan_index(index, bounds, reverse=descending)
+    if nulls and index.nulls:
+        null_rids = sorted(index.nulls)
+        rids = chain(null_rids, rids) if descending else chain(rids, null_rids)
+    yield from rids
+
+
+def range_bounds(column, conditions):
+    # Fold the range predicates on one column into (low, high, low_inclusive,
+    # high_inclusive) for an ordered index, with the predicates used
+    low = high = None
+    low_inclusive = high_inclusive = True
+    consumed = []
+    for cond in conditions:
+        col, op, value = cond
+        if col != column or op not in predicate.RANGE_OPERATORS or value is None:
+            continue
+        if op in ("=", ">", ">=") and (low is None or value > low or (value == low and op == ">")):
+            low, low_inclusive = value, op != ">"
+        if op in ("=", "<", "<=") and (high is None or value < high or (value == high and op == "<")):
+            high, high_inclusive = value, op != "<"
+        consumed.append(cond)
+    return (low, high, low_inclusive, high_inclusive), consumed
+
+
+def sorted_rids(rids):
+    yield from sorted(rids)
+
+
+def sort_rids(table, rids, column, descending=False, limit=None):
+    value = table.store.value
+    yield from top(rids, lambda rid: (value(rid, column) is None, value(rid, column)), descending, limit)
+
+
+def filter_rids(table, rids, conditions):
+    # The predicate is compiled once, when the first row is pulled
+    test = predicate.compile_filter(conditions, table.store.getter)
+    return (rid for rid in rids if test(rid))
+
+
+def fetch_rows(table, rids, names=None):
+    if names is None:
+        get = table.store.get
+        for rid in rids:
+            yield get(rid)
+        return
+    value = table.store.value
+    for rid in rids:
+        yield {name: value(rid, name) for name in names}
+
+
+def filter_rows(rows, conditions):
+    test = predicate.row_filter(conditions)
+    return (row for row in rows if test(row))
+
+
+def top(items, key, descending=False, limit=None):
+    # sorted() that keeps only the first limit items in a heap when there is a LIMIT
+    if limit is None:
+        return sorted(items, key=key, reverse=descending)
+    if descending:
+        return heapq.nlargest(limit, items, key=key)
+    return heapq.nsmallest(limit, items, key=key)
+
+
+def sort_rows(rows, column, descending=False, limit=None):
+    # Blocking: the only operator that has to see every input row first
+    yield from top(rows, sort_key(column), descending, limit)
+
+
+def project_rows(rows, keys):
+    for row in rows:
+        yield {key: row[key] for key in keys}
+
+
+def limit_rows(rows, count):
+    return islice(rows, count)
+
+
+def aggregate_rows(rows, group_keys, aggregates):
+    # Hash aggregation: rows are bucketed by their GROUP BY values, each bucket
+    # keeping the state of every aggregate (see aggregate.py). Blocking, like sort.
+    groups = {}
+    for row in rows:
+        key = tuple(row[k] for k in group_keys)
+        states = groups.get(key)
+        if states is None:
+            states = groups[key] = aggregate.new_states(aggregates)
+        aggregate.update(states, aggregates, row.__getitem__)
+    yield from aggregate.result_rows(groups, group_keys, aggregates)
+
+
+def index_join(outer, inner, outer_col, inner_col, outer_rids, inner_test=None):
+    # Index nested loop: (outer row id, matching inner row ids) for each outer
+    # row, probing inner's index on inner_col; inner_test filters the matches
+    index = inner.index_on(inner_col)
+    value = outer.store.value
+    if index.unique:
+        entries = index.entries
+        for o_rid in outer_rids:
+            key = value(o_rid, outer_col)
+            i_rid = None if key is None else entries.get(key)
+            if i_rid is None or (inner_test is not None and not inner_test(i_rid)):
+                yield o_rid, ()
+            else:
+                yield o_rid, (i_rid,)
+        return
+    lookup = index.lookup
+    for o_rid in outer_rids:
+        key = value(o_rid, outer_col)
+        matches = () if key is None else lookup(key)
+        if inner_test is not None and matches:
+            matches = [i_rid for i_rid in matches if inner_test(i_rid)]
+        yield o_rid, matches
+
+
+def hash_join(outer, outer_col, outer_rids, inner_items, build_outer=False):
+    # Hash join: (outer row id, matching inner row ids) in outer order, from
+    # inner_items of (inner row id, key). The table is built on the inner
+    # rows, or with build_outer on the outer rows, the inner side then being
+    # probed up front so matches can still be emitted in outer order.
+    value = outer.store.value
+    build = {}
+    if not build_outer:
+        for i_rid, key in inner_items:
+            if key is not None:
+                build.setdefault(key, []).append(i_rid)
+        for o_rid in outer_rids:
+            yield o_rid, build.get(value(o_rid, outer_col), ())
+        return
+    outer_rids = list(outer_rids)
+    for o_rid in outer_rids:
+        key = value(o_rid, outer_col)
+        if key is not None:
+            build.setdefault(key, []).append(o_rid)
+    found = {}
+    for i_rid, key in inner_items:
+        for o_rid in build.get(key, ()):
+            found.setdefault(o_rid, []).append(i_rid)
+    for o_rid in outer_rids:
+        yield o_rid, found.get(o_rid, ())
+
+
+def combine_rows(left, right, pairs, join_type="inner", swapped=False):
+    # Joined rows from (outer row id, inner row ids) pairs, with the outer
+    # table being right when swapped. Keys are "table.column", the left
+    # table's first; a LEFT JOIN pads unmatched left rows with NULLs.
+    left_keys = [f"{left.name}.{col}" for col in left.columns]
+    right_keys = [f"{right.name}.{col}" for col in right.columns]
+    null_right = dict.fromkeys(right_keys)
+    left_row, right_row = left.row, right.row
+    for o_rid, matches in pairs:
+        if not matches:
+            if join_type == "left":
+                row = dict(zip(left_keys, left_row(o_rid).values()))
+                row.update(null_right)
+                yield row
+            continue
+        if swapped:
+            right_part = list(zip(right_keys, right_row(o_rid).values()))
+            for i_rid in matches:
+                row = dict(zip(left_keys, left_row(i_rid).values()))
+                row.update(right_part)
+                yield row
+            continue
+        prefixed = dict(zip(left_keys, left_row(o_rid).values()))
+        for i_rid in matches:
+            row = dict(prefixed)
+            row.update(zip(right_keys, right_row(i_rid).values()))
+            yield row
+
+
+def join_rows(left, right, left_col, right_col, join_type="inner", left_rids=None):
+    # Rows of left (every live row, or left_rids in the order given) each paired
+    # with its matches in right-table order, exactly as a nested loop would.
+    # Keys are "table.column"; NULL keys never match.
+    if left_rids is None:
+        left_rids = scan_table(left)
+    if right.is_unique(right_col):
+        pairs = index_join(left, right, left_col, right_col, left_rids)
+    else:
+        pairs = hash_join(left, left_col, left_rids, right.column_items(right_col), len(left) < len(right))
+    return combine_rows(left, right, pairs, join_type)
+
+
+def read_csv(f, table, header, columns):
+    reader = filter(None, csv.reader(f))
+    if header:
+        names = next(reader, None) or []
+        columns = columns or [name.strip() for name in names]
+        for col in columns:
+            if col not in table.columns:
+                raise ValueError(f"Unknown column: {col}")
+    if columns is None or list(columns) == list(table.columns):
+        yield from reader
+        return
+    for record in reader:
+        given = dict(zip(columns, record))
+        yield [given.get(col) for col in table.columns]
+
+
+def read_jsonl(f, table, columns):
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if isinstance(record, dict):
+            yield [record.get(col) for col in table.columns]
+        elif columns is not None:
+            given = dict(zip(columns, record))
+            yield [given.get(col) for col in table.columns]
+        else:
+            yield record
+
+
+class LRUCache:
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def estimate_size(rows, sample=32):
+    # Rough bytes held by a list of row dicts, extrapolated from the first few rows
+    if not rows:
+        return sys.getsizeof(rows)
+    head = rows[:sample]
+    per_row = sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row.values())) for row in head) / len(head)
+    return sys.getsizeof(rows) + int(per_row * len(rows))
+
+
+class ResultCache:
+    # LRU cache of SELECT results bounded by their estimated size in bytes.
+    # Each entry records the versions of the tables it was computed from and
+    # is only served while every one of them is unchanged; a stale entry is
+    # dropped on the lookup that finds it.
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = OrderedDict()  # key -> (table versions, rows, size)
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, versions):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] != versions:
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, versions, rows):
+        size = estimate_size(rows)
+        if size > self.budget:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (versions, rows, size)
+            self.used += size
+            while self.used > self.budget:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                self.used -= evicted
+                self.evictions += 1
+
+    def _drop(self, key):
+        self.used -= self.entries.pop(key)[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self.entries),
+                "bytes": self.used,
+                "budget": self.budget,
+            }
+
+
+class RWLock:
+    # Reentrant reader/writer lock. Any number of readers share it; a writer
+    # waits for them to drain and then holds it alone. New readers are let in
+    # while a writer is only waiting, so a read never queues behind a write
+    # that has not started. The price is that overlapping reads could starve a
+    # writer forever, so once a writer has waited patience seconds new readers
+    # queue behind it after all (a thread already reading may still read
+    # again). Reads are short, since streams release their locks between
+    # chunks, so such a writer only waits for the reads already running.
+    # The thread holding the write side may also take the read side, but a
+    # reader cannot upgrade to writing.
+    def __init__(self, patience=0.1):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = {}  # thread id -> depth
+        self.writer = None
+        self.write_depth = 0
+        self.patience = patience
+        self.waiting_writers = 0
+        self.waiting_since = None  # when the longest-waiting writer started waiting
+
+    def _writer_starved(self):
+        return self.waiting_since is not None and time.monotonic() - self.waiting_since >= self.patience
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self.cond:
+            if self.writer != me and me not in self.readers:
+                while self.writer is not None or self._writer_starved():
+                    self.cond.wait()
+            self.readers[me] = self.readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = threading.get_ident()
+        with self.cond:
+            depth = self.readers[me] - 1
+            if depth:
+                self.readers[me] = depth
+            else:
+                del self.readers[me]
+                if not self.readers:
+                    self.cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self.cond:
+            if self.writer == me:
+                self.write_depth += 1
+                return
+            if me in self.readers:
+                raise ValueError("Cannot upgrade a read lock to a write lock")
+            self.waiting_writers += 1
+            if self.waiting_since is None:
+                self.waiting_since = time.monotonic()
+            try:
+                while self.writer is not None or self.readers:
+                    self.cond.wait()
+            finally:
+                self.waiting_writers -= 1
+                # The clock restarts for the writers still waiting
+                self.waiting_since = time.monotonic() if self.waiting_writers else None
+            self.writer = me
+            self.write_depth = 1
+
+    def release_write(self):
+        with self.cond:
+            self.write_depth -= 1
+            if not self.write_depth:
+                self.writer = None
+                self.cond.notify_all()
+
+
+class StreamCursor:
+    # A SELECT being streamed. Its operator pipeline runs lazily, a chunk of
+    # rows at a time under the statement's read locks, which are released in
+    # between, so a slow consumer never holds them. A writer about to change
+    # one of the tables it reads first runs the rest of the pipeline into a
+    # buffer (see Database.locked), so the stream still returns the tables as
+    # they were when it started, and the writer never waits for the consumer.
+    CHUNK = 256
+
+    def __init__(self, reads, rows):
+        self.reads = set(reads)
+        self.rows = rows
+        self.buffer = None  # rows left when a writer drained the pipeline
+        self.error = None
+        self.lock = threading.Lock()
+
+    def chunk(self):
+        # The next rows, none at the end; the caller holds the read locks
+        # unless the pipeline was already drained
+        with self.lock:
+            rows = list(islice(self.rows if self.buffer is None else self.buffer, self.CHUNK))
+            if not rows and self.error is not None:
+                raise self.error
+            return rows
+
+    def drain(self):
+        with self.lock:
+            if self.buffer is not None:
+                return
+            rows = []
+            try:
+                rows.extend(self.rows)
+            except Exception as e:
+                # Raised to the consumer once it has the rows before it
+                self.error = e
+            self.buffer = iter(rows)
+
+
+class HashIndex:
+    def __init__(self, name, column, unique=False):
+        self.name = name
+        self.column = column
+        self.unique = unique
+        # unique: value -> row id, otherwise value -> set of row ids
+        self.entries = {}
+
+    def conflicts(self, value, rid=None):
+        if not self.unique:
+            return False
+        owner = self.entries.get(value)
+        return owner is not None and owner != rid
+
+    def add(self, value, rid):
+        if self.unique:
+            self.entries[value] = rid
+        else:
+            self.entries.setdefault(value, set()).add(rid)
+
+    def remove(self, value, rid):
+        if self.unique:
+            if self.entries.get(value) == rid:
+                del self.entries[value]
+        else:
+            rids = self.entries.get(value)
+            if rids is not None:
+                rids.discard(rid)
+                if not rids:
+                    del self.entries[value]
+
+    def add_many(self, items):
+        if self.unique:
+            self.entries.update(items)
+            return
+        entries = self.entries
+        for value, rid in items:
+            rids = entries.get(value)
+            if rids is None:
+                entries[value] = {rid}
+            else:
+                rids.add(rid)
+
+    def lookup(self, value):
+        if self.unique:
+            rid = self.entries.get(value)
+            return [] if rid is None else [rid]
+        return sorted(self.entries.get(value, ()))
+
+    def build(self, items):
+        self.entries = {}
+        self.add_many(items)
+
+
+INFINITY = float("inf")  # sorts after every row id
+
+
+class SortedIndex:
+    # Sorted (value, rid) pairs split into blocks of up to 2 * BLOCK_SIZE
+    # pairs, maxes[i] being the last pair of blocks[i]. A lookup is a binary
+    # search of maxes and then of one block, and an insert or delete only
+    # shifts that block, so neither grows with the table or with the number
+    # of rows sharing a value.
+    unique = False
+    BLOCK_SIZE = 512
+
+    def __init__(self, name, column):
+        self.name = name
+        self.column = column
+        self.blocks = []
+        self.maxes = []
+        self.nulls = set()
+
+    def conflicts(self, value, rid=None):
+        return False
+
+    def _position(self, key):
+        # (block, offset) of the first pair not below key
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return i, 0
+        return i, bisect_left(self.blocks[i], key)
+
+    def add(self, value, rid):
+        if value is None:
+            self.nulls.add(rid)
+            return
+        pair = (value, rid)
+        if not self.blocks:
+            self.blocks.append([pair])
+            self.maxes.append(pair)
+            return
+        try:
+            i = bisect_left(self.maxes, pair)
+            if i == len(self.maxes):
+                i -= 1
+                self.blocks[i].append(pair)
+                self.maxes[i] = pair
+            else:
+                insort(self.blocks[i], pair)
+        except TypeError:
+            raise ValueError(f"Cannot order mixed types in index {self.name}")
+        block = self.blocks[i]
+        if len(block) > 2 * self.BLOCK_SIZE:
+            half = len(block) // 2
+            self.blocks[i:i + 1] = [block[:half], block[half:]]
+            self.maxes[i:i + 1] = [block[half - 1], block[-1]]
+
+    def add_many(self, items):
+        for value, rid in items:
+            self.add(value, rid)
+
+    def remove(self, value, rid):
+        if value is None:
+            self.nulls.discard(rid)
+            return
+        pair = (value, rid)
+        i, j = self._position(pair)
+        if i == len(self.blocks) or self.blocks[i][j:j + 1] != [pair]:
+            return
+        block = self.blocks[i]
+        del block[j]
+        if len(block) >= self.BLOCK_SIZE // 2 or len(self.blocks) == 1:
+            if block:
+                self.maxes[i] = block[-1]
+            else:
+                del self.blocks[i], self.maxes[i]
+            return
+        # Fold a small block into a neighbour, splitting again if that overflows
+        k = i - 1 if i else i + 1
+        i, k = min(i, k), max(i, k)
+        merged = self.blocks[i] + self.blocks[k]
+        if len(merged) > 2 * self.BLOCK_SIZE:
+            half = len(merged) // 2
+            self.blocks[i:k + 1] = [merged[:half], merged[half:]]
+            self.maxes[i:k + 1] = [merged[half - 1], merged[-1]]
+        else:
+            self.blocks[i:k + 1] = [merged]
+            self.maxes[i:k + 1] = [merged[-1]]
+
+    def _rids(self, start, stop, reverse=False):
+        # Row ids of the pairs from position start up to stop, one block at a
+        # time so a LIMIT stops the walk early
+        (si, sj), (ti, tj) = start, stop
+        blocks = range(si, min(ti + 1, len(self.blocks)))
+        for i in reversed(blocks) if reverse else blocks:
+            block = self.blocks[i]
+            span = block[sj if i == si else 0:tj if i == ti else len(block)]
+            if reverse:
+                span.reverse()
+            for _, rid in span:
+                yield rid
+
+    def lookup(self, value):
+        if value is None:
+            return []
+        # (value,) sorts before and (value, inf) after every pair of value
+        return list(self._rids(self._position((value,)), self._position((value, INFINITY))))
+
+    def range(self, low=None, high=None, low_inclusive=True, high_inclusive=True, reverse=False):
+        start = (0, 0)
+        stop = (len(self.blocks), 0)
+        if low is not None:
+            start = self._position((low,) if low_inclusive else (low, INFINITY))
+        if high is not None:
+            stop = self._position((high, INFINITY) if high_inclusive else (high,))
+        return self._rids(start, stop, reverse)
+
+    def min(self):
+        return self.blocks[0][0][0] if self.blocks else None
+
+    def max(self):
+        return self.blocks[-1][-1][0] if self.blocks else None
+
+    def build(self, items):
+        self.nulls = set()
+        pairs = []
+        for value, rid in items:
+            if value is None:
+                self.nulls.add(rid)
+            else:
+                pairs.append((value, rid))
+        try:
+            pairs.sort()
+        except TypeError:
+            raise ValueError(f"Cannot order mixed types in index {self.name}")
+        size = self.BLOCK_SIZE
+        self.blocks = [pairs[i:i + size] for i in range(0, len(pairs), size)]
+        self.maxes = [block[-1] for block in self.blocks]
+
+
+class RunningAggregate:
+    # COUNT/SUM/MIN/MAX of one column, kept current on every write. A delete
+    # cannot undo a MIN or MAX, so removing an extreme value marks them stale
+    # and the next read rescans the column once.
+    def __init__(self, column):
+        self.column = column
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.stale = False
+
+    def add(self, value):
+        if value is None:
+            return
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def add_many(self, values):
+        values = [value for value in values if value is not None]
+        if not values:
+            return
+        self.count += len(values)
+        self.total += sum(values)
+        low, high = min(values), max(values)
+        if self.min is None or low < self.min:
+            self.min = low
+        if self.max is None or high > self.max:
+            self.max = high
+
+    def remove(self, value):
+        if value is None:
+            return
+        self.count -= 1
+        self.total -= value
+        if value == self.min or value == self.max:
+            self.stale = True
+
+    def build(self, values):
+        self.count = 0
+        self.total = 0
+        self.min = self.max = None
+        self.stale = False
+        self.add_many(values)
+
+    def value(self, func):
+        if func == "COUNT":
+            return self.count
+        if not self.count:
+            return None
+        if func == "SUM":
+            return self.total
+        if func == "AVG":
+            return self.total / self.count
+        return self.min if func == "MIN" else self.max
+
+
 class Table:
-    def __init__(self, name, columns, primary_key=None, unique_keys=None):
+    def __init__(self, name, columns, primary_key=None, unique_keys=None, storage="columnar",
+                 auto_increment=None, aggregates=False, pool=None):
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown storage type: {storage}")
+        if auto_increment is not None and columns.get(auto_increment) != "INT":
+            raise ValueError("AUTO_INCREMENT column must be INT")
         self.name = name
         self.columns = columns
         self.primary_key = primary_key
         self.unique_keys = unique_keys or []
-        self.rows = []
+        self.storage = storage
+        # Row ids are positions in the store; deleted rows stay in place as tombstones
+        # until enough accumulate to make a compaction worthwhile
+        if storage == "paged":
+            # Rows live in the pages of a data file, cached in the Database's buffer pool
+            self.store = PagedStore(columns, pool, name)
+        else:
+            self.store = STORAGE_TYPES[storage](columns)
+        self.converters = [self.converter(column) for column in columns]
+        self.bulk_converters = [self.bulk_converter(column) for column in columns]
+        self.deleted = set()
+        self.compact_ratio = 0.25
+        self.compact_min = 1024
+        self.compactions = 0
+        # Bumped by every change to the table's rows; cached results compare it
+        self.version = 0
         self.indexes = {}
+        # AUTO_INCREMENT fills a NULL in that column with the next sequence
+        # value; the sequence only moves forward, past every value ever stored
+        self.auto_increment = auto_increment
+        self.sequence = 1
+        self.aggregates = aggregates
+        self.running = {}
+        # Materialized views built on this table, told about every change
+        self.views = []
+        # Statistics from the last ANALYZE, used by the planner; None until then
+        self.stats = None
+        if aggregates:
+            for column, col_type in columns.items():
+                if col_type == "INT":
+                    self.running[column] = RunningAggregate(column)
 
         if primary_key:
-            self.indexes[primary_key] = {}
+            self.indexes[primary_key] = HashIndex(primary_key, primary_key, unique=True)
         for key in self.unique_keys:
             if key != primary_key:
-                self.indexes[key] = {}
+                self.indexes[key] = HashIndex(key, key, unique=True)
+
+    def coerce(self, column, value):
+        if column not in self.columns:
+            raise ValueError(f"Unknown column: {column}")
+        if self.columns[column] == "INT" and isinstance(value, str):
+            try:
+                return int(value)
+            except ValueError:
+                return value
+        return value
+
+    def converter(self, column):
+        # Value conversion applied on every write: the store's typed conversion,
+        # or the lenient coercion for stores without one
+        convert = self.store.converter(column)
+        if convert is None:
+            return lambda value: self.coerce(column, value)
+        return convert
+
+    def bulk_converter(self, column):
+        convert_many = self.store.bulk_converter(column)
+        if convert_many is None:
+            convert = self.converter(column)
+            return lambda values: list(map(convert, values))
+        return convert_many
+
+    def _violation(self, index):
+        if index.column == self.primary_key:
+            return ValueError("Primary key violation")
+        return ValueError(f"Unique key violation: {index.column}")
+
+    def _check_unique(self, row, rid=None):
+        for index in self.indexes.values():
+            if index.conflicts(row[index.column], rid):
+                raise self._violation(index)
 
     def insert(self, values):
         if len(values) != len(self.columns):
             raise ValueError("Column count does not match")
 
-        row = dict(zip(self.columns.keys(), values))
+        row = {col: convert(value) for col, convert, value in zip(self.columns, self.converters, values)}
+        auto = self.auto_increment
+        if auto is not None and row[auto] is None:
+            row[auto] = self.sequence
+        if self.primary_key and row[self.primary_key] is None:
+            raise ValueError("Primary key cannot be NULL")
+        self._check_unique(row)
 
-        if self.primary_key:
-            pk_val = row[self.primary_key]
-            if pk_val in self.indexes[self.primary_key]:
-                raise ValueError("Primary key violation")
-            self.indexes[self.primary_key][pk_val] = row
+        rid = self.store.append(list(row.values()))
+        for index in self.indexes.values():
+            index.add(row[index.column], rid)
+        if auto is not None:
+            self.sequence = max(self.sequence, row[auto] + 1)
+        for aggregate in self.running.values():
+            aggregate.add(row[aggregate.column])
+        for view in self.views:
+            view.inserted(self, (rid,))
+        self.version += 1
+        return rid
 
-        for key in self.unique_keys:
-            val = row[key]
-            if key in self.indexes and val in self.indexes[key]:
-                raise ValueError(f"Unique key violation: {key}")
-            self.indexes[key][val] = row
+    def __len__(self):
+        return len(self.store) - len(self.deleted)
+
+    def row(self, rid):
+        return self.store.get(rid)
 
-        self.rows.append(row)
+    def rids(self):
+        if not self.deleted:
+            return range(len(self.store))
+        return (rid for rid in range(len(self.store)) if rid not in self.deleted)
+
+    def column_items(self, column):
+        # (row id, value) for every live row
+        items = enumerate(self.store.column(column))
+        if not self.deleted:
+            return items
+        return ((rid, value) for rid, value in items if rid not in self.deleted)
 
     def select_all(self):
-        return self.rows
+        return [self.store.get(rid) for rid in self.rids()]
+
+    def is_unique(self, column):
+        return column == self.primary_key or column in self.unique_keys
+
+    def lookup_unique(self, column, value):
+        return self.index_on(column).entries.get(value)
+
+    def index_on(self, column):
+        # Best index for equality lookups: unique hash, then hash, then ordered
+        best = None
+        for index in self.indexes.values():
+            if index.column != column:
+                continue
+            rank = 0 if index.unique else 1 if isinstance(index, HashIndex) else 2
+            if best is None or rank < best[0]:
+                best = (rank, index)
+        return best[1] if best else None
+
+    def ordered_index_on(self, column):
+        for index in self.indexes.values():
+            if index.column == column and isinstance(index, SortedIndex):
+                return index
+        return None
+
+    def set_auto_increment(self, column):
+        # Make an existing INT column AUTO_INCREMENT, its sequence starting past
+        # every value stored so far
+        if self.columns.get(column) != "INT":
+            raise ValueError("AUTO_INCREMENT column must be INT")
+        self.auto_increment = column
+        values = (value for value in self.store.column(column) if value is not None)
+        self.sequence = max(self.sequence, max(values, default=0) + 1)
+
+    def create_index(self, name, column, ordered=False):
+        if name in self.indexes:
+            raise ValueError(f"Index {name} already exists")
+        if column not in self.columns:
+            raise ValueError(f"Unknown column: {column}")
+        index = SortedIndex(name, column) if ordered else HashIndex(name, column)
+        index.build((value, rid) for rid, value in self.column_items(column))
+        self.indexes[name] = index
+
+    def update(self, rids, changes):
+        changes = {col: self.store.convert(col, self.coerce(col, val)) for col, val in changes.items()}
+        if self.primary_key in changes and changes[self.primary_key] is None and rids:
+            raise ValueError("Primary key cannot be NULL")
+        touched = [index for index in self.indexes.values() if index.column in changes]
+        running = [aggregate for aggregate in self.running.values() if aggregate.column in changes]
+
+        # Validate every row before applying anything so a violation leaves no partial update
+        for index in touched:
+            if not index.unique or not rids:
+                continue
+            new_value = changes[index.column]
+            if len(rids) > 1 or index.conflicts(new_value, rids[0]):
+                raise self._violation(index)
+
+        for view in self.views:
+            view.removed(self, rids)
+        for rid in rids:
+            for index in touched:
+                index.remove(self.store.value(rid, index.column), rid)
+            for aggregate in running:
+                aggregate.remove(self.store.value(rid, aggregate.column))
+                aggregate.add(changes[aggregate.column])
+            for col, value in changes.items():
+                self.store.set(rid, col, value)
+            for index in touched:
+                index.add(changes[index.column], rid)
+        auto = self.auto_increment
+        if rids and auto in changes and changes[auto] is not None:
+            self.sequence = max(self.sequence, changes[auto] + 1)
+        for view in self.views:
+            view.inserted(self, rids)
+        if rids:
+            self.version += 1
+        return len(rids)
+
+    def delete(self, rids, auto_compact=True):
+        doomed = {rid for rid in rids if rid not in self.deleted}
+        if doomed:
+            self.version += 1
+        threshold = max(self.compact_min, len(self.store) * self.compact_ratio)
+        if auto_compact and len(self.deleted) + len(doomed) >= threshold:
+            # The indexes are about to be rebuilt anyway, so skip the per-row removals
+            self.deleted |= doomed
+            self.compact()
+            return len(doomed)
+        for view in self.views:
+            view.removed(self, doomed)
+        for rid in doomed:
+            for index in self.indexes.values():
+                index.remove(self.store.value(rid, index.column), rid)
+            for aggregate in self.running.values():
+                aggregate.remove(self.store.value(rid, aggregate.column))
+        self.deleted |= doomed
+        return len(doomed)
+
+    def compact(self):
+        # Drop tombstoned rows; survivors are renumbered, so every index is rebuilt once
+        if not self.deleted:
+            return
+        self.store.retain(self.deleted)
+        self.deleted = set()
+        self.compactions += 1
+        self._build_indexes()
+
+    def _build_indexes(self):
+        for index in self.indexes.values():
+            index.build((value, rid) for rid, value in self.column_items(index.column))
+        for aggregate in self.running.values():
+            aggregate.build(value for _, value in self.column_items(aggregate.column))
+        for view in self.views:
+            view.build()
+
+    def truncate(self, count):
+        # Drop every row from position count on (used to roll back a failed bulk load)
+        self.store.truncate(count)
+        self.deleted = {rid for rid in self.deleted if rid < count}
+        self.version += 1
+        self._build_indexes()
+
+    def dump(self):
+        # Snapshot state; callers compact first so no tombstones are written
+        return {
+            "name": self.name,
+            "columns": self.columns,
+            "primary_key": self.primary_key,
+            "unique_keys": self.unique_keys,
+            "storage": self.storage,
+            "auto_increment": self.auto_increment,
+            "sequence": self.sequence,
+            "aggregates": self.aggregates,
+            "stats": None if self.stats is None else self.stats.dump(),
+            "indexes": [
+                (index.name, index.column, isinstance(index, SortedIndex))
+                for index in self.indexes.values()
+                if not index.unique
+            ],
+            "data": self.store.dump(),
+        }
+
+    @classmethod
+    def load(cls, state, pool=None):
+        table = cls(
+            state["name"], state["columns"], state["primary_key"], state["unique_keys"], state["storage"],
+            state.get("auto_increment"), state.get("aggregates", False), pool,
+        )
+        table.sequence = state.get("sequence", 1)
+        if state.get("stats") is not None:
+            table.stats = stats.TableStats.load(state["stats"])
+        table.store.load(state["data"])
+        for name, column, ordered in state["indexes"]:
+            table.indexes[name] = SortedIndex(name, column) if ordered else HashIndex(name, column)
+        table._build_indexes()
+        return table
+
+    def min(self, column):
+        index = self.ordered_index_on(column)
+        if index is not None:
+            return index.min()
+        return min((value for _, value in self.column_items(column) if value is not None), default=None)
+
+    def max(self, column):
+        index = self.ordered_index_on(column)
+        if index is not None:
+            return index.max()
+        return max((value for _, value in self.column_items(column) if value is not None), default=None)
+
+    def has_quick_aggregate(self, func, column):
+        # Whether func(column) over the whole table is answerable without a scan
+        if column is None or column in self.running:
+            return True
+        return func in ("MIN", "MAX") and self.ordered_index_on(column) is not None
+
+    def quick_aggregate(self, func, column):
+        if column is None:
+            return len(self)
+        aggregate = self.running.get(column)
+        if aggregate is None:
+            index = self.ordered_index_on(column)
+            return index.min() if func == "MIN" else index.max()
+        if aggregate.stale:
+            aggregate.build(value for _, value in self.column_items(column))
+        return aggregate.value(func)
+
+    def distinct(self, column):
+        # Distinct non-NULL values in a column, from ANALYZE or a key or hash index; None if unknown
+        if self.stats is not None and column in self.stats.columns:
+            return self.stats.columns[column].distinct
+        if self.is_unique(column):
+            return len(self)
+        index = self.index_on(column)
+        if isinstance(index, HashIndex):
+            return len(index.entries)
+        return None
+
+    def selectivity(self, conditions):
+        # Estimated fraction of the rows satisfying every checked condition
+        columns = self.stats.columns if self.stats is not None else {}
+        result = 1.0
+        for cond in conditions:
+            result *= stats.selectivity(cond, columns.get, self.distinct)
+        return result
+
+    def scan_work(self, conditions):
+        # Cost of the cheapest pass over every row checking all the conditions,
+        # and the conditions in the order it checks them: the most selective
+        # comparison first, over its column buffer, when there is one
+        total = len(self)
+        work = total * (SEQ_ROW + FILTER_ROW * len(conditions))
+        simple = [cond for cond in conditions if predicate.is_simple(cond)]
+        if not simple:
+            return work, list(conditions)
+        first = min(simple, key=lambda cond: self.selectivity([cond]))
+        rest = [cond for cond in conditions if cond is not first]
+        column_work = total * COLUMN_ROW + total * self.selectivity([first]) * FILTER_ROW * len(rest)
+        if column_work < work:
+            return column_work, [first, *rest]
+        return work, list(conditions)
+
+    def _access_paths(self, conditions, order_by, descending, parallel=None):
+        # Candidate ways to find the row ids, as (node, rows read, row id source,
+        # conditions left to check, ids in ORDER BY order, source stops early under a LIMIT)
+        total = len(self)
+        node = PlanNode(f"Seq Scan on {self.name}", rows=total, cost=total * SEQ_ROW, scan=True)
+        yield node, total, lambda: scan_table(self), conditions, False, True
+
+        simple = [cond for cond in conditions if predicate.is_simple(cond)]
+        if simple:
+            # The most selective comparison is evaluated over its column buffer
+            first = min(simple, key=lambda cond: self.selectivity([cond]))
+            reads = total * self.selectivity([first])
+            node = PlanNode(
+                f"Column Scan on {self.name}", predicate.describe(first), reads, total * COLUMN_ROW,
+                scan=True, examined=total,
+            )
+            rest = [cond for cond in conditions if cond is not first]
+            yield node, reads, lambda: column_scan(self, first), rest, False, False
+
+        if parallel is not None and conditions and parallel.accepts(self):
+            # The workers each check every condition over a range of the rows
+            work, ordered = self.scan_work(conditions)
+            rows = total * self.selectivity(conditions)
+            node = PlanNode(
+                f"Parallel Scan on {self.name} ({parallel.workers} workers)", predicate.describe_all(conditions),
+                rows, PARALLEL_SETUP + work / parallel.workers + rows * GATHER_ROW, scan=True, examined=total,
+            )
+            yield node, rows, lambda: parallel.filter(self, ordered), [], False, False
+
+        for cond in conditions:
+            col, op, value = cond
+            if op not in ("=", "IN") or col is None:
+                continue
+            index = self.index_on(col)
+            if index is None or isinstance(index, SortedIndex):
+                continue
+            reads = total * self.selectivity([cond])
+            probes = len(value) if op == "IN" else 1
+            node = PlanNode(
+                f"Index Lookup on {self.name} using {index.name}", predicate.describe(cond), reads,
+                probes * PROBE + reads * INDEX_ROW, scan=True,
+            )
+            rest = [c for c in conditions if c is not cond]
+            yield node, reads, lambda index=index, cond=cond: index_lookup(index, cond), rest, False, False
+
+        columns = [order_by] if order_by is not None else []
+        columns += [col for col, op, _ in conditions if op in predicate.RANGE_OPERATORS and col not in columns]
+        for col in columns:
+            index = self.ordered_index_on(col)
+            if index is None:
+                continue
+            bounds, consumed = range_bounds(col, conditions)
+            reads = total * self.selectivity(consumed)
+            rest = [c for c in conditions if c not in consumed]
+            detail = predicate.describe_all(consumed) or None
+            if col == order_by:
+                # Ids come in ORDER BY order, so there is nothing to sort and a LIMIT stops the scan
+                node = PlanNode(
+                    f"Index Scan{' Backward' if descending else ''} on {self.name} using {index.name}",
+                    detail, reads, PROBE + reads * INDEX_ROW, scan=True,
+                )
+                yield (node, reads, lambda index=index, bounds=bounds, nulls=not consumed:
+                       index_scan(index, bounds, descending, nulls), rest, True, True)
+            elif consumed:
+                # Range hits are put back in storage order
+                node = PlanNode(
+                    f"Index Range Scan on {self.name} using {index.name}", detail, reads,
+                    PROBE + reads * INDEX_ROW + sort_cost(reads), scan=True,
+                )
+                yield (node, reads, lambda index=index, bounds=bounds: sorted_rids(scan_index(index, bounds)),
+                       rest, False, False)
+
+    def plan_scan(self, conditions=(), order_by=None, descending=False, limit=None, parallel=None):
+        # Cost every access path for checked conditions and return the cheapest
+        # as a QueryPlan over row ids: access path, then filter, sort and limit.
+        # parallel is the Database's ParallelExecutor, when it has one.
+        rows = len(self) * self.selectivity(conditions)
+        best = None
+        paths = self._access_paths(conditions, order_by, descending, parallel)
+        for node, reads, source, remaining, ordered, lazy in paths:
+            cost = node.cost + reads * FILTER_ROW * len(remaining)
+            ordered = ordered or order_by is None
+            if not ordered:
+                cost += sort_cost(rows, limit)
+            elif lazy and limit is not None and rows > limit:
+                # The pipeline stops once it has produced limit rows
+                cost *= limit / rows
+            if best is None or cost < best[0]:
+                best = (cost, node, source, remaining, ordered)
+        cost, node, source, remaining, ordered = best
+
+        plan = QueryPlan(node, lambda: node.measure(source()))
+        if remaining:
+            plan = plan.then(
+                "Filter", lambda rids: filter_rids(self, rids, remaining), predicate.describe_all(remaining), rows,
+                node.cost + node.rows * FILTER_ROW * len(remaining),
+            )
+        if not ordered:
+            plan = plan.then(
+                f"Sort by {order_by}{' DESC' if descending else ''}",
+                lambda rids: sort_rids(self, rids, order_by, descending, limit),
+                None if limit is None else f"top {limit}", rows, cost,
+            )
+        if limit is not None:
+            plan = plan.then(f"Limit {limit}", lambda rids: limit_rows(rids, limit), rows=min(rows, limit), cost=cost)
+        return plan
+
+    def check_conditions(self, conditions, order_by=None):
+        # Type-check (column, op, value) predicates against the column types and
+        # coerce their constants once, before any row is read
+        conditions = [predicate.check(cond, self.columns.get) for cond in conditions]
+        if order_by is not None and order_by not in self.columns:
+            raise ValueError(f"Unknown column: {order_by}")
+        return predicate.expand(conditions)
+
+    def scan_rids(self, conditions=(), order_by=None, descending=False, limit=None):
+        # Lazy row-id pipeline for checked conditions
+        return self.plan_scan(conditions, order_by, descending, limit)()
+
+    def find_rids(self, conditions=(), order_by=None, descending=False, limit=None):
+        conditions = self.check_conditions(conditions, order_by)
+        return list(self.scan_rids(conditions, order_by, descending, limit))
+
+    def select(self, conditions=(), order_by=None, descending=False, limit=None):
+        return list(fetch_rows(self, self.find_rids(conditions, order_by, descending, limit)))
+
+
+class BulkLoader:
+    # Appends batches of rows with index maintenance deferred to finish(). Each
+    # batch is converted column by column and its keys checked as sets, so a
+    # bad batch raises before anything is appended.
+    def __init__(self, table):
+        self.table = table
+        self.start = len(table.store)
+        self.seen = {index.name: set() for index in table.indexes.values() if index.unique}
+        self.count = 0
+
+    def add(self, rows):
+        if not rows:
+            return 0
+        width = len(self.table.columns)
+        if set(map(len, rows)) != {width}:
+            bad = next(len(values) for values in rows if len(values) != width)
+            raise ValueError(f"Column count mismatch. Expected {width}, got {bad}")
+        return self.add_columns(list(zip(*rows)))
+
+    def add_columns(self, columns):
+        # columns holds one list of raw values per table column
+        table = self.table
+        columns = [convert_many(values) for convert_many, values in zip(table.bulk_converters, columns)]
+
+        positions = {col: i for i, col in enumerate(table.columns)}
+        sequence = table.sequence
+        if table.auto_increment is not None:
+            i = positions[table.auto_increment]
+            values = columns[i]
+            if None in values:
+                filled = []
+                for value in values:
+                    if value is None:
+                        value = sequence
+                    filled.append(value)
+                    sequence = max(sequence, value + 1)
+                columns[i] = filled
+            elif values:
+                sequence = max(sequence, max(values) + 1)
+        if table.primary_key and None in columns[positions[table.primary_key]]:
+            raise ValueError("Primary key cannot be NULL")
+        for index in table.indexes.values():
+            if not index.unique:
+                continue
+            keys = columns[positions[index.column]]
+            batch = set(keys)
+            seen = self.seen[index.name]
+            if len(batch) != len(keys) or not seen.isdisjoint(batch) or not batch.isdisjoint(index.entries.keys()):
+                raise table._violation(index)
+            seen |= batch
+
+        table.store.extend(columns)
+        table.sequence = sequence
+        self.count += len(columns[0])
+        return len(columns[0])
+
+    def finish(self):
+        table = self.table
+        end = len(table.store)
+        if end == self.start:
+            return
+        for index in table.indexes.values():
+            if isinstance(index, SortedIndex) and end - self.start > 64:
+                index.build((value, rid) for rid, value in table.column_items(index.column))
+            else:
+                new_values = islice(table.store.column(index.column), self.start, None)
+                index.add_many(zip(new_values, range(self.start, end)))
+        for aggregate in table.running.values():
+            aggregate.add_many(islice(table.store.column(aggregate.column), self.start, None))
+        for view in table.views:
+            view.inserted(table, range(self.start, end))
+        table.version += 1
+
+    def abort(self):
+        self.table.truncate(self.start)
+
+
+def row_code(key):
+    # A view row key (left rid, right rid or None) as one int, ordered like the pair
+    l_rid, r_rid = key
+    return (l_rid << 32) | (0 if r_rid is None else r_rid + 1)
+
+
+def row_key(code):
+    r_rid = (code & 0xFFFFFFFF) - 1
+    return code >> 32, (None if r_rid < 0 else r_rid)
+
+
+class MaterializedView:
+    # A stored two-table join kept current by deltas instead of recomputation.
+    # Each side keeps a join value -> row ids map of the base table, so a new
+    # base row is joined only against its matches and a removed one drops only
+    # the view rows built from it. View rows are keyed by (left rid, right rid),
+    # with a right rid of None for an unmatched LEFT JOIN row. A base-table
+    # compaction renumbers row ids, so it rebuilds the view. Ordered indexes on
+    # view columns hold each key packed into one int (see row_code), so paging
+    # through a view in the order of a column is a range scan.
+    def __init__(self, name, text, left, right, left_col, right_col, join_type, conditions, keys):
+        self.name = name
+        self.text = text
+        self.left = left
+        self.right = right
+        self.left_col = left_col
+        self.right_col = right_col
+        self.join_type = join_type
+        self.conditions = conditions  # on "table.column" keys
+        self.test = predicate.row_filter(conditions)
+        self.left_keys = [f"{left.name}.{col}" for col in left.columns]
+        self.right_keys = [f"{right.name}.{col}" for col in right.columns]
+        self.columns = keys or self.left_keys + self.right_keys
+        self.keys = keys
+        self.indexes = {}
+        self.build()
+
+    def build(self):
+        self.rows = {}
+        self.left_index = {}
+        self.right_index = {}
+        for r_rid, key in self.right.column_items(self.right_col):
+            if key is not None:
+                self.right_index.setdefault(key, {})[r_rid] = None
+        for l_rid in self.left.rids():
+            self._add_left(l_rid)
+        for index in self.indexes.values():
+            index.build((row[index.column], row_code(key)) for key, row in self.rows.items())
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _store(self, l_rid, r_rid, left_row=None):
+        if left_row is None:
+            left_row = zip(self.left_keys, self.left.row(l_rid).values())
+        row = dict(left_row)
+        if r_rid is None:
+            row.update(dict.fromkeys(self.right_keys))
+        else:
+            row.update(zip(self.right_keys, self.right.row(r_rid).values()))
+        if self.conditions and not self.test(row):
+            return
+        if self.keys is not None:
+            row = {key: row[key] for key in self.keys}
+        key = l_rid, r_rid
+        self.rows[key] = row
+        for index in self.indexes.values():
+            index.add(row[index.column], row_code(key))
+
+    def _drop(self, key):
+        row = self.rows.pop(key, None)
+        if row is not None:
+            for index in self.indexes.values():
+                index.remove(row[index.column], row_code(key))
+
+    def _add_left(self, l_rid):
+        key = self.left.store.value(l_rid, self.left_col)
+        if key is None:
+            r_rids = ()
+        else:
+            self.left_index.setdefault(key, {})[l_rid] = None
+            r_rids = self.right_index.get(key, ())
+        left_row = dict(zip(self.left_keys, self.left.row(l_rid).values())) if r_rids else None
+        for r_rid in r_rids:
+            self._store(l_rid, r_rid, left_row)
+        if not r_rids and self.join_type == "left":
+            self._store(l_rid, None)
+
+    def _remove_left(self, l_rid):
+        key = self.left.store.value(l_rid, self.left_col)
+        if key is not None:
+            self.left_index[key].pop(l_rid, None)
+            for r_rid in self.right_index.get(key, ()):
+                self._drop((l_rid, r_rid))
+        self._drop((l_rid, None))
+
+    def _add_right(self, r_rid):
+        key = self.right.store.value(r_rid, self.right_col)
+        if key is None:
+            return
+        r_rids = self.right_index.setdefault(key, {})
+        r_rids[r_rid] = None
+        for l_rid in self.left_index.get(key, ()):
+            if len(r_rids) == 1:
+                # The left row's first match replaces its NULL-extended row
+                self._drop((l_rid, None))
+            self._store(l_rid, r_rid)
+
+    def _remove_right(self, r_rid):
+        key = self.right.store.value(r_rid, self.right_col)
+        if key is None:
+            return
+        r_rids = self.right_index[key]
+        r_rids.pop(r_rid, None)
+        for l_rid in self.left_index.get(key, ()):
+            self._drop((l_rid, r_rid))
+            if not r_rids and self.join_type == "left":
+                self._store(l_rid, None)
+
+    def inserted(self, table, rids):
+        # Called by a base table after rows are added (or updated in place)
+        add = self._add_left if table is self.left else self._add_right
+        for rid in rids:
+            add(rid)
+
+    def removed(self, table, rids):
+        # Called by a base table before rows are deleted (or updated in place)
+        remove = self._remove_left if table is self.left else self._remove_right
+        for rid in rids:
+            remove(rid)
+
+    def key_of(self, column):
+        # Map a column reference onto a view key: "t.col", or a bare name that is unique among the keys
+        if column.qualified() in self.columns:
+            return column.qualified()
+        if column.table is None:
+            owners = [key for key in self.columns if key.split(".", 1)[1] == column.name]
+            if len(owners) == 1:
+                return owners[0]
+            if owners:
+                raise ValueError(f"Ambiguous column: {column.name}")
+        raise ValueError(f"Unknown column: {column.qualified()}")
+
+    def base_column(self, key):
+        owner, col = key.split(".", 1)
+        return (self.left if owner == self.left.name else self.right), col
+
+    def type_of(self, key):
+        table, col = self.base_column(key)
+        return table.columns.get(col)
+
+    def scan(self):
+        for row in self.rows.values():
+            yield dict(row)
+
+    def create_index(self, name, key):
+        if name in self.indexes:
+            raise ValueError(f"Index {name} already exists")
+        index = SortedIndex(name, key)
+        index.build((row[key], row_code(row_key)) for row_key, row in self.rows.items())
+        self.indexes[name] = index
+
+    def ordered_index_on(self, key):
+        for index in self.indexes.values():
+            if index.column == key:
+                return index
+        return None
+
+    def fetch(self, codes):
+        # Rows for the packed keys an index scan yields
+        rows = self.rows
+        for code in codes:
+            yield dict(rows[row_key(code)])
+
+
+class PreparedStatement:
+    def __init__(self, db, statement, parse_time=0.0):
+        self.db = db
+        self.statement = statement
+        self.kind = statement.kind
+        self.param_count = statement.param_count
+        # The time prepare() took is charged to the statement's first run
+        self.parse_time = parse_time
+
+    def _take_parse_time(self):
+        parse_time, self.parse_time = self.parse_time, 0.0
+        return parse_time
+
+    def execute(self, params=()):
+        if len(params) != self.param_count:
+            raise ValueError(f"Expected {self.param_count} parameter(s), got {len(params)}")
+        return self.db.run(self.statement, params, self._take_parse_time())
+
+    def stream(self, params=()):
+        if len(params) != self.param_count:
+            raise ValueError(f"Expected {self.param_count} parameter(s), got {len(params)}")
+        return self.db.stream(self.statement, params, self._take_parse_time())
+
+    def etag(self, params=()):
+        return self.db.etag(self.statement, params)
 
 
 class Database:
-    def __init__(self):
+    def __init__(self, path=None, plan_cache_size=256, storage="columnar",
+                 sync_every=64, sync_interval=0.05, synchronous_commit=True, checkpoint_bytes=64 * 1024 * 1024,
+                 result_cache_bytes=32 * 1024 * 1024, slow_query_log=None, slow_query_ms=100,
+                 trace_memory=False, parallel_workers=0, parallel_min_rows=100_000, buffer_pool_pages=4096):
         self.tables = {}
+        self.views = {}
+        self.plan_cache = LRUCache(plan_cache_size)
+        # SELECT results by statement text and parameters; 0 turns the cache off
+        self.result_cache = ResultCache(result_cache_bytes) if result_cache_bytes else None
+        # Table versions restart at zero with the process, so validators also carry an instance id
+        self.epoch = os.urandom(8).hex()
+        self.storage = storage
+        # With a data directory every mutation goes to a write-ahead log, and the
+        # log is folded into a snapshot once it grows past checkpoint_bytes. A
+        # statement returns once its records are on disk, unless synchronous_commit
+        # is off (see wal.WriteAheadLog)
+        self.path = path
+        self.log = None
+        self.checkpoint_bytes = checkpoint_bytes
+        self.checkpoint_due = False
+        # Concurrency: every table name has a reader/writer lock, and a statement
+        # takes the locks of all the tables it touches up front, in name order,
+        # so no two statements can deadlock. The catalog lock serializes table
+        # creation against checkpoints.
+        self.locks = {}
+        self.locks_guard = threading.Lock()
+        self.catalog = RWLock()
+        self.held = threading.local()
+        # Open StreamCursors, drained by the first writer to one of their tables
+        self.streams = set()
+        self.streams_guard = threading.Lock()
+        # Instrumentation: while any hook is registered, every SQL statement is
+        # recorded in a metrics.QueryStats and passed to each hook when it ends
+        self.hooks = []
+        self.recording = threading.local()
+        if slow_query_log:
+            self.add_hook(metrics.SlowQueryLog(slow_query_log, slow_query_ms / 1000))
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # Opt-in parallel execution: filters, aggregates and hash joins over columnar
+        # tables of at least parallel_min_rows rows may run in parallel_workers processes
+        self.parallel = None
+        if parallel_workers:
+            self.parallel = parallel.ParallelExecutor(parallel_workers, parallel_min_rows)
+            atexit.register(self.parallel.close)
+            # Started now, while usually no other thread runs yet and workers can be forked
+            self.parallel.start()
+        # Pages of "paged" tables held in memory; their data files sit in the
+        # data directory, or are temporary files without one
+        self.buffer_pool = pager.BufferPool(buffer_pool_pages, path)
+        if path:
+            self._recover(sync_every, sync_interval, synchronous_commit)
+            atexit.register(self.close)
+
+    def _snapshot_path(self):
+        return os.path.join(self.path, "snapshot.db")
+
+    def _log_path(self):
+        return os.path.join(self.path, "wal.log")
+
+    def _recover(self, sync_every, sync_interval, synchronous_commit):
+        os.makedirs(self.path, exist_ok=True)
+        lsn = 0
+        snapshot = wal.read_snapshot(self._snapshot_path())
+        if snapshot is not None:
+            lsn = snapshot["lsn"]
+            for state in snapshot["tables"]:
+                table = Table.load(state, self.buffer_pool)
+                self.tables[table.name] = table
+            for name, text, *indexes in snapshot.get("views", ()):
+                self._create_view(name, text)
+                for index_name, key in (indexes[0] if indexes else ()):
+                    self.views[name].create_index(index_name, key)
+
+        records, end = wal.read_log(self._log_path())
+        # Consecutive bulk-load chunks share one loader so indexes are built once per load
+        loaders = {}
+        for record in records:
+            # Records at or below the snapshot LSN are already in the snapshot
+            if record[0] <= lsn:
+                continue
+            op = record[1]
+            if op in ("insert_many", "insert_columns"):
+                table_name = record[2]
+                if table_name not in loaders:
+                    loaders[table_name] = BulkLoader(self.tables[table_name])
+                if op == "insert_many":
+                    loaders[table_name].add(record[3])
+                else:
+                    loaders[table_name].add_columns(record[3])
+            else:
+                for loader in loaders.values():
+                    loader.finish()
+                loaders = {}
+                self._apply(record[1:])
+            lsn = record[0]
+        for loader in loaders.values():
+            loader.finish()
+        if os.path.exists(self._log_path()):
+            os.truncate(self._log_path(), end)
+        self.log = wal.WriteAheadLog(self._log_path(), lsn, sync_every, sync_interval, synchronous_commit)
+
+    def _apply(self, record):
+        op, args = record[0], record[1:]
+        if op == "create_table":
+            name, columns, primary_key, unique_keys, storage, *options = args
+            self.tables[name] = Table(name, columns, primary_key, unique_keys, storage, *options, pool=self.buffer_pool)
+        elif op == "create_view":
+            self._create_view(*args)
+        elif op == "create_index":
+            index_name, table_name, column, ordered = args
+            if table_name in self.views:
+                self.views[table_name].create_index(index_name, column)
+            else:
+                self.tables[table_name].create_index(index_name, column, ordered)
+        elif op == "insert":
+            self.tables[args[0]].insert(args[1])
+        elif op == "truncate":
+            self.tables[args[0]].truncate(args[1])
+        elif op == "update":
+            self.tables[args[0]].update(args[1], args[2])
+        elif op == "delete":
+            self.tables[args[0]].delete(args[1], auto_compact=False)
+        elif op == "compact":
+            self.tables[args[0]].compact()
+        elif op == "analyze":
+            self.tables[args[0]].stats = stats.TableStats.load(args[1])
+        elif op == "auto_increment":
+            self.tables[args[0]].set_auto_increment(args[1])
+        else:
+            raise ValueError(f"Unknown log record: {op}")
+
+    def _lock(self, name):
+        with self.locks_guard:
+            if name not in self.locks:
+                self.locks[name] = RWLock()
+            return self.locks[name]
+
+    @contextmanager
+    def locked(self, reads=(), writes=()):
+        # Hold shared locks on reads and exclusive locks on writes for the
+        # duration of the block. Reentrant, so callers can group several
+        # statements into one atomic unit (e.g. read the last id, then insert).
+        writes = set(writes)
+        acquired = []
+        self.held.depth = getattr(self.held, "depth", 0) + 1
+        try:
+            for name in sorted(set(reads) | writes):
+                lock = self._lock(name)
+                if name in writes:
+                    lock.acquire_write()
+                    acquired.append(lock.release_write)
+                else:
+                    lock.acquire_read()
+                    acquired.append(lock.release_read)
+            if writes and self.streams:
+                self._drain_streams(writes)
+            yield
+        finally:
+            try:
+                # The outermost block commits what it logged before anyone
+                # else can see it
+                if self.held.depth == 1:
+                    self._commit()
+            finally:
+                for release in reversed(acquired):
+                    release()
+                self.held.depth -= 1
+        # An automatic checkpoint needs every table, so it waits until this
+        # thread has let go of all of its locks
+        if self.checkpoint_due and not self.held.depth:
+            self.checkpoint()
+
+    def _drain_streams(self, writes):
+        # Streams reading a table that is about to change finish from its
+        # current rows first. A cursor leaves the set only once drained, so a
+        # writer to another of its tables waits for that instead of changing
+        # rows it still reads
+        with self.streams_guard:
+            cursors = [cursor for cursor in self.streams if cursor.reads & writes]
+        for cursor in cursors:
+            cursor.drain()
+        with self.streams_guard:
+            self.streams.difference_update(cursors)
+
+    def insert_many(self, table_name, rows):
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        with self.locked(writes=[table_name]):
+            loader = BulkLoader(self.tables[table_name])
+            loader.add(rows)
+            loader.finish()
+            self._log("insert_many", table_name, rows)
+        return loader.count
+
+    def copy_from(self, table_name, path, file_format=None, header=False, columns=None, chunk_size=50000):
+        # Stream a CSV or JSON-lines file into a table in chunks; the load is all or nothing
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        table = self.tables[table_name]
+        file_format = (file_format or os.path.splitext(path)[1].lstrip(".")).lower()
+        if file_format == "ndjson":
+            file_format = "jsonl"
+        if file_format not in ("csv", "jsonl"):
+            raise ValueError(f"Unsupported COPY format: {file_format}")
+
+        for col in columns or ():
+            if col not in table.columns:
+                raise ValueError(f"Unknown column: {col}")
 
-    def create_table(self, name, columns, primary_key=None, unique_keys=None):
-        if name in self.tables:
-            raise ValueError(f"Table {name} already exists")
-        self.tables[name] = Table(name, columns, primary_key, unique_keys)
+        with self.locked(writes=[table_name]):
+            return self._copy(table, path, file_format, header, columns, chunk_size)
+
+    def _copy(self, table, path, file_format, header, columns, chunk_size):
+        table_name = table.name
+        loader = BulkLoader(table)
+        try:
+            with open(path, newline="") as f:
+                reader = read_csv(f, table, header, columns) if file_format == "csv" else read_jsonl(f, table, columns)
+                while True:
+                    chunk = list(islice(reader, chunk_size))
+                    if not chunk:
+                        break
+                    width = len(table.columns)
+                    if set(map(len, chunk)) != {width}:
+                        bad = next(len(values) for values in chunk if len(values) != width)
+                        raise ValueError(f"Column count mismatch. Expected {width}, got {bad}")
+                    batch = list(zip(*chunk))
+                    if file_format == "csv":
+                        # An empty CSV field is NULL for every column except TEXT
+                        for i, col_type in enumerate(table.columns.values()):
+                            if col_type != "TEXT" and "" in batch[i]:
+                                batch[i] = [None if value == "" else value for value in batch[i]]
+                    loader.add_columns(batch)
+                    self._log("insert_columns", table_name, batch)
+        except Exception:
+            if loader.count:
+                loader.abort()
+                self._log("truncate", table_name, loader.start)
+            raise
+        loader.finish()
+        return loader.count
+
+    def _log(self, *record):
+        if self.log is None:
+            return
+        self.held.commit_lsn = self.log.append(record)
+        if self.log.size() >= self.checkpoint_bytes:
+            self.checkpoint_due = True
+        if not getattr(self.held, "depth", 0):
+            self._commit()
+
+    def _commit(self):
+        # Wait until the records this thread logged are on disk
+        lsn = getattr(self.held, "commit_lsn", None)
+        if lsn is not None:
+            self.held.commit_lsn = None
+            if self.log is not None:
+                self.log.commit(lsn)
+
+    def checkpoint(self):
+        # Write a snapshot of every table and start a fresh log
+        if self.log is None:
+            raise ValueError("Database has no data directory")
+        self.catalog.acquire_write()
+        try:
+            with self.locked(writes=list(self.tables)):
+                self.checkpoint_due = False
+                for table in self.tables.values():
+                    table.compact()
+                state = {
+                    "lsn": self.log.lsn,
+                    "tables": [table.dump() for table in self.tables.values()],
+                    "views": [
+                        (view.name, view.text, [(index.name, index.column) for index in view.indexes.values()])
+                        for view in self.views.values()
+                    ],
+                }
+                wal.write_snapshot(self._snapshot_path(), state)
+                # Pages the snapshot names may not be overwritten from now on
+                self.buffer_pool.checkpointed()
+                self.log.reset()
+        finally:
+            self.catalog.release_write()
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        if self.parallel is not None:
+            self.parallel.close()
+        self.buffer_pool.close()
+
+    def create_table(self, name, columns, primary_key=None, unique_keys=None, storage=None,
+                     auto_increment=None, aggregates=False):
+        storage = storage or self.storage
+        self.catalog.acquire_write()
+        try:
+            if name in self.tables or name in self.views:
+                raise ValueError(f"Table {name} already exists")
+            table = Table(
+                name, columns, primary_key, unique_keys, storage, auto_increment, aggregates, self.buffer_pool,
+            )
+            self.tables[name] = table
+            self._log(
+                "create_table", name, columns, primary_key, table.unique_keys, storage, auto_increment, aggregates
+            )
+        finally:
+            self.catalog.release_write()
+
+    def create_materialized_view(self, name, query):
+        # query is the text of a SELECT over one JOIN; the view is filled now and
+        # then kept current by every insert, update and delete on its two tables
+        statement = sql.parse(query)
+        if statement.kind != "select":
+            raise ValueError("A materialized view must be defined by a SELECT")
+        self.catalog.acquire_write()
+        try:
+            if name in self.tables or name in self.views:
+                raise ValueError(f"Table {name} already exists")
+            names = [statement.table, *(join.table for join in statement.joins)]
+            for table_name in names:
+                self._table(table_name)
+            with self.locked(writes=names):
+                text = sql.normalize(sql.tokenize(query))
+                self._create_view(name, text)
+                self._log("create_view", name, text)
+        finally:
+            self.catalog.release_write()
+
+    def _create_view(self, name, text):
+        statement = sql.parse(text)
+        if len(statement.joins) != 1:
+            raise ValueError("A materialized view must join exactly two tables")
+        if statement.param_count:
+            raise ValueError("A materialized view cannot take parameters")
+        if statement.is_aggregate() or statement.order_by is not None or statement.limit is not None:
+            raise ValueError("A materialized view supports only WHERE and a column list")
+        join = statement.joins[0]
+        if join.table == statement.table:
+            raise ValueError("A materialized view must join two different tables")
+        tables, on_left, on_right = self._join_tables(statement)
+        conditions = self._join_conditions(statement.where, (), tables)
+        keys = None
+        if statement.columns is not None:
+            keys = [self._join_key(col, tables) for col in statement.columns]
+        left, right = tables[statement.table], tables[join.table]
+        view = MaterializedView(name, text, left, right, on_left[1], on_right[1], join.join_type, conditions, keys)
+        left.views.append(view)
+        right.views.append(view)
+        self.views[name] = view
 
     def insert_into(self, table_name, values):
         if table_name not in self.tables:
             raise ValueError(f"Table {table_name} does not exist")
-        self.tables[table_name].insert(values)
+        with self.locked(writes=[table_name]):
+            self.tables[table_name].insert(values)
+            self._log("insert", table_name, list(values))
 
     def select_all_from(self, table_name):
         if table_name not in self.tables:
             raise ValueError(f"Table {table_name} does not exist")
-        return self.tables[table_name].select_all()
+        with self.locked(reads=[table_name]):
+            return self.tables[table_name].select_all()
+
+    def _where(self, where):
+        # WHERE given as {column: value} equalities or as (column, op, value) triples
+        if where is None:
+            return []
+        if isinstance(where, dict):
+            return [(col, "=", value) for col, value in where.items()]
+        return list(where)
+
+    def update(self, table_name, changes, where=None):
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        table = self.tables[table_name]
+        for col in changes:
+            if col not in table.columns:
+                raise ValueError(f"Unknown column: {col}")
+        with self.locked(writes=[table_name]):
+            rids = self._find_rids(table, self._where(where))
+            count = table.update(rids, changes)
+            if count:
+                self._log("update", table_name, rids, changes)
+        return count
+
+    def delete_from(self, table_name, where=None):
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        table = self.tables[table_name]
+        with self.locked(writes=[table_name]):
+            rids = self._find_rids(table, self._where(where))
+            compactions = table.compactions
+            count = table.delete(rids)
+            if count:
+                self._log("delete", table_name, rids)
+            if table.compactions != compactions:
+                self._log("compact", table_name)
+        return count
+
+    def _find_rids(self, table, where):
+        conditions = table.check_conditions(where)
+        start = time.perf_counter()
+        return list(self._track(table.plan_scan(conditions, parallel=self.parallel), start)())
+
+    def create_index(self, index_name, table_name, column, ordered=False):
+        # column may be qualified: "table.column", or for a view the key of one of its columns
+        if table_name in self.views:
+            view = self.views[table_name]
+            if not ordered:
+                raise ValueError("Only ordered indexes can be created on a materialized view")
+            key = view.key_of(sql.ColumnRef(*column.split(".", 1)) if "." in column else sql.ColumnRef(None, column))
+            with self.locked(writes=[view.left.name, view.right.name]):
+                view.create_index(index_name, key)
+                self._log("create_index", index_name, table_name, key, True)
+            return
+        if table_name not in self.tables:
+            raise ValueError(f"Table {table_name} does not exist")
+        if "." in column:
+            owner, column = column.split(".", 1)
+            if owner != table_name:
+                raise ValueError(f"Unknown column: {owner}.{column}")
+        with self.locked(writes=[table_name]):
+            self.tables[table_name].create_index(index_name, column, ordered)
+            self._log("create_index", index_name, table_name, column, ordered)
+
+    def set_auto_increment(self, table_name, column):
+        table = self._table(table_name)
+        with self.locked(writes=[table_name]):
+            table.set_auto_increment(column)
+            self._log("auto_increment", table_name, column)
+
+    def join(self, left_name, right_name, left_col, right_col, join_type="inner"):
+        if join_type not in ("inner", "left"):
+            raise ValueError(f"Unsupported join type: {join_type}")
+        for name in (left_name, right_name):
+            if name not in self.tables:
+                raise ValueError(f"Table {name} does not exist")
+        with self.locked(reads=[left_name, right_name]):
+            left = self.tables[left_name]
+            right = self.tables[right_name]
+            return list(join_rows(left, right, left_col, right_col, join_type))
+
+    def prepare(self, text):
+        start = time.perf_counter()
+        tokens = sql.tokenize(text)
+        key = sql.normalize(tokens)
+        statement = self.plan_cache.get(key)
+        if statement is None:
+            statement = sql.Parser(tokens).parse()
+            statement.normalized = key
+            self.plan_cache.put(key, statement)
+        return PreparedStatement(self, statement, time.perf_counter() - start)
+
+    def execute(self, text, params=()):
+        return self.prepare(text).execute(params)
+
+    def execute_batch(self, items):
+        # Run (text, params) pairs in order as one unit: every statement is
+        # parsed first, then all run holding the locks of every table any of
+        # them touches, so other threads see none or all of the batch. There
+        # is no rollback; an error stops the batch after the statements before it.
+        statements = [(self.prepare(text), tuple(params)) for text, params in items]
+        reads, writes = set(), set()
+        for prepared, _ in statements:
+            read, written = self._footprint(prepared.statement)
+            reads.update(read)
+            writes.update(written)
+        kinds = {prepared.statement.kind for prepared, _ in statements}
+        if not kinds & CATALOG_KINDS:
+            with self.locked(reads, writes):
+                return [prepared.execute(params) for prepared, params in statements]
+        # DDL and CHECKPOINT take the catalog lock, which always comes before
+        # any table lock (as in schema), so the batch takes it first. A view
+        # writes to its base tables, and a CHECKPOINT to every table, including
+        # ones the batch creates
+        self.catalog.acquire_write()
+        try:
+            for prepared, _ in statements:
+                statement = prepared.statement
+                if statement.kind == "create_view":
+                    writes.update([statement.query.table, *(join.table for join in statement.query.joins)])
+            if "checkpoint" in kinds:
+                writes.update(self.tables)
+                writes.update(prepared.statement.name for prepared, _ in statements
+                              if prepared.statement.kind == "create_table")
+            with self.locked(reads, writes):
+                return [prepared.execute(params) for prepared, params in statements]
+        finally:
+            self.catalog.release_write()
+
+    def schema(self):
+        # The catalog as plain data: each table's columns and indexes, and the views
+        self.catalog.acquire_read()
+        try:
+            with self.locked(reads=list(self.tables)):
+                tables = {
+                    name: {
+                        "columns": dict(table.columns),
+                        "primary_key": table.primary_key,
+                        "auto_increment": table.auto_increment,
+                        "indexes": {
+                            index.name: {
+                                "column": index.column, "unique": index.unique,
+                                "ordered": isinstance(index, SortedIndex),
+                            }
+                            for index in table.indexes.values()
+                        },
+                    }
+                    for name, table in self.tables.items()
+                }
+                views = {
+                    name: {
+                        "text": view.text,
+                        "indexes": {
+                            index.name: {"column": index.column, "unique": False, "ordered": True}
+                            for index in view.indexes.values()
+                        },
+                    }
+                    for name, view in self.views.items()
+                }
+        finally:
+            self.catalog.release_read()
+        return {"tables": tables, "views": views}
+
+    def run(self, statement, params=(), parse_time=0.0):
+        # Returns rows for SELECT and EXPLAIN, a row count for INSERT/UPDATE/DELETE and None for DDL
+        handler = getattr(self, f"_run_{statement.kind}")
+        reads, writes = self._footprint(statement)
+        record = self._begin(statement, params, parse_time)
+        try:
+            with self.locked(reads, writes):
+                cache_key = self._cache_key(statement, params) if statement.kind == "select" else None
+                if cache_key is not None:
+                    result = self._cached_select(statement, params, cache_key, reads)
+                else:
+                    result = handler(statement, params)
+        except Exception as e:
+            self._end(record, e)
+            raise
+        if record is not None:
+            record.rows_returned = len(result) if isinstance(result, list) else result or 0
+        self._end(record)
+        return result
+
+    def add_hook(self, hook):
+        # hook(record) is called with the metrics.QueryStats of every statement that finishes
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _begin(self, statement, params, parse_time=0.0):
+        # Start recording a statement on this thread; None when nothing listens
+        if not self.hooks:
+            return None
+        record = metrics.QueryStats(statement.kind, getattr(statement, "normalized", None), params)
+        record.parse_time = parse_time
+        record.outer = getattr(self.recording, "record", None)
+        if tracemalloc.is_tracing():
+            # Process-wide, so concurrent statements inflate each other's figure
+            tracemalloc.reset_peak()
+            record.memory_base = tracemalloc.get_traced_memory()[0]
+        record.clock = time.perf_counter()
+        self.recording.record = record
+        return record
+
+    def _detach(self, record):
+        # A streamed statement outlives the call that started it, so stop it being this thread's current one
+        if record is not None:
+            self.recording.record = record.outer
+
+    def _end(self, record, error=None, execute_time=None):
+        if record is None:
+            return
+        if getattr(self.recording, "record", None) is record:
+            self._detach(record)
+        if execute_time is None:
+            execute_time = time.perf_counter() - record.clock - record.plan_time
+        record.execute_time = max(0.0, execute_time)
+        if error is not None:
+            record.error = f"{type(error).__name__}: {error}"
+        for plan in record.plans:
+            record.count_plan(plan.node)
+        record.plans = []
+        if record.memory_base is not None and tracemalloc.is_tracing():
+            record.memory = tracemalloc.get_traced_memory()[1] - record.memory_base
+        for hook in self.hooks:
+            hook(record)
+
+    def _track(self, plan, start):
+        # Charge planning since start to the statement being recorded, and have
+        # its scan operators count the rows they read
+        record = getattr(self.recording, "record", None)
+        if record is not None:
+            record.plan_time += time.perf_counter() - start
+            for node in plan.node.walk():
+                node.counting = node.scan
+            record.plans.append(plan)
+        return plan
+
+    def _planned(self, statement, params):
+        start = time.perf_counter()
+        return self._track(self._plan_select(statement, params), start)
+
+    def _cache_key(self, statement, params):
+        # Only statements that came through prepare() have a normalized text to key on
+        text = getattr(statement, "normalized", None)
+        if self.result_cache is None or text is None:
+            return None
+        return text, tuple(params)
+
+    def _versions(self, names):
+        return tuple(self._table(name).version for name in names)
+
+    def _cached_select(self, statement, params, cache_key, reads):
+        # Callers get copies, so they can never modify a cached result
+        versions = self._versions(reads)
+        rows = self.result_cache.get(cache_key, versions)
+        if rows is None:
+            rows = self._run_select(statement, params)
+            self.result_cache.put(cache_key, versions, rows)
+        elif getattr(self.recording, "record", None) is not None:
+            self.recording.record.cache_hit = True
+        return [dict(row) for row in rows]
+
+    def etag(self, statement, params=()):
+        # Entity tag for a SELECT result: changes whenever a table it reads
+        # changes, so a client holding it can skip a re-run of the query
+        if statement.kind != "select":
+            raise ValueError("Only SELECT statements have an ETag")
+        reads, _ = self._footprint(statement)
+        text = getattr(statement, "normalized", None) or repr(statement)
+        state = (self.epoch, text, tuple(params), reads, self._versions(reads))
+        return hashlib.sha1(repr(state).encode()).hexdigest()
+
+    def analyze(self, table_name=None):
+        # Collect planner statistics for one table, or every table, into the catalog
+        names = sorted(self.tables) if table_name is None else [table_name]
+        for name in names:
+            self._table(name)
+        with self.locked(reads=names):
+            for name in names:
+                table = self.tables[name]
+                table.stats = stats.analyze(table)
+                self._log("analyze", name, table.stats.dump())
+
+    def statistics(self):
+        # The statistics catalog: what the last ANALYZE of each table found
+        return {name: table.stats for name, table in self.tables.items() if table.stats is not None}
+
+    def explain(self, statement, params=(), analyze=False):
+        # The plan of a SELECT as text lines; with analyze the query also runs
+        # and every operator reports the rows it produced and its time
+        if statement.kind != "select":
+            raise ValueError("Only SELECT statements can be explained")
+        reads, _ = self._footprint(statement)
+        with self.locked(reads):
+            start = time.perf_counter()
+            plan = self._track(self._plan_select(statement, params), start)
+            planned = time.perf_counter()
+            if not analyze:
+                return plan.node.lines()
+            for node in plan.node.walk():
+                node.analyze = True
+            count = 0
+            for _ in plan():
+                count += 1
+            done = time.perf_counter()
+        return plan.node.lines() + [
+            f"Planning time: {(planned - start) * 1000:.3f} ms",
+            f"Execution time: {(done - planned) * 1000:.3f} ms",
+            f"Rows: {count}",
+        ]
+
+    def cache_stats(self):
+        return self.result_cache.stats() if self.result_cache is not None else None
+
+    def stream(self, statement, params=(), parse_time=0.0):
+        # Lazy SELECT: rows are produced as the caller iterates, in chunks,
+        # each under the statement's read locks (see StreamCursor)
+        if statement.kind != "select":
+            raise ValueError("Only SELECT statements can be streamed")
+        reads, _ = self._footprint(statement)
+        record = self._begin(statement, params, parse_time)
+        try:
+            # Planning reads table sizes and indexes, so it runs under the read locks too
+            with self.locked(reads):
+                plan = self._planned(statement, params)
+        except Exception as e:
+            self._end(record, e)
+            raise
+        self._detach(record)
+        return self._locked_rows(reads, plan, self._cache_key(statement, params), record)
+
+    def _locked_rows(self, reads, plan, cache_key=None, record=None):
+        # A recorded stream's execute time is the time spent producing rows,
+        # not the time the consumer holds the iterator
+        error = None
+        elapsed = 0.0
+        cursor = None
+        try:
+            start = time.perf_counter()
+            with self.locked(reads):
+                rows = None
+                if cache_key is not None:
+                    versions = self._versions(reads)
+                    rows = self.result_cache.get(cache_key, versions)
+                if rows is None:
+                    cursor = StreamCursor(reads, plan())
+                    with self.streams_guard:
+                        self.streams.add(cursor)
+            elapsed += time.perf_counter() - start
+            if cursor is None:
+                if record is not None:
+                    record.cache_hit = True
+                    record.rows_returned = len(rows)
+                # Copies, as for _cached_select, made one at a time as they are handed out
+                for row in rows:
+                    yield dict(row)
+                return
+            # A result small enough is kept for the cache as it goes by
+            kept = [] if cache_key is not None else None
+            while True:
+                start = time.perf_counter()
+                if cursor.buffer is None:
+                    with self.locked(reads):
+                        chunk = cursor.chunk()
+                else:
+                    chunk = cursor.chunk()
+                elapsed += time.perf_counter() - start
+                if not chunk:
+                    break
+                if record is not None:
+                    record.rows_returned += len(chunk)
+                if kept is None:
+                    yield from chunk
+                    continue
+                kept.extend(chunk)
+                if len(kept) > STREAM_CACHE_ROWS:
+                    kept = None
+                for row in chunk:
+                    yield dict(row)
+            if kept is not None:
+                self.result_cache.put(cache_key, versions, kept)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if cursor is not None:
+                with self.streams_guard:
+                    self.streams.discard(cursor)
+            self._end(record, error, elapsed)
+
+    def _footprint(self, statement):
+        # (tables read, tables written) by a statement
+        if statement.kind == "select":
+            view = self.views.get(statement.table)
+            if view is not None:
+                # A view changes together with its base tables, so reading it locks them
+                return [view.left.name, view.right.name], []
+            return [statement.table, *(join.table for join in statement.joins)], []
+        if statement.kind == "create_index" and statement.table in self.views:
+            # Building a view's index reads the view, which changes with its base tables
+            view = self.views[statement.table]
+            return [], [view.left.name, view.right.name]
+        if statement.kind in ("insert", "copy", "update", "delete", "create_index", "alter_auto_increment"):
+            return [], [statement.table]
+        if statement.kind == "explain":
+            return self._footprint(statement.query)
+        if statement.kind == "analyze":
+            return (sorted(self.tables) if statement.table is None else [statement.table]), []
+        return [], []
+
+    def _table(self, name):
+        if name not in self.tables:
+            raise ValueError(f"Table {name} does not exist")
+        return self.tables[name]
+
+    def _value(self, expr, params):
+        if isinstance(expr, sql.Param):
+            return params[expr.index]
+        return expr.value
+
+    def _predicate(self, node, params, key_of):
+        # Bind a parsed WHERE conjunct to a (key, op, value) predicate; key_of maps its column references
+        if isinstance(node, sql.Logical):
+            return None, node.op, [self._predicate(part, params, key_of) for part in node.operands]
+        if isinstance(node, sql.Not):
+            return None, "NOT", self._predicate(node.operand, params, key_of)
+        if node.op in ("IN", "NOT IN"):
+            value = [self._value(item, params) for item in node.value]
+        else:
+            value = None if node.value is None else self._value(node.value, params)
+        return key_of(node.column), node.op, value
+
+    def _conditions(self, statement, params):
+        def key_of(column):
+            if column.table not in (None, statement.table):
+                raise ValueError(f"Unknown table: {column.table}")
+            return column.name
+        return [self._predicate(cond, params, key_of) for cond in statement.where]
+
+    def _join_conditions(self, where, params, tables):
+        # WHERE conjuncts over "table.column" keys of joined rows, type-checked against both tables
+        def key_of(column):
+            return self._join_key(column, tables)
+
+        def type_of(key):
+            owner, col = key.split(".", 1)
+            return tables[owner].columns.get(col)
+        return [predicate.check(self._predicate(cond, params, key_of), type_of) for cond in where]
+
+    def _run_create_table(self, statement, params):
+        self.create_table(
+            statement.name, statement.columns, statement.primary_key, statement.unique_keys, statement.storage,
+            statement.auto_increment, statement.aggregates,
+        )
+
+    def _run_checkpoint(self, statement, params):
+        self.checkpoint()
+
+    def _run_create_view(self, statement, params):
+        self.create_materialized_view(statement.name, statement.text)
+
+    def _run_analyze(self, statement, params):
+        self.analyze(statement.table)
+
+    def _run_explain(self, statement, params):
+        return [{"plan": line} for line in self.explain(statement.query, params, statement.analyze)]
+
+    def _run_create_index(self, statement, params):
+        self.create_index(statement.name, statement.table, statement.column, statement.ordered)
+
+    def _run_alter_auto_increment(self, statement, params):
+        self.set_auto_increment(statement.table, statement.column)
+
+    def _run_insert(self, statement, params):
+        table = self._table(statement.table)
+        if statement.columns is not None:
+            for col in statement.columns:
+                if col not in table.columns:
+                    raise ValueError(f"Unknown column: {col}")
+        rows = []
+        for exprs in statement.rows:
+            values = [self._value(expr, params) for expr in exprs]
+            if statement.columns is not None:
+                if len(values) != len(statement.columns):
+                    raise ValueError(f"Column count mismatch. Expected {len(statement.columns)}, got {len(values)}")
+                given = dict(zip(statement.columns, values))
+                values = [given.get(col) for col in table.columns]
+            elif len(values) != len(table.columns):
+                raise ValueError(f"Column count mismatch. Expected {len(table.columns)}, got {len(values)}")
+            rows.append(values)
+        if len(rows) == 1:
+            self.insert_into(statement.table, rows[0])
+            return 1
+        return self.insert_many(statement.table, rows)
+
+    def _run_copy(self, statement, params):
+        return self.copy_from(
+            statement.table, self._value(statement.path, params), statement.file_format,
+            statement.header, statement.columns,
+        )
+
+    def _run_update(self, statement, params):
+        changes = {col: self._value(expr, params) for col, expr in statement.assignments.items()}
+        return self.update(statement.table, changes, self._conditions(statement, params))
+
+    def _run_delete(self, statement, params):
+        return self.delete_from(statement.table, self._conditions(statement, params))
+
+    def _run_select(self, statement, params):
+        return list(self._planned(statement, params)())
+
+    def _plan_select(self, statement, params):
+        # Check the statement and return the QueryPlan that builds its operator pipeline
+        limit = None if statement.limit is None else int(self._value(statement.limit, params))
+        if statement.table in self.views:
+            return self._plan_view_select(statement, params, limit)
+        if statement.joins:
+            return self._plan_join_select(statement, params, limit)
+
+        table = self._table(statement.table)
+        if statement.is_aggregate():
+            return self._plan_single_aggregate(statement, params, table, limit)
+        order_by = None
+        if statement.order_by is not None:
+            if isinstance(statement.order_by, sql.Aggregate):
+                raise ValueError("Aggregates in ORDER BY need GROUP BY or an aggregate select list")
+            if statement.order_by.table not in (None, statement.table):
+                raise ValueError(f"Unknown table: {statement.order_by.table}")
+            order_by = statement.order_by.name
+        conditions = table.check_conditions(self._conditions(statement, params), order_by)
+        names = None
+        if statement.columns is not None:
+            names = []
+            for col in statement.columns:
+                if col.table not in (None, statement.table) or col.name not in table.columns:
+                    raise ValueError(f"Unknown column: {col.qualified()}")
+                names.append(col.name)
+        scan = table.plan_scan(conditions, order_by, statement.descending, limit, self.parallel)
+        return self._fetch(table, scan, names)
+
+    def _fetch(self, table, scan, names=None):
+        # Row dicts (every column, or names) for the row ids a scan plan yields
+        rows = scan.node.rows
+        return scan.then(
+            f"Fetch from {table.name}", lambda rids: fetch_rows(table, rids, names),
+            None if names is None else ", ".join(names), rows, scan.node.cost + rows * OUTPUT_ROW,
+        )
+
+    def _column_name(self, column, table):
+        if column.table not in (None, table.name) or column.name not in table.columns:
+            raise ValueError(f"Unknown column: {column.qualified()}")
+        return column.name
+
+    def _plan_single_aggregate(self, statement, params, table, limit):
+        conditions = table.check_conditions(self._conditions(statement, params))
+
+        def key_of(column):
+            return self._column_name(column, table)
+
+        def type_of(key):
+            return table.columns[key]
+
+        calls = [col for col in statement.columns or () if isinstance(col, sql.Aggregate)]
+        quick = not conditions and not statement.group_by and all(
+            table.has_quick_aggregate(call.func, call.column and key_of(call.column)) for call in calls
+        )
+        if quick and len(calls) == len(statement.columns):
+            # Whole-table aggregates come from the running totals or an ordered index
+            def produce():
+                return iter([{
+                    call.name(): table.quick_aggregate(call.func, call.column and key_of(call.column))
+                    for call in calls
+                }])
+            detail = ", ".join(call.name() for call in calls)
+            return QueryPlan.source(f"Stored Aggregate on {table.name}", produce, detail, 1, PROBE)
+
+        def source(names):
+            return self._fetch(table, table.plan_scan(conditions), names)
+
+        def partial(group_keys, aggregates):
+            # The workers aggregate a range of rows each, straight from the column buffers
+            if self.parallel is None or not self.parallel.accepts(table):
+                return None
+            work, ordered = table.scan_work(conditions)
+            rows = len(table) * table.selectivity(conditions)
+            work += rows * FILTER_ROW * max(1, len(aggregates))
+            groups = min(rows, stats.DEFAULT_DISTINCT) if group_keys else 1
+            node = PlanNode(
+                f"Parallel {'Hash Aggregate' if group_keys else 'Aggregate'} on {table.name} "
+                f"({self.parallel.workers} workers)",
+                aggregate_detail(group_keys, aggregates, conditions), groups,
+                PARALLEL_SETUP + work / self.parallel.workers + groups * GATHER_ROW, scan=True, examined=len(table),
+            )
+            return QueryPlan(node, lambda: node.measure(self.parallel.aggregate(table, ordered, group_keys, aggregates)))
+        return self._plan_aggregate(statement, limit, source, key_of, type_of, partial)
+
+    def _plan_aggregate(self, statement, limit, source, key_of, type_of, partial=None):
+        # GROUP BY and aggregate functions over the rows of the plan source(keys)
+        # returns; result rows hold the group columns and one key per aggregate.
+        # partial(group keys, aggregates) may offer a plan aggregating in the
+        # parallel workers instead, which is used when it costs less.
+        if statement.columns is None:
+            raise ValueError("SELECT * cannot be combined with GROUP BY")
+        group_keys = [key_of(col) for col in statement.group_by]
+        aggregates = []
+        outputs = []
+        for item in statement.columns:
+            if isinstance(item, sql.Aggregate):
+                key = None if item.column is None else key_of(item.column)
+                if item.func in ("SUM", "AVG") and key is not None and type_of(key) == "TEXT":
+                    raise ValueError(f"{item.func} needs a numeric column: {item.column.qualified()}")
+                aggregates.append((item.name(), item.func, key))
+                outputs.append(item.name())
+            else:
+                key = key_of(item)
+                if key not in group_keys:
+                    raise ValueError(f"Column {item.qualified()} must appear in GROUP BY or in an aggregate")
+                outputs.append(key)
+
+        order_key = None
+        if isinstance(statement.order_by, sql.Aggregate):
+            order_key = statement.order_by.name()
+        elif statement.order_by is not None:
+            if statement.order_by.table is None and statement.order_by.name in outputs:
+                # An aggregate alias
+                order_key = statement.order_by.name
+            else:
+                order_key = key_of(statement.order_by)
+        if order_key is not None and order_key not in outputs and order_key not in group_keys:
+            raise ValueError(f"ORDER BY {order_key} must appear in the select list or GROUP BY")
+
+        inputs = list(dict.fromkeys(group_keys + [key for _, _, key in aggregates if key is not None]))
+        plan = source(inputs)
+        rows = plan.node.rows
+        plan = plan.then(
+            "Hash Aggregate" if group_keys else "Aggregate",
+            lambda rows: aggregate_rows(rows, group_keys, aggregates), aggregate_detail(group_keys, aggregates),
+            min(rows, stats.DEFAULT_DISTINCT) if group_keys else 1,
+            plan.node.cost + rows * FILTER_ROW * max(1, len(aggregates)),
+        )
+        if partial is not None:
+            alternative = partial(group_keys, aggregates)
+            if alternative is not None and alternative.node.cost < plan.node.cost:
+                plan = alternative
+        return finish_rows(plan, order_key, statement.descending, limit, outputs)
+
+    def _plan_view_select(self, statement, params, limit):
+        view = self.views[statement.table]
+        if statement.joins:
+            raise ValueError("A materialized view cannot be joined")
+        conditions = [
+            predicate.check(self._predicate(cond, params, view.key_of), view.type_of) for cond in statement.where
+        ]
+
+        def source(keys=None):
+            total = len(view)
+            plan = QueryPlan.source(f"View Scan on {view.name}", view.scan, rows=total, cost=total * SEQ_ROW, scan=True)
+            if not conditions:
+                return plan
+            # Views keep no statistics, so the filter is costed with the default guesses
+            return plan.then(
+                "Filter", lambda rows: filter_rows(rows, conditions), predicate.describe_all(conditions),
+                total * stats.estimate(conditions),
+                plan.node.cost + total * FILTER_ROW * len(conditions),
+            )
+
+        if statement.is_aggregate():
+            return self._plan_aggregate(statement, limit, source, view.key_of, view.type_of)
+
+        if isinstance(statement.order_by, sql.Aggregate):
+            raise ValueError("Aggregates in ORDER BY need GROUP BY or an aggregate select list")
+        order_key = None if statement.order_by is None else view.key_of(statement.order_by)
+        keys = None if statement.columns is None else [view.key_of(col) for col in statement.columns]
+        # An ordered index on the ORDER BY key, or else on a range-filtered
+        # key, gives the rows in order and stops at the LIMIT
+        candidates = [order_key] if order_key is not None else [
+            col for col, op, _ in conditions if op in predicate.RANGE_OPERATORS
+        ]
+        for key in candidates:
+            index = view.ordered_index_on(key)
+            if index is None:
+                continue
+            bounds, consumed = range_bounds(key, conditions)
+            if order_key is None and not consumed:
+                continue
+            rest = [cond for cond in conditions if cond not in consumed]
+            total = len(view)
+            rows = total * stats.estimate(consumed)
+            descending = statement.descending and order_key is not None
+            plan = QueryPlan.source(
+                f"Index Scan{' Backward' if descending else ''} on {view.name} using {index.name}",
+                lambda: view.fetch(index_scan(index, bounds, descending, nulls=not consumed)),
+                predicate.describe_all(consumed) or None, rows, PROBE + rows * INDEX_ROW, scan=True,
+            )
+            if rest:
+                plan = plan.then(
+                    "Filter", lambda rows: filter_rows(rows, rest), predicate.describe_all(rest),
+                    rows * stats.estimate(rest), plan.node.cost + rows * FILTER_ROW * len(rest),
+                )
+            return finish_rows(plan, None, False, limit, keys)
+        return finish_rows(source(), order_key, statement.descending, limit, keys)
+
+    def _resolve(self, column, tables):
+        # Map a column reference onto the "table.column" key of a joined row
+        if column.table is not None:
+            if column.table not in tables or column.name not in tables[column.table].columns:
+                raise ValueError(f"Unknown column: {column.qualified()}")
+            return column.table, column.name
+        owners = [name for name, table in tables.items() if column.name in table.columns]
+        if not owners:
+            raise ValueError(f"Unknown column: {column.name}")
+        if len(owners) > 1:
+            raise ValueError(f"Ambiguous column: {column.name}")
+        return owners[0], column.name
+
+    def _join_key(self, column, tables):
+        return "{}.{}".format(*self._resolve(column, tables))
+
+    def _join_tables(self, statement):
+        # The two tables of a single-JOIN SELECT and the column each side joins on
+        if len(statement.joins) > 1:
+            raise ValueError("Only one JOIN per SELECT is supported")
+        join = statement.joins[0]
+        left_name, right_name = statement.table, join.table
+        tables = {left_name: self._table(left_name), right_name: self._table(right_name)}
+
+        on_left = self._resolve(join.left, tables)
+        on_right = self._resolve(join.right, tables)
+        if on_left[0] == right_name and on_right[0] == left_name:
+            on_left, on_right = on_right, on_left
+        if on_left[0] != left_name or on_right[0] != right_name:
+            raise ValueError("JOIN condition must compare a column from each table")
+        return tables, on_left, on_right
+
+    def _plan_join_select(self, statement, params, limit):
+        join = statement.joins[0]
+        tables, on_left, on_right = self._join_tables(statement)
+        left, right = tables[statement.table], tables[join.table]
+        conditions = self._join_conditions(statement.where, params, tables)
+        if statement.is_aggregate():
+            def key_of(column):
+                return self._join_key(column, tables)
+
+            def type_of(key):
+                owner, col = key.split(".", 1)
+                return tables[owner].columns[col]
+
+            def source(keys):
+                return self._plan_join(join.join_type, left, right, on_left[1], on_right[1], conditions)[0]
+
+            def partial(group_keys, aggregates):
+                return self._plan_parallel_join_aggregate(
+                    join.join_type, left, right, on_left[1], on_right[1], conditions, group_keys, aggregates,
+                )
+            return self._plan_aggregate(statement, limit, source, key_of, type_of, partial)
+
+        if isinstance(statement.order_by, sql.Aggregate):
+            raise ValueError("Aggregates in ORDER BY need GROUP BY or an aggregate select list")
+        order_key = None if statement.order_by is None else self._join_key(statement.order_by, tables)
+        keys = None if statement.columns is None else [self._join_key(col, tables) for col in statement.columns]
+        plan, ordered = self._plan_join(
+            join.join_type, left, right, on_left[1], on_right[1], conditions, order_key, statement.descending,
+        )
+        return finish_rows(plan, None if ordered else order_key, statement.descending, limit, keys)
+
+    def _push_join_conditions(self, join_type, left, right, conditions):
+        # Split the WHERE conditions of a join into those on one table alone,
+        # checked below the join, and the residual checked on joined rows. A
+        # conjunct on the right table of a LEFT JOIN stays residual: it has to
+        # see the NULL-padded rows.
+        pushed = {left.name: [], right.name: []}
+        residual = []
+        for cond in conditions:
+            owners = {key.split(".", 1)[0] for key in predicate.columns_of(cond)}
+            owner = owners.pop() if len(owners) == 1 else None
+            if owner == left.name or (owner == right.name and join_type == "inner"):
+                pushed[owner].append(predicate.rename(cond, lambda key: key.split(".", 1)[1]))
+            else:
+                residual.append(cond)
+        for table in (left, right):
+            pushed[table.name] = table.check_conditions(pushed[table.name])
+        return pushed, residual
+
+    def _join_rows(self, join_type, outer, inner, outer_col, inner_col, outer_rows, inner_rows):
+        # Estimated joined rows: outer * inner / the larger distinct count of
+        # the two keys, so the estimate is the same whichever side drives
+        inner_keys = inner.distinct(inner_col) or min(len(inner), stats.DEFAULT_DISTINCT)
+        outer_keys = outer.distinct(outer_col) or min(len(outer), stats.DEFAULT_DISTINCT)
+        rows = outer_rows * inner_rows / max(1, inner_keys, outer_keys)
+        if join_type == "left":
+            rows = max(rows, outer_rows)
+        return rows
+
+    def _plan_join(self, join_type, left, right, left_col, right_col, conditions, order_key=None, descending=False):
+        # Cost-based join planning: which table drives the join (either one
+        # for an INNER JOIN, the left one for a LEFT JOIN), and whether each of
+        # its rows probes an index on the other table or a hash table built
+        # from it, or the workers probe their own copy of the hash table over
+        # ranges of it. Returns the QueryPlan of joined rows and whether they
+        # come in order_key order.
+        pushed, residual = self._push_join_conditions(join_type, left, right, conditions)
+        candidates = self._join_candidates(join_type, left, right, left_col, right_col, pushed, order_key, descending)
+        # Joined rows come in the driving table's order, so the side is chosen
+        # on the serial costs alone and the workers only run the join the serial
+        # executor would, keeping the row order the same with or without them
+        driver = self._join_driver(candidates)
+        best = min((c for c in candidates if c[2] is driver), key=lambda c: c[0])
+
+        cost, method, outer, inner, outer_col, inner_col, swapped, outer_scan, inner_scan, rows, ordered = best
+        inner_conditions = pushed[inner.name]
+        if method == "index":
+            index = inner.index_on(inner_col)
+            detail = f"{inner_col} = {outer.name}.{outer_col}"
+            if inner_conditions:
+                detail += " AND " + predicate.describe_all(inner_conditions)
+            hash_node = PlanNode(f"Index Lookup on {inner.name} using {index.name}", detail, scan=True)
+            children = [outer_scan.node, hash_node]
+        elif method == "hash":
+            hash_node = PlanNode("Hash", inner.name, inner_scan.node.rows, inner_scan.node.cost, [inner_scan.node])
+            children = [outer_scan.node, hash_node]
+        elif method == "hash outer":
+            hash_node = PlanNode("Hash", outer.name, outer_scan.node.rows, outer_scan.node.cost, [outer_scan.node])
+            children = [hash_node, inner_scan.node]
+        else:
+            # The workers scan both tables themselves
+            children = []
+        op = {"index": "Index Nested Loop", "parallel": "Parallel Hash Join"}.get(method, "Hash Join")
+        if join_type == "left":
+            op += " Left"
+        if method == "parallel":
+            op += f" ({self.parallel.workers} workers)"
+        node = PlanNode(
+            op, f"{left.name}.{left_col} = {right.name}.{right_col}", rows, cost, children,
+            scan=method == "parallel", examined=len(outer) + len(inner) if method == "parallel" else None,
+        )
+
+        def build():
+            if method == "parallel":
+                _, outer_conditions = outer.scan_work(pushed[outer.name])
+                pairs = self.parallel.join(
+                    outer, outer_col, outer_conditions, inner, inner_col, inner_conditions, join_type == "left",
+                )
+                return node.measure(combine_rows(left, right, pairs, join_type, swapped))
+            outer_rids = outer_scan()
+            if method == "index":
+                test = None
+                if inner_conditions:
+                    test = predicate.compile_filter(inner_conditions, inner.store.getter)
+                pairs = hash_node.count_probes(index_join(outer, inner, outer_col, inner_col, outer_rids, test))
+            else:
+                if inner_conditions:
+                    value = inner.store.value
+                    items = ((rid, value(rid, inner_col)) for rid in inner_scan())
+                else:
+                    # A plain scan reads the join column straight from its buffer
+                    items = inner_scan.node.measure(inner.column_items(inner_col))
+                if method == "hash":
+                    items = hash_node.measure(items)
+                else:
+                    outer_rids = hash_node.measure(outer_rids)
+                pairs = hash_join(outer, outer_col, outer_rids, items, method == "hash outer")
+            return node.measure(combine_rows(left, right, pairs, join_type, swapped))
+
+        plan = QueryPlan(node, build)
+        if residual:
+            plan = plan.then(
+                "Filter", lambda rows: filter_rows(rows, residual), predicate.describe_all(residual),
+                rows * stats.estimate(residual), cost + rows * FILTER_ROW * len(residual),
+            )
+        return plan, ordered
+
+    def _join_candidates(self, join_type, left, right, left_col, right_col, pushed, order_key=None,
+                         descending=False):
+        # Every way to run a join, as (cost, method, outer, inner, outer column,
+        # inner column, swapped, outer scan, inner scan, rows, ordered)
+        sides = [(left, right, left_col, right_col, False)]
+        if join_type == "inner":
+            sides.append((right, left, right_col, left_col, True))
+        candidates = []
+        for outer, inner, outer_col, inner_col, swapped in sides:
+            # The join keeps the driving table's order, so ordering by one of its columns happens before it
+            outer_order = None
+            if order_key is not None and order_key.split(".", 1)[0] == outer.name:
+                outer_order = order_key.split(".", 1)[1]
+            outer_scan = outer.plan_scan(pushed[outer.name], outer_order, descending)
+            inner_conditions = pushed[inner.name]
+            outer_rows = outer_scan.node.rows
+            inner_rows = len(inner) * inner.selectivity(inner_conditions)
+            # Rows per join key in the whole inner table
+            fanout = len(inner) / max(1, inner.distinct(inner_col) or min(len(inner), stats.DEFAULT_DISTINCT))
+            rows = self._join_rows(join_type, outer, inner, outer_col, inner_col, outer_rows, inner_rows)
+            # Each matched outer row is read once and each inner match read and merged into it
+            matched = outer_rows if join_type == "left" else min(outer_rows, rows)
+            finish = matched * OUTPUT_ROW + rows * 2 * OUTPUT_ROW
+            if order_key is not None and outer_order is None:
+                finish += sort_cost(rows)
+
+            methods = []
+            if inner.index_on(inner_col) is not None:
+                probe = PROBE + fanout * (INDEX_ROW + FILTER_ROW * len(inner_conditions))
+                methods.append(("index", None, outer_scan.node.cost + outer_rows * probe))
+            inner_scan = inner.plan_scan(inner_conditions)
+            build = inner_scan.node.cost + outer_scan.node.cost
+            methods.append(("hash", inner_scan, build + inner_rows * BUILD_ROW + outer_rows * PROBE))
+            if join_type == "left":
+                methods.append(("hash outer", inner_scan, build + outer_rows * BUILD_ROW + inner_rows * PROBE))
+            if outer_order is None and self._parallel_join(outer, inner):
+                cost = self._parallel_join_cost(outer, inner, pushed, inner_rows, rows, outer_rows * PROBE)
+                methods.append(("parallel", None, cost))
+            for method, inner_scan, cost in methods:
+                candidates.append((cost + finish, method, outer, inner, outer_col, inner_col, swapped, outer_scan,
+                                   inner_scan, rows, outer_order is not None or order_key is None))
+        return candidates
+
+    def _join_driver(self, candidates):
+        # The table the cheapest serial join is driven by
+        return min((c for c in candidates if c[1] != "parallel"), key=lambda c: c[0])[2]
+
+    def _parallel_join(self, outer, inner):
+        # Whether the workers can run a hash join split over the rows of outer
+        return (
+            self.parallel is not None and outer is not inner
+            and self.parallel.accepts(outer) and self.parallel.shareable(inner)
+        )
+
+    def _parallel_join_cost(self, outer, inner, pushed, inner_rows, results, per_row):
+        # Every worker builds the whole inner hash table and takes a share of
+        # the outer rows, per_row being their cost past the scan; results are
+        # what the workers send back
+        outer_work, _ = outer.scan_work(pushed[outer.name])
+        inner_work, _ = inner.scan_work(pushed[inner.name])
+        return (
+            PARALLEL_SETUP + inner_work + inner_rows * BUILD_ROW
+            + (outer_work + per_row) / self.parallel.workers + results * GATHER_ROW
+        )
+
+    def _plan_parallel_join_aggregate(self, join_type, left, right, left_col, right_col, conditions,
+                                      group_keys, aggregates):
+        # Aggregates over a join computed by the workers as they join, so no
+        # joined row reaches the parent; None when they cannot run it
+        pushed, residual = self._push_join_conditions(join_type, left, right, conditions)
+        if residual:
+            return None
+        # The workers split the table the serial join is driven by, so groups
+        # are first seen, and come out, in the same order as serially
+        outer, inner, outer_col, inner_col = left, right, left_col, right_col
+        if self._join_driver(self._join_candidates(join_type, left, right, left_col, right_col, pushed)) is right:
+            outer, inner, outer_col, inner_col = right, left, right_col, left_col
+        if not self._parallel_join(outer, inner):
+            return None
+        owners = {}
+        for key in [*group_keys, *(column for _, _, column in aggregates)]:
+            if key is not None:
+                owner, column = key.split(".", 1)
+                owners[key] = ("outer" if owner == outer.name else "inner", column)
+
+        outer_rows = len(outer) * outer.selectivity(pushed[outer.name])
+        inner_rows = len(inner) * inner.selectivity(pushed[inner.name])
+        rows = self._join_rows(join_type, outer, inner, outer_col, inner_col, outer_rows, inner_rows)
+        groups = min(rows, stats.DEFAULT_DISTINCT) if group_keys else 1
+        per_row = outer_rows * PROBE + rows * FILTER_ROW * max(1, len(aggregates))
+        cost = self._parallel_join_cost(outer, inner, pushed, inner_rows, groups, per_row)
+        op = f"Parallel Hash Join{' Left' if join_type == 'left' else ''}"
+        op += f" {'Hash Aggregate' if group_keys else 'Aggregate'} ({self.parallel.workers} workers)"
+        node = PlanNode(
+            op, f"{left.name}.{left_col} = {right.name}.{right_col}; {aggregate_detail(group_keys, aggregates)}",
+            groups, cost, scan=True, examined=len(outer) + len(inner),
+        )
+
+        def produce():
+            _, outer_conditions = outer.scan_work(pushed[outer.name])
+            return node.measure(self.parallel.join(
+                outer, outer_col, outer_conditions, inner, inner_col, pushed[inner.name], join_type == "left",
+                (group_keys, aggregates, owners),
+            ))
+        return QueryPlan(node, produce)
@@ -1,186 +1,92 @@
 # repl.py
+import os
+
 from rdbms import Database
-import ast
+from sql import split_statements
+
+# Data survives restarts in RDBMS_DATA_DIR; set it to an empty string for an in-memory database.
+# Statements slower than RDBMS_SLOW_QUERY_MS are appended to the RDBMS_SLOW_QUERY_LOG file.
+# RDBMS_PARALLEL_WORKERS worker processes share large scans, aggregates and joins.
+# RDBMS_BUFFER_POOL_PAGES bounds the pages of STORAGE PAGED tables kept in memory.
+db = Database(
+    os.environ.get("RDBMS_DATA_DIR", "rdbms_data"),
+    slow_query_log=os.environ.get("RDBMS_SLOW_QUERY_LOG"),
+    slow_query_ms=float(os.environ.get("RDBMS_SLOW_QUERY_MS", "100")),
+    parallel_workers=int(os.environ.get("RDBMS_PARALLEL_WORKERS", "0")),
+    buffer_pool_pages=int(os.environ.get("RDBMS_BUFFER_POOL_PAGES", "4096")),
+)
+
+# With \timing on, each statement's statistics are printed after its result
+records = []
+
+
+def set_timing(on):
+    if on and records.append not in db.hooks:
+        db.add_hook(records.append)
+    elif not on and records.append in db.hooks:
+        db.remove_hook(records.append)
+    print(f"Timing is {'on' if on else 'off'}.")
+
+
+def meta_command(line):
+    words = line.split()
+    if words[0] == "\\timing":
+        if len(words) > 1 and words[1].lower() in ("on", "off"):
+            set_timing(words[1].lower() == "on")
+        else:
+            set_timing(records.append not in db.hooks)
+    else:
+        print(f"Unknown command: {words[0]}")
 
-db = Database()
 
-def execute(command):
-    cmd_lower = command.strip().lower()
+def print_timing():
+    while records:
+        print(records.pop(0).summary())
 
-    # CREATE TABLE
-    if cmd_lower.startswith("create table"):
-        try:
-            parts = command.split("(")
-            table_name = parts[0].split()[2].strip()
-            cols_part = parts[1].split(")")[0]
-            cols = {}
-            primary_key = None
-            unique_keys = []
-
-            for col_def in cols_part.split(","):
-                tokens = col_def.strip().split()
-                col_name = tokens[0]
-                col_type = tokens[1].upper()
-                cols[col_name] = col_type
-                if "PRIMARY" in col_def.upper():
-                    primary_key = col_name
-                if "UNIQUE" in col_def.upper():
-                    unique_keys.append(col_name)
-
-            if table_name in db.tables:
-                print(f"Error: Table '{table_name}' already exists")
-            else:
-                db.create_table(table_name, cols, primary_key, unique_keys)
-                print(f"Table '{table_name}' created successfully")
-        except Exception as e:
-            print("Error:", e)
-
-    # INSERT INTO
-    elif cmd_lower.startswith("insert into"):
-        try:
-            table_name = command.split()[2].strip()
-            values_index = command.lower().find("values")
-            if values_index == -1:
-                raise ValueError("INSERT must have VALUES clause")
-
-            values_part = command[values_index + len("values"):].strip()
-            if values_part.endswith(";"):
-                values_part = values_part[:-1]
-            if values_part.startswith("(") and values_part.endswith(")"):
-                values_part = values_part[1:-1].strip()
-
-            values = ast.literal_eval(f"[{values_part}]")
-            table_columns = list(db.tables[table_name].columns.keys())
-            if len(values) != len(table_columns):
-                raise ValueError(f"Column count mismatch. Expected {len(table_columns)}, got {len(values)}")
-
-            db.insert_into(table_name, values)
-            print("Row inserted successfully")
-        except Exception as e:
-            print("Error:", e)
-
-    # SELECT * FROM (with optional INNER/LEFT JOIN)
-    elif cmd_lower.startswith("select * from"):
-        try:
-            command_clean = command.strip().rstrip(";")
-            if "join" in cmd_lower:
-                # Detect JOIN type
-                join_type = "inner"
-                if "left join" in cmd_lower:
-                    join_type = "left"
-                    join_pos = cmd_lower.find("left join")
-                    join_keyword_len = len("left join")
-                else:
-                    join_pos = cmd_lower.find(" join")
-                    join_keyword_len = len("join")
-
-                tokens = command_clean.split()
-                table1 = tokens[3]
-                table2 = tokens[join_pos + join_keyword_len:].strip().split()[0]
-
-                # Parse ON clause
-                on_index = [i for i, t in enumerate(tokens) if t.upper() == "ON"][0]
-                left_col = tokens[on_index + 1]
-                right_col = tokens[on_index + 3]
-
-                left_table, left_col = left_col.split(".")
-                right_table, right_col = right_col.split(".")
-
-                rows1 = db.select_all_from(table1)
-                rows2 = db.select_all_from(table2)
-
-                joined_rows = []
-                for r1 in rows1:
-                    matched = False
-                    for r2 in rows2:
-                        if str(r1[left_col]) == str(r2[right_col]):
-                            combined = {}
-                            combined.update({f"{table1}.{k}": v for k, v in r1.items()})
-                            combined.update({f"{table2}.{k}": v for k, v in r2.items()})
-                            joined_rows.append(combined)
-                            matched = True
-                    if join_type == "left" and not matched:
-                        combined = {}
-                        combined.update({f"{table1}.{k}": v for k, v in r1.items()})
-                        combined.update({f"{table2}.{k}": None for k in db.tables[table2].columns.keys()})
-                        joined_rows.append(combined)
-
-                for row in joined_rows:
-                    print(row)
-
-            else:
-                # SELECT without JOIN
-                parts = command_clean.lower().split("where")
-                table_name = parts[0].split()[3]
-                rows = db.select_all_from(table_name)
-                if len(parts) > 1:
-                    condition = parts[1].strip()
-                    col, val = [x.strip().strip("'").strip('"') for x in condition.split("=")]
-                    rows = [row for row in rows if str(row.get(col)) == val]
-                for row in rows:
-                    print(row)
-
-        except Exception as e:
-            print("Error:", e)
-
-    # UPDATE
-    elif cmd_lower.startswith("update"):
-        try:
-            set_index = cmd_lower.find("set")
-            table_name = command[6:set_index].strip()
-            where_index = cmd_lower.find("where", set_index)
-            if where_index == -1:
-                set_part = command[set_index + 3:].strip().strip(";")
-                where_part = None
-            else:
-                set_part = command[set_index + 3:where_index].strip()
-                where_part = command[where_index + 5:].strip().strip(";")
-
-            updates = {}
-            for assignment in set_part.split(","):
-                k, v = assignment.split("=")
-                updates[k.strip()] = v.strip().strip("'").strip('"')
-
-            rows = db.select_all_from(table_name)
-            if where_part:
-                w_col, w_val = [x.strip().strip("'").strip('"') for x in where_part.split("=")]
-                rows = [row for row in rows if str(row.get(w_col)) == w_val]
-
-            for row in rows:
-                for k, v in updates.items():
-                    row[k] = v
-
-            print(f"{len(rows)} row(s) updated")
-        except Exception as e:
-            print("Error:", e)
-
-    # DELETE
-    elif cmd_lower.startswith("delete from"):
-        try:
-            table_name = command.split()[2].strip()
-            where_index = cmd_lower.find("where")
-            rows = db.select_all_from(table_name)
-            if where_index == -1:
-                to_delete = rows[:]
-            else:
-                where_part = command[where_index + 5:].strip().strip(";")
-                col, val = [x.strip().strip("'").strip('"') for x in where_part.split("=")]
-                to_delete = [row for row in rows if str(row.get(col)) == val]
-
-            for row in to_delete:
-                rows.remove(row)
-
-            print(f"{len(to_delete)} row(s) deleted")
-        except Exception as e:
-            print("Error:", e)
+
+def execute(command, params=()):
+    cmd_lower = command.strip().lower()
 
     # EXIT
-    elif cmd_lower in ["exit", "quit"]:
+    if cmd_lower in ["exit", "quit"]:
         print("Exiting REPL...")
         exit(0)
 
-    else:
-        print("Command not recognized.")
+    try:
+        stmt = db.prepare(command)
+        if stmt.kind == "select":
+            # Rows are printed as the executor produces them
+            for row in stmt.stream(params):
+                print(row)
+            print_timing()
+            return
+        result = stmt.execute(params)
+    except Exception as e:
+        print("Error:", e)
+        print_timing()
+        return
+
+    statement = stmt.statement
+    if stmt.kind == "create_table":
+        print(f"Table '{statement.name}' created successfully")
+    elif stmt.kind == "create_index":
+        print(f"Index '{statement.name}' created on {statement.table}({statement.column})")
+    elif stmt.kind == "insert":
+        print("Row inserted successfully" if result == 1 else f"{result} rows inserted successfully")
+    elif stmt.kind == "copy":
+        print(f"{result} row(s) copied")
+    elif stmt.kind == "update":
+        print(f"{result} row(s) updated")
+    elif stmt.kind == "delete":
+        print(f"{result} row(s) deleted")
+    elif stmt.kind == "checkpoint":
+        print("Checkpoint written")
+    elif stmt.kind == "analyze":
+        print("Statistics collected")
+    elif stmt.kind == "explain":
+        for row in result:
+            print(row["plan"])
+    print_timing()
 
 
 def start_repl():
@@ -191,13 +97,15 @@ def start_repl():
         if line.lower() in ["exit", "quit"]:
             print("Exiting REPL...")
             break
+        if line.strip().startswith("\\") and not buffer.strip():
+            meta_command(line.strip())
+            continue
         buffer += " " + line.strip()
-        if ";" in buffer:
-            commands = buffer.split(";")
-            for cmd in commands[:-1]:
-                if cmd.strip():
-                    execute(cmd.strip())
-            buffer = commands[-1]
+        commands = split_statements(buffer)
+        for cmd in commands[:-1]:
+            if cmd.strip():
+                execute(cmd.strip())
+        buffer = commands[-1]
 
 
 if __name__ == "__main__":
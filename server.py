@@ -0,0 +1,221 @@
+# server.py
+#
+# Hosts one Database for any number of client processes over TCP, speaking
+# the length-prefixed JSON protocol of protocol.py:
+#
+#   python server.py --port 5433          # the database of repl.py (RDBMS_DATA_DIR etc.)
+#
+# Connections are served by one asyncio event loop, and statements run on a
+# thread pool, the engine's table locks keeping them apart. A connection's
+# requests run one after another in arrival order while the next ones are
+# already being read, so pipelined requests never wait for a round trip.
+#
+# COPY ... FROM reads a file on the server's machine, so clients may only run
+# it on files under the --import-dir directory, and not at all without one.
+import argparse
+import asyncio
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import protocol
+import sql
+from metrics import Metrics
+
+
+class Server:
+    def __init__(self, db, host="127.0.0.1", port=5433, threads=8, pipeline=64, chunk_rows=protocol.CHUNK_ROWS,
+                 import_dir=None):
+        self.db = db
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="rdbms")
+        self.pipeline = pipeline  # requests read ahead per connection
+        self.chunk_rows = chunk_rows
+        self.import_dir = None if import_dir is None else os.path.realpath(import_dir)
+        self.server = None
+        self.connections = set()
+        # Served to clients by the "metrics" request
+        self.metrics = Metrics()
+        db.add_hook(self.metrics)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.serve, self.host, self.port)
+        # With port 0 the system picked one
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self):
+        self.server.close()
+        for writer in list(self.connections):
+            writer.close()
+        await self.server.wait_closed()
+        self.executor.shutdown()
+        self.db.remove_hook(self.metrics)
+
+    async def serve(self, reader, writer):
+        self.connections.add(writer)
+        loop = asyncio.get_running_loop()
+        pending = asyncio.Queue(self.pipeline)
+        reading = asyncio.ensure_future(self.read_requests(reader, pending))
+        try:
+            while True:
+                request = await pending.get()
+                if request is None:
+                    break
+                # A streamed result's frames are built on the pool one at a time
+                # and each is written before the next, at the pace the client reads
+                frames, rest = await loop.run_in_executor(self.executor, self.handle, request)
+                while True:
+                    writer.writelines(frames)
+                    await writer.drain()
+                    if rest is None:
+                        break
+                    frames, rest = await loop.run_in_executor(self.executor, self.next_frame, rest)
+        except ConnectionError:
+            pass
+        finally:
+            reading.cancel()
+            self.connections.discard(writer)
+            writer.close()
+
+    async def read_requests(self, reader, pending):
+        # Queue the connection's requests as they arrive; None marks its end.
+        # A full queue stops the reading, so a client cannot run ahead without bound.
+        try:
+            while True:
+                header = await reader.readexactly(protocol.HEADER.size)
+                data = await reader.readexactly(protocol.frame_size(header))
+                await pending.put(protocol.decode(data))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            await pending.put(None)
+
+    def handle(self, request):
+        # The response to one request, built on a pool thread: its first frames,
+        # and for a streamed result the iterator of the rest (else None), which
+        # yields (frame, whether it is the last)
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object")
+            handler = getattr(self, f"op_{request.get('op')}", None)
+            if handler is None:
+                raise ValueError(f"Unknown request: {request.get('op')}")
+            frames = handler(request_id, request)
+        except Exception as e:
+            return [self.error_frame(request_id, e)], None
+        if isinstance(frames, list):
+            return frames, None
+        return self.next_frame(frames)
+
+    def next_frame(self, frames):
+        frame, last = next(frames)
+        return [frame], None if last else frames
+
+    def error_frame(self, request_id, error):
+        message = str(error) if isinstance(error, ValueError) else f"{type(error).__name__}: {error}"
+        return protocol.encode({"id": request_id, "error": message})
+
+    def check(self, statement, params):
+        # Refuse a COPY reading anywhere but the import directory
+        if statement.kind != "copy":
+            return
+        if self.import_dir is None:
+            raise ValueError("COPY FROM is not allowed over the network")
+        path = statement.path
+        if isinstance(path, sql.Param):
+            if path.index >= len(params):
+                return  # running it fails on the parameter count
+            path = params[path.index]
+        else:
+            path = path.value
+        path = os.path.realpath(str(path))
+        if os.path.commonpath([path, self.import_dir]) != self.import_dir:
+            raise ValueError("COPY FROM can only read files in the server's import directory")
+
+    def op_execute(self, request_id, request):
+        statement = self.db.prepare(request["sql"])
+        params = tuple(request.get("params", ()))
+        self.check(statement.statement, params)
+        if statement.kind != "select":
+            return [protocol.encode({"id": request_id, **protocol.pack_result(statement.execute(params))})]
+        return self.stream_frames(request_id, statement.stream(params))
+
+    def stream_frames(self, request_id, rows):
+        # Frames of a SELECT's rows, each encoded once its chunk has filled;
+        # one row of look-ahead tells whether another frame follows. A failure
+        # ends the response with an error frame, after any sent marked "more".
+        try:
+            rows = iter(rows)
+            chunk = list(islice(rows, self.chunk_rows))
+            columns = list(chunk[0]) if chunk else []
+            while True:
+                following = next(rows, None)
+                yield protocol.encode({
+                    "id": request_id, "columns": columns, "rows": [list(row.values()) for row in chunk],
+                    "more": following is not None,
+                }), following is None
+                if following is None:
+                    return
+                chunk = [following, *islice(rows, self.chunk_rows - 1)]
+        except Exception as e:
+            yield self.error_frame(request_id, e), True
+
+    def op_batch(self, request_id, request):
+        for text, params in request["statements"]:
+            self.check(self.db.prepare(text).statement, tuple(params))
+        results = self.db.execute_batch(request["statements"])
+        return [protocol.encode({"id": request_id, "results": [protocol.pack_result(r) for r in results]})]
+
+    def op_prepare(self, request_id, request):
+        statement = self.db.prepare(request["sql"])
+        return [protocol.encode({"id": request_id, "kind": statement.kind, "params": statement.param_count})]
+
+    def op_etag(self, request_id, request):
+        etag = self.db.prepare(request["sql"]).etag(tuple(request.get("params", ())))
+        return [protocol.encode({"id": request_id, "result": etag})]
+
+    def op_schema(self, request_id, request):
+        return [protocol.encode({"id": request_id, "result": self.db.schema()})]
+
+    def op_metrics(self, request_id, request):
+        return [protocol.encode({"id": request_id, "result": self.metrics.render()})]
+
+    def op_ping(self, request_id, request):
+        return [protocol.encode({"id": request_id, "result": "pong"})]
+
+
+async def main(args):
+    from repl import db
+
+    server = await Server(db, args.host, args.port, args.threads, import_dir=args.import_dir).start()
+    print(f"Serving on {server.host}:{server.port}")
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except NotImplementedError:
+            pass
+    serving = asyncio.ensure_future(server.serve_forever())
+    try:
+        await stop.wait()
+    finally:
+        serving.cancel()
+        await server.stop()
+        # Flushes the write-ahead log
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the database over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5433)
+    parser.add_argument("--threads", type=int, default=8, help="statements run at once")
+    parser.add_argument("--import-dir", help="directory clients may COPY FROM (COPY is refused without one)")
+    asyncio.run(main(parser.parse_args()))
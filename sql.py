@@ -0,0 +1,633 @@
+# sql.py
+import re
+
+# Reserved words, never names
+KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "AND", "ORDER", "BY", "LIMIT", "INSERT", "INTO",
+    "VALUES", "UPDATE", "SET", "DELETE", "CREATE", "ON", "JOIN", "NULL",
+    "BETWEEN", "CHECKPOINT", "COPY", "GROUP", "AS", "OR", "NOT", "IN", "IS",
+    "LIKE", "EXPLAIN", "ANALYZE", "ALTER",
+}
+
+# Words that are keywords only where the grammar expects them and names
+# everywhere else, so tables and columns such as key, index or header stay valid
+CONTEXTUAL_KEYWORDS = {
+    "TABLE", "INDEX", "ORDERED", "PRIMARY", "KEY", "UNIQUE", "AUTO_INCREMENT",
+    "STORAGE", "WITH", "AGGREGATES", "MATERIALIZED", "VIEW", "MODIFY", "CSV",
+    "JSONL", "HEADER", "ASC", "DESC", "INNER", "LEFT", "OUTER",
+}
+
+AGGREGATE_FUNCTIONS = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
+
+TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>-?\d+(?:\.\d+)?)
+  | (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+  | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<op><=|>=|!=|<>|[=<>(),;*.?])
+""", re.VERBOSE)
+
+
+class Token:
+    def __init__(self, kind, value, text):
+        self.kind = kind
+        self.value = value
+        self.text = text
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.value!r})"
+
+
+def tokenize(sql):
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        match = TOKEN_RE.match(sql, pos)
+        if not match:
+            raise ValueError(f"Unexpected character at position {pos}: {sql[pos]!r}")
+        kind = match.lastgroup
+        text = match.group()
+        pos = match.end()
+        if kind == "space":
+            continue
+        if kind == "number":
+            value = float(text) if "." in text else int(text)
+        elif kind == "string":
+            quote = text[0]
+            value = text[1:-1].replace(quote * 2, quote)
+        elif kind == "name" and text.upper() in KEYWORDS:
+            kind, value, text = "keyword", text.upper(), text.upper()
+        elif kind == "name" and text == "None":
+            # The old REPL evaluated values as Python literals
+            kind, value, text = "keyword", "NULL", "NULL"
+        elif kind == "op" and text == "<>":
+            value = text = "!="
+        else:
+            value = text
+        tokens.append(Token(kind, value, text))
+    while tokens and tokens[-1].kind == "op" and tokens[-1].value == ";":
+        tokens.pop()
+    return tokens
+
+
+def normalize(tokens):
+    # Canonical statement text: reserved words upper-cased, whitespace collapsed, names and literals kept verbatim
+    return " ".join(token.text for token in tokens)
+
+
+def split_statements(text):
+    # Split on semicolons outside string literals; the last element is the unterminated remainder
+    statements = []
+    start = 0
+    quote = None
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == ";":
+            statements.append(text[start:i])
+            start = i + 1
+    statements.append(text[start:])
+    return statements
+
+
+class Node:
+    def __eq__(self, other):
+        return type(self) is type(other) and self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={v!r}" for k, v in self.__dict__.items())
+        return f"{type(self).__name__}({fields})"
+
+
+class Literal(Node):
+    def __init__(self, value):
+        self.value = value
+
+
+class Param(Node):
+    def __init__(self, index):
+        self.index = index
+
+
+class ColumnRef(Node):
+    def __init__(self, table, name):
+        self.table = table
+        self.name = name
+
+    def qualified(self):
+        return f"{self.table}.{self.name}" if self.table else self.name
+
+
+class Aggregate(Node):
+    def __init__(self, func, column, alias=None):
+        self.func = func
+        self.column = column  # None for COUNT(*)
+        self.alias = alias
+
+    def name(self):
+        # Key of the aggregate in result rows
+        if self.alias:
+            return self.alias
+        return f"{self.func}({'*' if self.column is None else self.column.qualified()})"
+
+
+class Condition(Node):
+    def __init__(self, column, op, value):
+        self.column = column
+        self.op = op
+        self.value = value  # a list of values for IN, None for IS NULL
+
+
+class Logical(Node):
+    def __init__(self, op, operands):
+        self.op = op  # AND or OR
+        self.operands = operands
+
+
+class Not(Node):
+    def __init__(self, operand):
+        self.operand = operand
+
+
+class Join(Node):
+    def __init__(self, join_type, table, left, right):
+        self.join_type = join_type
+        self.table = table
+        self.left = left
+        self.right = right
+
+
+class CreateTable(Node):
+    kind = "create_table"
+
+    def __init__(self, name, columns, primary_key, unique_keys, storage=None, auto_increment=None, aggregates=False):
+        self.name = name
+        self.columns = columns
+        self.primary_key = primary_key
+        self.unique_keys = unique_keys
+        self.storage = storage
+        self.auto_increment = auto_increment
+        self.aggregates = aggregates
+
+
+class CreateIndex(Node):
+    kind = "create_index"
+
+    def __init__(self, name, table, column, ordered):
+        self.name = name
+        self.table = table
+        self.column = column
+        self.ordered = ordered
+
+
+class CreateView(Node):
+    kind = "create_view"
+
+    def __init__(self, name, query, text):
+        self.name = name
+        self.query = query
+        self.text = text  # normalized SELECT text, kept so the view can be recreated
+
+
+class AlterAutoIncrement(Node):
+    kind = "alter_auto_increment"
+
+    def __init__(self, table, column):
+        self.table = table
+        self.column = column
+
+
+class Insert(Node):
+    kind = "insert"
+
+    def __init__(self, table, columns, rows):
+        self.table = table
+        self.columns = columns
+        self.rows = rows
+
+
+class Copy(Node):
+    kind = "copy"
+
+    def __init__(self, table, columns, path, file_format, header):
+        self.table = table
+        self.columns = columns
+        self.path = path
+        self.file_format = file_format
+        self.header = header
+
+
+class Select(Node):
+    kind = "select"
+
+    def __init__(self, table, columns, joins, where, order_by, descending, limit, group_by=None):
+        self.table = table
+        self.columns = columns
+        self.joins = joins
+        self.where = where
+        self.order_by = order_by
+        self.descending = descending
+        self.limit = limit
+        self.group_by = group_by or []
+
+    def is_aggregate(self):
+        return bool(self.group_by) or any(isinstance(col, Aggregate) for col in self.columns or ())
+
+
+class Update(Node):
+    kind = "update"
+
+    def __init__(self, table, assignments, where):
+        self.table = table
+        self.assignments = assignments
+        self.where = where
+
+
+class Delete(Node):
+    kind = "delete"
+
+    def __init__(self, table, where):
+        self.table = table
+        self.where = where
+
+
+class Checkpoint(Node):
+    kind = "checkpoint"
+
+
+class Analyze(Node):
+    kind = "analyze"
+
+    def __init__(self, table):
+        self.table = table  # None analyzes every table
+
+
+class Explain(Node):
+    kind = "explain"
+
+    def __init__(self, query, analyze):
+        self.query = query
+        self.analyze = analyze
+
+
+class Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.param_count = 0
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token is None:
+            return None
+        if kind == "keyword" and value in CONTEXTUAL_KEYWORDS:
+            matched = token.kind == "name" and token.value.upper() == value
+        else:
+            matched = token.kind == kind and (value is None or token.value == value)
+        if matched:
+            self.pos += 1
+            return token
+        return None
+
+    def expect(self, kind, value=None):
+        token = self.accept(kind, value)
+        if token is None:
+            found = self.peek()
+            wanted = value or kind
+            raise ValueError(f"Expected {wanted} but found {found.text if found else 'end of statement'}")
+        return token
+
+    def keyword(self, *words):
+        for word in words:
+            self.expect("keyword", word)
+
+    def name(self):
+        return self.expect("name").value
+
+    def parse(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("Empty statement")
+        handlers = {
+            "CREATE": self.parse_create,
+            "ALTER": self.parse_alter,
+            "INSERT": self.parse_insert,
+            "SELECT": self.parse_select,
+            "UPDATE": self.parse_update,
+            "DELETE": self.parse_delete,
+            "CHECKPOINT": self.parse_checkpoint,
+            "COPY": self.parse_copy,
+            "ANALYZE": self.parse_analyze,
+            "EXPLAIN": self.parse_explain,
+        }
+        if token.kind != "keyword" or token.value not in handlers:
+            raise ValueError(f"Command not recognized: {token.text}")
+        statement = handlers[token.value]()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected {self.peek().text} at end of statement")
+        statement.param_count = self.param_count
+        return statement
+
+    def parse_create(self):
+        self.keyword("CREATE")
+        if self.accept("keyword", "TABLE"):
+            return self.parse_create_table()
+        if self.accept("keyword", "MATERIALIZED"):
+            # CREATE MATERIALIZED VIEW name AS SELECT ...
+            self.keyword("VIEW")
+            name = self.name()
+            self.keyword("AS")
+            start = self.pos
+            query = self.parse_select()
+            return CreateView(name, query, normalize(self.tokens[start:self.pos]))
+        ordered = bool(self.accept("keyword", "ORDERED"))
+        self.keyword("INDEX")
+        name = self.name()
+        self.keyword("ON")
+        table = self.name()
+        self.expect("op", "(")
+        # A view's columns are qualified by their base table
+        column = self.parse_column().qualified()
+        self.expect("op", ")")
+        return CreateIndex(name, table, column, ordered)
+
+    def parse_alter(self):
+        # ALTER TABLE name MODIFY column AUTO_INCREMENT
+        self.keyword("ALTER", "TABLE")
+        table = self.name()
+        self.keyword("MODIFY")
+        column = self.name()
+        self.keyword("AUTO_INCREMENT")
+        return AlterAutoIncrement(table, column)
+
+    def parse_create_table(self):
+        name = self.name()
+        columns = {}
+        primary_key = None
+        unique_keys = []
+        auto_increment = None
+        self.expect("op", "(")
+        while True:
+            col_name = self.name()
+            columns[col_name] = self.name().upper()
+            while True:
+                if self.accept("keyword", "PRIMARY"):
+                    self.keyword("KEY")
+                    primary_key = col_name
+                elif self.accept("keyword", "UNIQUE"):
+                    unique_keys.append(col_name)
+                elif self.accept("keyword", "AUTO_INCREMENT"):
+                    auto_increment = col_name
+                else:
+                    break
+            if not self.accept("op", ","):
+                break
+        self.expect("op", ")")
+        storage = None
+        if self.accept("keyword", "STORAGE"):
+            # STORAGE COLUMNAR | STORAGE ROWS
+            storage = self.name().lower()
+        aggregates = False
+        if self.accept("keyword", "WITH"):
+            # WITH AGGREGATES keeps running COUNT/SUM/MIN/MAX for the INT columns
+            self.keyword("AGGREGATES")
+            aggregates = True
+        return CreateTable(name, columns, primary_key, unique_keys, storage, auto_increment, aggregates)
+
+    def parse_value(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("Expected a value but found end of statement")
+        if token.kind in ("number", "string"):
+            self.pos += 1
+            return Literal(token.value)
+        if self.accept("keyword", "NULL"):
+            return Literal(None)
+        if self.accept("op", "?"):
+            self.param_count += 1
+            return Param(self.param_count - 1)
+        raise ValueError(f"Expected a value but found {token.text}")
+
+    def parse_column(self):
+        first = self.name()
+        if self.accept("op", "."):
+            return ColumnRef(first, self.name())
+        return ColumnRef(None, first)
+
+    def parse_select_item(self):
+        # A column or an aggregate call such as COUNT(*), SUM(t.col) AS total
+        token = self.peek()
+        after = self.peek(1)
+        if (token is None or token.kind != "name" or token.value.upper() not in AGGREGATE_FUNCTIONS
+                or after is None or after.value != "("):
+            return self.parse_column()
+        self.pos += 2
+        func = token.value.upper()
+        column = None
+        if func != "COUNT" or not self.accept("op", "*"):
+            column = self.parse_column()
+        self.expect("op", ")")
+        alias = self.name() if self.accept("keyword", "AS") else None
+        return Aggregate(func, column, alias)
+
+    def parse_column_list(self):
+        columns = None
+        if self.accept("op", "("):
+            columns = [self.name()]
+            while self.accept("op", ","):
+                columns.append(self.name())
+            self.expect("op", ")")
+        return columns
+
+    def parse_insert(self):
+        self.keyword("INSERT", "INTO")
+        table = self.name()
+        columns = self.parse_column_list()
+        self.keyword("VALUES")
+        rows = []
+        while True:
+            self.expect("op", "(")
+            values = [self.parse_value()]
+            while self.accept("op", ","):
+                values.append(self.parse_value())
+            self.expect("op", ")")
+            rows.append(values)
+            if not self.accept("op", ","):
+                return Insert(table, columns, rows)
+
+    def parse_copy(self):
+        # COPY table [(col, ...)] FROM 'path' [CSV | JSONL] [HEADER]
+        self.keyword("COPY")
+        table = self.name()
+        columns = self.parse_column_list()
+        self.keyword("FROM")
+        path = self.parse_value()
+        file_format = None
+        if self.accept("keyword", "CSV"):
+            file_format = "csv"
+        elif self.accept("keyword", "JSONL"):
+            file_format = "jsonl"
+        header = bool(self.accept("keyword", "HEADER"))
+        return Copy(table, columns, path, file_format, header)
+
+    def parse_where(self):
+        # The WHERE expression split into its top-level AND conjuncts
+        if not self.accept("keyword", "WHERE"):
+            return []
+        conjuncts = []
+        pending = [self.parse_or()]
+        while pending:
+            node = pending.pop(0)
+            if isinstance(node, Logical) and node.op == "AND":
+                pending[:0] = node.operands
+            else:
+                conjuncts.append(node)
+        return conjuncts
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self.accept("keyword", "OR"):
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else Logical("OR", operands)
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while self.accept("keyword", "AND"):
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else Logical("AND", operands)
+
+    def parse_not(self):
+        if self.accept("keyword", "NOT"):
+            return Not(self.parse_not())
+        if self.accept("op", "("):
+            node = self.parse_or()
+            self.expect("op", ")")
+            return node
+        return self.parse_predicate()
+
+    def parse_predicate(self):
+        column = self.parse_column()
+        if self.accept("keyword", "IS"):
+            negate = bool(self.accept("keyword", "NOT"))
+            self.keyword("NULL")
+            return Condition(column, "IS NOT NULL" if negate else "IS NULL", None)
+        negate = bool(self.accept("keyword", "NOT"))
+        if self.accept("keyword", "BETWEEN"):
+            low = self.parse_value()
+            self.keyword("AND")
+            node = Logical("AND", [Condition(column, ">=", low), Condition(column, "<=", self.parse_value())])
+        elif self.accept("keyword", "IN"):
+            self.expect("op", "(")
+            values = [self.parse_value()]
+            while self.accept("op", ","):
+                values.append(self.parse_value())
+            self.expect("op", ")")
+            node = Condition(column, "IN", values)
+        elif self.accept("keyword", "LIKE"):
+            node = Condition(column, "LIKE", self.parse_value())
+        elif negate:
+            token = self.peek()
+            raise ValueError(f"Expected BETWEEN, IN or LIKE after NOT but found {token.text if token else 'end of statement'}")
+        else:
+            op = self.expect("op")
+            if op.value not in ("=", "!=", "<", "<=", ">", ">="):
+                raise ValueError(f"Unsupported operator: {op.text}")
+            return Condition(column, op.value, self.parse_value())
+        if not negate:
+            return node
+        if node.op in ("IN", "LIKE"):
+            return Condition(column, "NOT " + node.op, node.value)
+        return Not(node)
+
+    def parse_select(self):
+        self.keyword("SELECT")
+        columns = None
+        if not self.accept("op", "*"):
+            columns = [self.parse_select_item()]
+            while self.accept("op", ","):
+                columns.append(self.parse_select_item())
+        self.keyword("FROM")
+        table = self.name()
+
+        joins = []
+        while True:
+            if self.accept("keyword", "LEFT"):
+                self.accept("keyword", "OUTER")
+                join_type = "left"
+            elif self.accept("keyword", "INNER"):
+                join_type = "inner"
+            elif self.peek() is not None and self.peek().value == "JOIN":
+                join_type = "inner"
+            else:
+                break
+            self.keyword("JOIN")
+            join_table = self.name()
+            self.keyword("ON")
+            left = self.parse_column()
+            self.expect("op", "=")
+            joins.append(Join(join_type, join_table, left, self.parse_column()))
+
+        where = self.parse_where()
+        group_by = []
+        if self.accept("keyword", "GROUP"):
+            self.keyword("BY")
+            group_by.append(self.parse_column())
+            while self.accept("op", ","):
+                group_by.append(self.parse_column())
+        order_by = None
+        descending = False
+        if self.accept("keyword", "ORDER"):
+            self.keyword("BY")
+            order_by = self.parse_select_item()
+            if self.accept("keyword", "DESC"):
+                descending = True
+            else:
+                self.accept("keyword", "ASC")
+        limit = None
+        if self.accept("keyword", "LIMIT"):
+            limit = self.parse_value()
+        return Select(table, columns, joins, where, order_by, descending, limit, group_by)
+
+    def parse_update(self):
+        self.keyword("UPDATE")
+        table = self.name()
+        self.keyword("SET")
+        assignments = {}
+        while True:
+            column = self.name()
+            self.expect("op", "=")
+            assignments[column] = self.parse_value()
+            if not self.accept("op", ","):
+                break
+        return Update(table, assignments, self.parse_where())
+
+    def parse_delete(self):
+        self.keyword("DELETE", "FROM")
+        table = self.name()
+        return Delete(table, self.parse_where())
+
+    def parse_checkpoint(self):
+        self.keyword("CHECKPOINT")
+        return Checkpoint()
+
+    def parse_analyze(self):
+        # ANALYZE [table]
+        self.keyword("ANALYZE")
+        return Analyze(self.name() if self.peek() is not None else None)
+
+    def parse_explain(self):
+        # EXPLAIN [ANALYZE] SELECT ...
+        self.keyword("EXPLAIN")
+        analyze = bool(self.accept("keyword", "ANALYZE"))
+        return Explain(self.parse_select(), analyze)
+
+
+def parse(sql):
+    return Parser(tokenize(sql)).parse()
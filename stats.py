@@ -0,0 +1,203 @@
+# stats.py
+from bisect import bisect_left, bisect_right
+
+import predicate
+
+HISTOGRAM_BUCKETS = 32
+
+# Selectivity guesses for predicates on columns ANALYZE has not seen
+DEFAULT_DISTINCT = 200
+DEFAULT_RANGE = 1 / 3
+DEFAULT_LIKE = 0.1
+DEFAULT_NULLS = 0.01
+
+
+class ColumnStats:
+    # NULL count, distinct non-NULL values and an equi-depth histogram of one
+    # column. bounds[0] is the minimum and bounds[-1] the maximum, and each of
+    # the len(bounds) - 1 buckets between neighbouring bounds holds about the
+    # same number of values.
+    def __init__(self, count, nulls, distinct, bounds):
+        self.count = count  # non-NULL values
+        self.nulls = nulls
+        self.distinct = distinct
+        self.bounds = bounds
+
+    @classmethod
+    def collect(cls, values):
+        nulls = 0
+        present = []
+        for value in values:
+            if value is None:
+                nulls += 1
+            else:
+                present.append(value)
+        distinct = len(set(present))
+        try:
+            present.sort()
+        except TypeError:
+            # Mixed types in an untyped column have no order to summarize
+            return cls(len(present), nulls, distinct, [])
+        bounds = []
+        if present:
+            buckets = min(HISTOGRAM_BUCKETS, max(1, len(present) - 1))
+            last = len(present) - 1
+            bounds = [present[round(i * last / buckets)] for i in range(buckets + 1)]
+        return cls(len(present), nulls, distinct, bounds)
+
+    def dump(self):
+        return self.count, self.nulls, self.distinct, self.bounds
+
+    @classmethod
+    def load(cls, state):
+        return cls(*state)
+
+    def fraction_below(self, value, inclusive=False):
+        # Estimated fraction of the non-NULL values below value (or at most value)
+        bounds = self.bounds
+        if not bounds:
+            return DEFAULT_RANGE
+        try:
+            if value < bounds[0] or (value == bounds[0] and not inclusive):
+                return 0.0
+            if value > bounds[-1] or (value == bounds[-1] and inclusive):
+                return 1.0
+            i = bisect_right(bounds, value) if inclusive else bisect_left(bounds, value)
+        except TypeError:
+            return DEFAULT_RANGE
+        buckets = len(bounds) - 1
+        low, high = bounds[i - 1], bounds[i]
+        within = 0.5
+        if isinstance(value, (int, float)) and high > low:
+            # Values are assumed evenly spread inside a bucket
+            within = (value - low) / (high - low)
+        return min(1.0, (i - 1 + within) / buckets)
+
+    def selectivity(self, op, value):
+        # Estimated fraction of all rows, NULLs included, for which "column op value" holds
+        total = self.count + self.nulls
+        if not total:
+            return 0.0
+        present = self.count / total
+        if op == "IS NULL":
+            return self.nulls / total
+        if op == "IS NOT NULL":
+            return present
+        if op in ("IN", "NOT IN"):
+            hits = sum(self.selectivity("=", item) for item in set(value) if item is not None)
+            hits = min(present, hits)
+            return hits if op == "IN" else present - hits
+        if value is None or not self.count:
+            return 0.0
+        equal = present / max(1, self.distinct)
+        if op in ("=", "!="):
+            if self.bounds:
+                try:
+                    # A value filling whole buckets is frequent and the histogram
+                    # knows its share; any other holds less than one bucket
+                    buckets = len(self.bounds) - 1
+                    mass = self.fraction_below(value, True) - self.fraction_below(value)
+                    if value < self.bounds[0] or value > self.bounds[-1]:
+                        equal = 0.0
+                    elif mass * buckets >= 1:
+                        equal = present * mass
+                    else:
+                        equal = min(equal, present / max(1, buckets))
+                except TypeError:
+                    pass
+            return equal if op == "=" else present - equal
+        if op in ("LIKE", "NOT LIKE"):
+            prefix = predicate.like_prefix(value)
+            if value == prefix:
+                hits = equal
+            elif prefix:
+                # The share of the histogram between prefix and the first string past it
+                low = high = 1.0
+                for _, bound_op, bound in predicate.prefix_range(None, prefix):
+                    if bound_op == ">=":
+                        low = self.fraction_below(bound)
+                    else:
+                        high = self.fraction_below(bound)
+                hits = present * max(0.0, high - low)
+            else:
+                hits = DEFAULT_LIKE * present
+            return hits if op == "LIKE" else present - hits
+        if op in ("<", "<="):
+            return present * self.fraction_below(value, op == "<=")
+        return present * (1.0 - self.fraction_below(value, op == ">"))
+
+
+class TableStats:
+    # What ANALYZE found in one table: its live row count and per-column statistics
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+
+    def dump(self):
+        return self.rows, {name: column.dump() for name, column in self.columns.items()}
+
+    @classmethod
+    def load(cls, state):
+        rows, columns = state
+        return cls(rows, {name: ColumnStats.load(column) for name, column in columns.items()})
+
+
+def analyze(table):
+    columns = {}
+    for name in table.columns:
+        columns[name] = ColumnStats.collect(value for _, value in table.column_items(name))
+    return TableStats(len(table), columns)
+
+
+def guess(op, value, distinct=None):
+    # Selectivity of one column predicate without statistics; distinct is the
+    # column's distinct-value count when an index knows it
+    distinct = distinct or DEFAULT_DISTINCT
+    if op == "IS NULL":
+        return DEFAULT_NULLS
+    if op == "IS NOT NULL":
+        return 1.0 - DEFAULT_NULLS
+    if op in ("IN", "NOT IN"):
+        hits = min(1.0, len(set(value)) / distinct)
+        return hits if op == "IN" else 1.0 - hits
+    if value is None:
+        return 0.0
+    if op == "=":
+        return 1.0 / distinct
+    if op == "!=":
+        return 1.0 - 1.0 / distinct
+    if op in ("LIKE", "NOT LIKE"):
+        hits = 1.0 / distinct if value == predicate.like_prefix(value) else DEFAULT_LIKE
+        return hits if op == "LIKE" else 1.0 - hits
+    return DEFAULT_RANGE
+
+
+def estimate(conditions):
+    # Selectivity of a conjunction over rows nothing is known about
+    result = 1.0
+    for cond in conditions:
+        result *= selectivity(cond, lambda col: None, lambda col: None)
+    return result
+
+
+def selectivity(cond, column_stats, distinct):
+    # Estimated fraction of rows a checked predicate keeps. column_stats(col)
+    # returns ColumnStats or None; distinct(col) an index's distinct count or
+    # None. Conjuncts and disjuncts are treated as independent.
+    col, op, value = cond
+    if op == "NOT":
+        return 1.0 - selectivity(value, column_stats, distinct)
+    if op == "AND":
+        result = 1.0
+        for part in value:
+            result *= selectivity(part, column_stats, distinct)
+        return result
+    if op == "OR":
+        miss = 1.0
+        for part in value:
+            miss *= 1.0 - selectivity(part, column_stats, distinct)
+        return 1.0 - miss
+    column = column_stats(col)
+    if column is not None:
+        return column.selectivity(op, value)
+    return guess(op, value, distinct(col))
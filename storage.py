@@ -0,0 +1,673 @@
+# storage.py
+import operator
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from pager import FILL_FACTOR, HEADER, PAGE_SIZE, BufferPool, Frame, row_size
+
+COMPARISONS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+
+def to_int(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        result = value
+    elif isinstance(value, float) and value.is_integer():
+        result = int(value)
+    elif isinstance(value, str):
+        try:
+            result = int(value.strip())
+        except ValueError:
+            raise ValueError(f"Invalid INT value: {value!r}")
+    else:
+        raise ValueError(f"Invalid INT value: {value!r}")
+    if not INT64_MIN <= result <= INT64_MAX:
+        raise ValueError(f"INT value out of range: {value!r}")
+    return result
+
+
+def to_text(value):
+    return None if value is None else str(value)
+
+
+def ints_from_strings(values):
+    # Column-at-a-time INT conversion: one C-level pass when every value is a
+    # plain decimal string, otherwise fall back to per-value checks
+    if all(type(value) is str for value in values):
+        try:
+            result = list(map(int, values))
+        except ValueError:
+            pass
+        else:
+            if not result or (INT64_MIN <= min(result) and max(result) <= INT64_MAX):
+                return result
+    return list(map(to_int, values))
+
+
+class IntColumn:
+    # 64-bit integers in a contiguous array; NULLs are a bit per row in a separate bitmap
+    def __init__(self):
+        self.data = array("q")
+        self.nulls = bytearray()
+        self.null_count = 0
+
+    convert = staticmethod(to_int)
+    convert_many = staticmethod(ints_from_strings)
+
+    def __len__(self):
+        return len(self.data)
+
+    def is_null(self, i):
+        return self.null_count and self.nulls[i >> 3] & (1 << (i & 7))
+
+    def append(self, value):
+        i = len(self.data)
+        if i & 7 == 0:
+            self.nulls.append(0)
+        if value is None:
+            self.data.append(0)
+            self.nulls[i >> 3] |= 1 << (i & 7)
+            self.null_count += 1
+        else:
+            self.data.append(value)
+
+    def extend(self, values):
+        if None in values:
+            for value in values:
+                self.append(value)
+            return
+        self.data.extend(values)
+        self.nulls.extend(bytes(((len(self.data) + 7) >> 3) - len(self.nulls)))
+
+    def get(self, i):
+        return None if self.is_null(i) else self.data[i]
+
+    def set(self, i, value):
+        was_null = bool(self.is_null(i))
+        if value is None:
+            if not was_null:
+                self.nulls[i >> 3] |= 1 << (i & 7)
+                self.null_count += 1
+            self.data[i] = 0
+        else:
+            if was_null:
+                self.nulls[i >> 3] &= ~(1 << (i & 7))
+                self.null_count -= 1
+            self.data[i] = value
+
+    def values(self):
+        if not self.null_count:
+            return iter(self.data)
+        return (self.get(i) for i in range(len(self.data)))
+
+    def find(self, op, value):
+        compare = COMPARISONS[op]
+        if not self.null_count:
+            return [i for i, v in enumerate(self.data) if compare(v, value)]
+        return [i for i, v in enumerate(self.data) if compare(v, value) and not self.is_null(i)]
+
+    def retain(self, keep):
+        column = IntColumn()
+        if not self.null_count:
+            data = self.data
+            column.data = array("q", [data[i] for i in keep])
+            column.nulls = bytearray((len(column.data) + 7) >> 3)
+        else:
+            for i in keep:
+                column.append(self.get(i))
+        return column
+
+    def nbytes(self):
+        return self.data.itemsize * len(self.data) + len(self.nulls)
+
+    def dump(self):
+        return self.data.tobytes(), bytes(self.nulls), self.null_count
+
+    @classmethod
+    def load(cls, state):
+        column = cls()
+        data, nulls, column.null_count = state
+        column.data.frombytes(data)
+        column.nulls = bytearray(nulls)
+        return column
+
+
+class TextColumn:
+    # Dictionary-encoded strings: each distinct value is stored once and rows hold a code (-1 is NULL)
+    def __init__(self):
+        self.data = array("i")
+        self.dictionary = []
+        self.codes = {}
+
+    convert = staticmethod(to_text)
+
+    @staticmethod
+    def convert_many(values):
+        if all(type(value) is str for value in values):
+            return list(values)
+        return list(map(to_text, values))
+
+    def __len__(self):
+        return len(self.data)
+
+    def encode(self, value):
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.dictionary)
+            self.dictionary.append(value)
+            self.codes[value] = code
+        return code
+
+    def append(self, value):
+        self.data.append(self.encode(value))
+
+    def extend(self, values):
+        codes = self.codes
+        encoded = []
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = self.encode(value)
+            encoded.append(code)
+        self.data.extend(encoded)
+
+    def get(self, i):
+        code = self.data[i]
+        return None if code < 0 else self.dictionary[code]
+
+    def set(self, i, value):
+        self.data[i] = self.encode(value)
+
+    def values(self):
+        dictionary = self.dictionary
+        return (None if code < 0 else dictionary[code] for code in self.data)
+
+    def find(self, op, value):
+        if op == "=":
+            code = self.codes.get(value)
+            if code is None:
+                return []
+            return [i for i, c in enumerate(self.data) if c == code]
+        # Evaluate the predicate once per distinct value, then scan the codes
+        compare = COMPARISONS[op]
+        hits = set()
+        for code, text in enumerate(self.dictionary):
+            try:
+                if compare(text, value):
+                    hits.add(code)
+            except TypeError:
+                pass
+        return [i for i, c in enumerate(self.data) if c in hits]
+
+    def retain(self, keep):
+        # Re-encoding also drops dictionary entries no surviving row uses
+        column = TextColumn()
+        for i in keep:
+            column.append(self.get(i))
+        return column
+
+    def nbytes(self):
+        return self.data.itemsize * len(self.data) + sum(len(text) for text in self.dictionary)
+
+    def dump(self):
+        return self.data.tobytes(), self.dictionary
+
+    @classmethod
+    def load(cls, state):
+        column = cls()
+        data, column.dictionary = state
+        column.data.frombytes(data)
+        column.codes = {text: code for code, text in enumerate(column.dictionary)}
+        return column
+
+
+class ObjectColumn:
+    # Fallback for declared types without a specialised layout
+    def __init__(self):
+        self.data = []
+
+    @staticmethod
+    def convert(value):
+        return value
+
+    @staticmethod
+    def convert_many(values):
+        return list(values)
+
+    def __len__(self):
+        return len(self.data)
+
+    def append(self, value):
+        self.data.append(value)
+
+    def extend(self, values):
+        self.data.extend(values)
+
+    def get(self, i):
+        return self.data[i]
+
+    def set(self, i, value):
+        self.data[i] = value
+
+    def values(self):
+        return iter(self.data)
+
+    def find(self, op, value):
+        compare = COMPARISONS[op]
+        hits = []
+        for i, v in enumerate(self.data):
+            try:
+                if v is not None and compare(v, value):
+                    hits.append(i)
+            except TypeError:
+                pass
+        return hits
+
+    def retain(self, keep):
+        column = ObjectColumn()
+        column.data = [self.data[i] for i in keep]
+        return column
+
+    def nbytes(self):
+        return sys.getsizeof(self.data) + sum(sys.getsizeof(v) for v in self.data)
+
+    def dump(self):
+        return self.data
+
+    @classmethod
+    def load(cls, state):
+        column = cls()
+        column.data = list(state)
+        return column
+
+
+COLUMN_TYPES = {"INT": IntColumn, "TEXT": TextColumn}
+
+
+class RowStore:
+    # One dict per row; values are stored as given
+    def __init__(self, columns):
+        self.names = list(columns)
+        self.rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def convert(self, column, value):
+        return value
+
+    def converter(self, column):
+        return None
+
+    def bulk_converter(self, column):
+        return None
+
+    def append(self, values):
+        self.rows.append(dict(zip(self.names, values)))
+        return len(self.rows) - 1
+
+    def extend(self, columns):
+        # columns holds one list of values per column, all the same length
+        names = self.names
+        self.rows.extend(dict(zip(names, values)) for values in zip(*columns))
+
+    def truncate(self, count):
+        del self.rows[count:]
+
+    def get(self, rid):
+        return dict(self.rows[rid])
+
+    def value(self, rid, column):
+        return self.rows[rid][column]
+
+    def getter(self, column):
+        # A function reading one column by row id, for compiled predicates
+        rows = self.rows
+        return lambda rid: rows[rid][column]
+
+    def set(self, rid, column, value):
+        self.rows[rid][column] = value
+
+    def column(self, column):
+        return (row[column] for row in self.rows)
+
+    def scan(self, column, op, value):
+        if value is None:
+            return []
+        compare = COMPARISONS[op]
+        hits = []
+        for rid, row in enumerate(self.rows):
+            current = row[column]
+            try:
+                if current is not None and compare(current, value):
+                    hits.append(rid)
+            except TypeError:
+                pass
+        return hits
+
+    def retain(self, doomed):
+        self.rows = [row for rid, row in enumerate(self.rows) if rid not in doomed]
+
+    def dump(self):
+        return [tuple(row.values()) for row in self.rows]
+
+    def load(self, state):
+        self.rows = [dict(zip(self.names, values)) for values in state]
+
+
+class ColumnStore:
+    # One typed column buffer per declared column; rows are materialized only on output
+    def __init__(self, columns):
+        self.names = list(columns)
+        self.columns = {name: COLUMN_TYPES.get(col_type, ObjectColumn)() for name, col_type in columns.items()}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def convert(self, column, value):
+        return self.columns[column].convert(value)
+
+    def converter(self, column):
+        return self.columns[column].convert
+
+    def bulk_converter(self, column):
+        return self.columns[column].convert_many
+
+    def append(self, values):
+        for name, value in zip(self.names, values):
+            self.columns[name].append(value)
+        self.count += 1
+        return self.count - 1
+
+    def extend(self, columns):
+        # columns holds one list of values per column, all the same length
+        for name, values in zip(self.names, columns):
+            self.columns[name].extend(values)
+        self.count += len(columns[0]) if columns else 0
+
+    def truncate(self, count):
+        keep = range(count)
+        self.columns = {name: column.retain(keep) for name, column in self.columns.items()}
+        self.count = count
+
+    def get(self, rid):
+        return {name: column.get(rid) for name, column in self.columns.items()}
+
+    def value(self, rid, column):
+        return self.columns[column].get(rid)
+
+    def getter(self, column):
+        return self.columns[column].get
+
+    def set(self, rid, column, value):
+        self.columns[column].set(rid, value)
+
+    def column(self, column):
+        return self.columns[column].values()
+
+    def scan(self, column, op, value):
+        if value is None:
+            return []
+        try:
+            return self.columns[column].find(op, value)
+        except TypeError:
+            return []
+
+    def retain(self, doomed):
+        keep = [rid for rid in range(self.count) if rid not in doomed]
+        self.columns = {name: column.retain(keep) for name, column in self.columns.items()}
+        self.count = len(keep)
+
+    def nbytes(self):
+        return sum(column.nbytes() for column in self.columns.values())
+
+    def dump(self):
+        return self.count, {name: column.dump() for name, column in self.columns.items()}
+
+    def load(self, state):
+        self.count, columns = state
+        for name, column_state in columns.items():
+            self.columns[name] = type(self.columns[name]).load(column_state)
+
+
+# Bytes of rows a page is filled with before the next row starts a new one
+PAGE_FILL = int(PAGE_SIZE * FILL_FACTOR) - HEADER.size
+
+
+class PagedStore:
+    # Rows as tuples in the pages of a data file (see pager.py), reached
+    # through a buffer pool, so only the pages in use have to be in memory.
+    # Row ids stay positions: starts holds the first row id of every page and
+    # a row id is found at (page, row id - its start) by binary search.
+    def __init__(self, columns, pool=None, name=None):
+        self.names = list(columns)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.kinds = {name: COLUMN_TYPES.get(col_type, ObjectColumn) for name, col_type in columns.items()}
+        self.pool = pool if pool is not None else BufferPool()
+        self.file = self.pool.open(name)
+        self.starts = array("q")
+        self.count = 0
+        # Bumped by every change, so readers caching a page know to look again
+        self.changes = 0
+        # The page last read by row id, as (first row id, end row id, rows, changes):
+        # rows are mostly read in row id order, so it usually holds the next one
+        self.recent = (0, 0, None, -1)
+
+    def __len__(self):
+        return self.count
+
+    def convert(self, column, value):
+        return self.kinds[column].convert(value)
+
+    def converter(self, column):
+        return self.kinds[column].convert
+
+    def bulk_converter(self, column):
+        return self.kinds[column].convert_many
+
+    def _locate(self, rid):
+        # (resident page frame, slot) of a row; callers hold the pool lock
+        if not 0 <= rid < self.count:
+            raise IndexError(rid)
+        page = bisect_right(self.starts, rid) - 1
+        return self.pool.fetch(self.file, page), rid - self.starts[page]
+
+    def _tail(self, size):
+        # The frame of the last page if a row of size bytes still fits, else of a new one
+        if self.starts:
+            frame = self.pool.fetch(self.file, len(self.starts) - 1)
+            if not frame.rows or frame.size + size <= PAGE_FILL:
+                return frame
+        page = self.file.add_page()
+        self.starts.append(self.count)
+        frame = Frame([], 0, True)
+        self.pool.put(self.file, page, frame)
+        return frame
+
+    def append(self, values):
+        row = tuple(values)
+        size = row_size(row)
+        with self.pool.lock:
+            frame = self._tail(size)
+            frame.rows.append(row)
+            frame.size += size
+            frame.dirty = True
+            self.count += 1
+            self.changes += 1
+        return self.count - 1
+
+    def extend(self, columns):
+        # columns holds one list of values per column, all the same length
+        with self.pool.lock:
+            frame = None
+            for row in zip(*columns):
+                size = row_size(row)
+                if frame is None or frame.size + size > PAGE_FILL:
+                    frame = self._tail(size)
+                frame.rows.append(row)
+                frame.size += size
+                frame.dirty = True
+                self.count += 1
+            self.changes += 1
+
+    def truncate(self, count):
+        with self.pool.lock:
+            keep = bisect_left(self.starts, count)
+            self.pool.discard(self.file, keep)
+            self.file.drop_pages(keep)
+            del self.starts[keep:]
+            if keep:
+                frame = self.pool.fetch(self.file, keep - 1)
+                del frame.rows[count - self.starts[keep - 1]:]
+                frame.size = sum(map(row_size, frame.rows))
+                frame.dirty = True
+            self.count = count
+            self.changes += 1
+
+    def _page_of(self, rid):
+        # (first row id, rows) of the page holding a row
+        first, end, rows, changes = self.recent
+        if first <= rid < end and changes == self.changes:
+            return first, rows
+        with self.pool.lock:
+            if not 0 <= rid < self.count:
+                raise IndexError(rid)
+            page = bisect_right(self.starts, rid) - 1
+            rows = self.pool.fetch(self.file, page).rows
+            first = self.starts[page]
+            end = self.starts[page + 1] if page + 1 < len(self.starts) else self.count
+            self.recent = (first, end, rows, self.changes)
+        return first, rows
+
+    def get(self, rid):
+        first, rows = self._page_of(rid)
+        return dict(zip(self.names, rows[rid - first]))
+
+    def value(self, rid, column):
+        first, rows = self._page_of(rid)
+        return rows[rid - first][self.positions[column]]
+
+    def getter(self, column):
+        position = self.positions[column]
+        page_of = self._page_of
+
+        def get(rid):
+            first, rows = page_of(rid)
+            return rows[rid - first][position]
+        return get
+
+    def set(self, rid, column, value):
+        with self.pool.lock:
+            frame, slot = self._locate(rid)
+            old = frame.rows[slot]
+            row = list(old)
+            row[self.positions[column]] = value
+            row = tuple(row)
+            frame.rows[slot] = row
+            frame.size += row_size(row) - row_size(old)
+            frame.dirty = True
+            self.changes += 1
+
+    def pages(self):
+        # (first row id, rows) of every page in order, read as a sequential
+        # scan: pages that are not resident are not kept in the pool
+        for page in range(len(self.starts)):
+            with self.pool.lock:
+                first = self.starts[page]
+                rows = self.pool.fetch(self.file, page, keep=False).rows
+            yield first, rows
+
+    def column(self, column):
+        position = self.positions[column]
+        for _, rows in self.pages():
+            for row in rows:
+                yield row[position]
+
+    def scan(self, column, op, value):
+        if value is None:
+            return []
+        position = self.positions[column]
+        compare = COMPARISONS[op]
+        hits = []
+        try:
+            for first, rows in self.pages():
+                hits += [
+                    first + slot for slot, row in enumerate(rows)
+                    if row[position] is not None and compare(row[position], value)
+                ]
+        except TypeError:
+            return []
+        return hits
+
+    def retain(self, doomed):
+        # Survivors are packed into pages again from the first on. An output
+        # page is held back until the page it replaces has been read; pages
+        # grown by updates can make the output run ahead of the input.
+        with self.pool.lock:
+            starts = array("q")
+            pending = []
+            out, size, count = [], 0, 0
+            for page in range(len(self.starts)):
+                first = self.starts[page]
+                rows = self.pool.fetch(self.file, page, keep=False).rows
+                while pending and pending[0][0] <= page:
+                    self.pool.put(self.file, *pending.pop(0))
+                for slot, row in enumerate(rows):
+                    if first + slot in doomed:
+                        continue
+                    row_bytes = row_size(row)
+                    if out and size + row_bytes > PAGE_FILL:
+                        pending.append((len(starts), Frame(out, size, True)))
+                        starts.append(count - len(out))
+                        out, size = [], 0
+                    out.append(row)
+                    size += row_bytes
+                    count += 1
+            if out:
+                pending.append((len(starts), Frame(out, size, True)))
+                starts.append(count - len(out))
+            for page, frame in pending:
+                while page >= len(self.file.extents):
+                    self.file.add_page()
+                self.pool.put(self.file, page, frame)
+            self.pool.discard(self.file, len(starts))
+            self.file.drop_pages(len(starts))
+            self.starts = starts
+            self.count = count
+            self.changes += 1
+
+    def dump(self):
+        # Changed pages are written back and synced; the snapshot then only
+        # names the pages, which stay in the data file
+        with self.pool.lock:
+            self.pool.flush(self.file)
+            return self.count, self.starts.tobytes(), self.file.dump()
+
+    def load(self, state):
+        count, starts, pages = state
+        with self.pool.lock:
+            self.starts = array("q")
+            self.starts.frombytes(starts)
+            self.count = count
+            self.file.load(pages)
+            self.changes += 1
+
+
+STORAGE_TYPES = {"columnar": ColumnStore, "rows": RowStore, "paged": PagedStore}
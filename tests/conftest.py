@@ -0,0 +1,22 @@
+# conftest.py
+import importlib
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    # The dashboard opens its database when imported; here an in-memory one
+    pytest.importorskip("flask")
+    os.environ["RDBMS_DATA_DIR"] = ""
+    os.environ.pop("RDBMS_SERVER", None)
+    return importlib.import_module("app")
+
+
+@pytest.fixture
+def dashboard(app_module):
+    # A test client over empty users and orders tables
+    app_module.db.execute("DELETE FROM orders")
+    app_module.db.execute("DELETE FROM users")
+    return app_module.app.test_client()
@@ -0,0 +1,108 @@
+# test_aggregates.py
+import random
+
+import pytest
+
+from rdbms import Database
+
+
+def make_database(path=None, aggregates=""):
+    db = Database(path, result_cache_bytes=0)
+    db.execute(f"CREATE TABLE t (id INT PRIMARY KEY AUTO_INCREMENT, g TEXT, v INT) {aggregates}")
+    rng = random.Random(11)
+    db.insert_many("t", [(None, rng.choice("abc"), rng.choice([None, *range(-5, 20)])) for _ in range(500)])
+    return db
+
+
+def expected_groups(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row["g"], []).append(row["v"])
+    result = {}
+    for g, values in groups.items():
+        present = [v for v in values if v is not None]
+        result[g] = {
+            "g": g, "n": len(values), "c": len(present), "s": sum(present) if present else None,
+            "a": sum(present) / len(present) if present else None,
+            "lo": min(present, default=None), "hi": max(present, default=None),
+        }
+    return result
+
+
+def scanned(db, text):
+    records = []
+    db.add_hook(records.append)
+    try:
+        return db.execute(text), records[-1].rows_scanned
+    finally:
+        db.remove_hook(records.append)
+
+
+GROUPED = "SELECT g, COUNT(*) AS n, COUNT(v) AS c, SUM(v) AS s, AVG(v) AS a, MIN(v) AS lo, MAX(v) AS hi FROM t GROUP BY g"
+
+
+def test_group_by_matches_a_python_computation():
+    db = make_database()
+    db.execute("UPDATE t SET g = NULL WHERE id < 20")
+    result = {row["g"]: row for row in db.execute(GROUPED)}
+    assert result == expected_groups(db.execute("SELECT * FROM t"))
+    assert {row["g"]: row for row in db.execute(GROUPED.replace("FROM t", "FROM t WHERE v > 3"))} == \
+        expected_groups(db.execute("SELECT * FROM t WHERE v > 3"))
+
+
+def test_aggregates_over_a_join_and_an_empty_input():
+    db = Database()
+    db.execute("CREATE TABLE users (id INT PRIMARY KEY, name TEXT)")
+    db.execute("CREATE TABLE orders (id INT PRIMARY KEY, user_id INT, amount INT)")
+    db.execute("INSERT INTO users VALUES (1, 'ada'), (2, 'bob')")
+    db.execute("INSERT INTO orders VALUES (1, 1, 5), (2, 1, 7), (3, 2, 1), (4, 3, 100)")
+    rows = db.execute("SELECT users.name, SUM(orders.amount) AS total FROM users JOIN orders "
+                      "ON users.id = orders.user_id GROUP BY users.name")
+    assert sorted((row["users.name"], row["total"]) for row in rows) == [("ada", 12), ("bob", 1)]
+    assert db.execute("SELECT COUNT(*) AS n, MAX(amount) AS hi FROM orders WHERE amount > 1000") == [{"n": 0, "hi": None}]
+    assert db.execute("SELECT user_id, COUNT(*) FROM orders WHERE amount > 1000 GROUP BY user_id") == []
+
+
+def test_running_aggregates_answer_without_a_scan():
+    db = make_database(aggregates="WITH AGGREGATES")
+    text = "SELECT COUNT(*) AS n, COUNT(v) AS c, SUM(v) AS s, MIN(v) AS lo, MAX(v) AS hi FROM t"
+    for change in [None, "DELETE FROM t WHERE v = 19", "UPDATE t SET v = -9 WHERE id = 3",
+                   "INSERT INTO t (g, v) VALUES ('a', 50), ('b', NULL)", "DELETE FROM t WHERE v < 0"]:
+        if change:
+            db.execute(change)
+        rows, count = scanned(db, text)
+        values = [row["v"] for row in db.execute("SELECT * FROM t")]
+        present = [v for v in values if v is not None]
+        assert rows == [{"n": len(values), "c": len(present), "s": sum(present), "lo": min(present), "hi": max(present)}]
+        assert count == 0
+    assert "Stored Aggregate" in db.execute("EXPLAIN SELECT MAX(v) FROM t")[0]["plan"]
+
+
+def test_auto_increment_never_reuses_ids(tmp_path):
+    db = make_database(str(tmp_path))
+    assert db.execute("SELECT MAX(id) AS id FROM t") == [{"id": 500}]
+    db.execute("DELETE FROM t WHERE id > 498")
+    db.execute("INSERT INTO t (g, v) VALUES ('x', 1)")
+    db.execute("INSERT INTO t VALUES (NULL, 'y', 2)")
+    db.execute("INSERT INTO t VALUES (1000, 'z', 3)")
+    db.close()
+    db = Database(str(tmp_path))
+    db.execute("INSERT INTO t (g, v) VALUES ('w', 4)")
+    assert [row["id"] for row in db.execute("SELECT * FROM t WHERE id > 498")] == [501, 502, 1000, 1001]
+    with pytest.raises(ValueError):
+        db.execute("INSERT INTO t VALUES (1000, 'dup', 0)")
+    db.close()
+
+
+def test_alter_makes_a_column_auto_increment():
+    db = Database()
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, s TEXT)")
+    db.execute("INSERT INTO t VALUES (7, 'a'), (3, 'b')")
+    with pytest.raises(ValueError):
+        db.execute("INSERT INTO t (s) VALUES ('c')")
+    db.execute("ALTER TABLE t MODIFY id AUTO_INCREMENT")
+    db.execute("INSERT INTO t (s) VALUES ('c')")
+    assert db.execute("SELECT id FROM t WHERE s = 'c'") == [{"id": 8}]
+    assert db.schema()["tables"]["t"]["auto_increment"] == "id"
+    with pytest.raises(ValueError):
+        db.execute("ALTER TABLE t MODIFY s AUTO_INCREMENT")
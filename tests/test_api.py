@@ -0,0 +1,84 @@
+# test_api.py
+import itertools
+import json
+
+emails = itertools.count()
+
+
+def add_users(app_module, count):
+    for i in range(count):
+        app_module.db.execute("INSERT INTO users (name, email) VALUES (?, ?)", (f"user{i}", f"{next(emails)}@example.com"))
+
+
+def fetch(dashboard, *args, **kwargs):
+    # A streamed response keeps its request context until it is read and closed
+    response = dashboard.open(*args, **kwargs)
+    response.get_data()
+    response.close()
+    return response
+
+
+def test_tables_are_served_as_json(app_module, dashboard):
+    add_users(app_module, 3)
+    response = fetch(dashboard, "/api/tables/users")
+    assert response.status_code == 200
+    assert [row["name"] for row in response.get_json()] == ["user0", "user1", "user2"]
+    assert len(fetch(dashboard, "/api/tables/users?limit=2").get_json()) == 2
+    assert fetch(dashboard, "/api/tables/nope").status_code == 404
+    assert fetch(dashboard, "/api/tables/users_orders").get_json() == []
+
+
+def test_etags_follow_table_versions(app_module, dashboard):
+    add_users(app_module, 2)
+    first = fetch(dashboard, "/api/tables/users")
+    etag = first.headers["ETag"]
+    again = fetch(dashboard, "/api/tables/users", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+    # Writes to another table leave the ETag alone
+    app_module.db.execute("INSERT INTO orders (user_id, item) VALUES (1, 'pen')")
+    assert fetch(dashboard, "/api/tables/users", headers={"If-None-Match": etag}).status_code == 304
+    add_users(app_module, 1)
+    changed = fetch(dashboard, "/api/tables/users", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+
+def test_ndjson_responses(app_module, dashboard):
+    add_users(app_module, 3)
+    for response in [fetch(dashboard, "/api/tables/users?format=ndjson"),
+                     fetch(dashboard, "/api/tables/users", headers={"Accept": "application/x-ndjson"})]:
+        assert response.mimetype == "application/x-ndjson"
+        lines = response.data.decode().splitlines()
+        assert [json.loads(line)["name"] for line in lines] == ["user0", "user1", "user2"]
+
+
+def test_queries(app_module, dashboard):
+    add_users(app_module, 5)
+    text = "SELECT name FROM users WHERE id > ? ORDER BY id LIMIT 2"
+    (low,) = app_module.db.execute("SELECT MIN(id) AS id FROM users")
+    by_get = fetch(dashboard, "/api/query", query_string={"sql": text, "params": json.dumps([low["id"]])})
+    by_post = fetch(dashboard, "/api/query", method="POST", json={"sql": text, "params": [low["id"]]})
+    assert by_get.get_json() == by_post.get_json() == [{"name": "user1"}, {"name": "user2"}]
+
+
+def test_query_errors_are_400(dashboard):
+    for query in [{"sql": "DELETE FROM users"}, {"sql": "SELECT * FROM nope"}, {"sql": "SELECT * FROM users WHERE id = 'x'"},
+                  {"sql": "SELECT * FROM users WHERE id = ?", "params": "[1"}, {"params": "[]"},
+                  {"sql": "SELECT * FROM users WHERE id = ?"}]:
+        response = fetch(dashboard, "/api/query", query_string=query)
+        assert response.status_code == 400 and "error" in response.get_json()
+    assert fetch(dashboard, "/api/query", method="POST", json={"sql": "SELECT * FROM users", "params": 3}).status_code == 400
+
+
+def test_an_error_after_the_first_row_ends_ndjson_with_an_error_line(app_module):
+    def rows():
+        yield {"id": 1}
+        raise ValueError("disk on fire")
+
+    lines = [json.loads(line) for line in app_module.json_rows(rows(), True)]
+    assert lines == [{"id": 1}, {"error": "disk on fire"}]
+
+
+def test_metrics(app_module, dashboard):
+    fetch(dashboard, "/api/tables/users")
+    text = fetch(dashboard, "/metrics").data.decode()
+    assert "rdbms_statement_duration_seconds" in text
@@ -0,0 +1,114 @@
+# test_bulk_load.py
+import json
+
+import pytest
+
+from rdbms import Database
+
+
+def make_database(path=None):
+    db = Database(path)
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, n INT, s TEXT UNIQUE)")
+    db.execute("CREATE INDEX t_n ON t(n)")
+    db.execute("CREATE ORDERED INDEX t_n_ordered ON t(n)")
+    db.execute("INSERT INTO t VALUES (1, 10, 'a')")
+    return db
+
+
+def check_indexes(db):
+    # Lookups through every index built at the end of a load agree with a scan
+    rows = db.execute("SELECT * FROM t")
+    for row in rows:
+        assert db.execute("SELECT * FROM t WHERE id = ?", (row["id"],)) == [row]
+        if row["s"] is not None:
+            assert db.execute("SELECT * FROM t WHERE s = ?", (row["s"],)) == [row]
+    for n in {row["n"] for row in rows if row["n"] is not None}:
+        assert sorted(r["id"] for r in db.execute("SELECT * FROM t WHERE n = ?", (n,))) == \
+            sorted(r["id"] for r in rows if r["n"] == n)
+    ordered = [row["n"] for row in db.execute("SELECT * FROM t WHERE n >= 0 ORDER BY n")]
+    assert ordered == sorted(row["n"] for row in rows if row["n"] is not None)
+
+
+def test_multi_row_insert():
+    db = make_database()
+    assert db.execute("INSERT INTO t VALUES (2, 20, 'b'), (3, NULL, 'c'), (4, 20, NULL)") == 3
+    assert db.execute("INSERT INTO t (s, id) VALUES ('d', 5), ('e', ?)", (6,)) == 2
+    assert db.execute("SELECT * FROM t WHERE id > 4") == [{"id": 5, "n": None, "s": "d"}, {"id": 6, "n": None, "s": "e"}]
+    check_indexes(db)
+
+
+@pytest.mark.parametrize("values", [
+    "(2, 20, 'b'), (2, 30, 'c')",   # duplicate key within the batch
+    "(2, 20, 'b'), (1, 30, 'c')",   # duplicate of a stored key
+    "(2, 20, 'b'), (3, 30, 'a')",   # duplicate unique value
+    "(2, 20, 'b'), (3, 'x', 'c')",  # bad INT
+    "(2, 20, 'b'), (3, 30)",        # wrong column count
+])
+def test_a_bad_multi_row_insert_changes_nothing(values):
+    db = make_database()
+    with pytest.raises(ValueError):
+        db.execute(f"INSERT INTO t VALUES {values}")
+    assert db.execute("SELECT * FROM t") == [{"id": 1, "n": 10, "s": "a"}]
+    check_indexes(db)
+
+
+def test_copy_csv_with_header_and_columns(tmp_path):
+    db = make_database()
+    path = tmp_path / "rows.csv"
+    path.write_text("s,id,n\nb,2,20\nc,3,\n\nd,4,20\n")
+    assert db.execute(f"COPY t FROM '{path}' CSV HEADER") == 3
+    other = tmp_path / "more.csv"
+    other.write_text("5,e\n6,f\n")
+    assert db.execute(f"COPY t (id, s) FROM '{other}'") == 2
+    rows = db.execute("SELECT * FROM t WHERE id > 1")
+    assert rows == [
+        {"id": 2, "n": 20, "s": "b"},
+        {"id": 3, "n": None, "s": "c"},
+        {"id": 4, "n": 20, "s": "d"},
+        {"id": 5, "n": None, "s": "e"},
+        {"id": 6, "n": None, "s": "f"},
+    ]
+    check_indexes(db)
+
+
+def test_copy_jsonl_objects_and_arrays(tmp_path):
+    db = make_database()
+    path = tmp_path / "rows.jsonl"
+    path.write_text("\n".join(map(json.dumps, [{"id": 2, "s": "b"}, {"id": 3, "n": 30, "s": "c"}])) + "\n")
+    assert db.execute(f"COPY t FROM '{path}'") == 2
+    arrays = tmp_path / "rows.data"
+    arrays.write_text('[40, 4, "d"]\n[50, 5, "e"]\n')
+    assert db.execute(f"COPY t (n, id, s) FROM '{arrays}' JSONL") == 2
+    assert [(row["id"], row["n"]) for row in db.execute("SELECT * FROM t")] == [(1, 10), (2, None), (3, 30), (4, 40), (5, 50)]
+    check_indexes(db)
+
+
+def test_a_failing_copy_loads_nothing(tmp_path):
+    db = make_database(str(tmp_path / "data"))
+    path = tmp_path / "rows.csv"
+    # The duplicate is in the third chunk of two rows
+    path.write_text("".join(f"{i},{i},s{i}\n" for i in range(2, 7)) + "3,0,dup\n")
+    with pytest.raises(ValueError):
+        db.copy_from("t", str(path), chunk_size=2)
+    assert db.execute("SELECT COUNT(*) AS n FROM t") == [{"n": 1}]
+    check_indexes(db)
+    db.close()
+    # Replaying the log leaves the table as it was too
+    db = Database(str(tmp_path / "data"))
+    assert db.execute("SELECT * FROM t") == [{"id": 1, "n": 10, "s": "a"}]
+    check_indexes(db)
+    db.close()
+
+
+def test_copy_errors(tmp_path):
+    db = make_database()
+    path = tmp_path / "rows.csv"
+    path.write_text("nope\n1\n")
+    with pytest.raises(ValueError):
+        db.execute(f"COPY t FROM '{path}' CSV HEADER")
+    with pytest.raises(ValueError):
+        db.execute(f"COPY t (nope) FROM '{path}'")
+    with pytest.raises(ValueError):
+        db.execute(f"COPY t FROM '{tmp_path / 'rows.xml'}'")
+    with pytest.raises(ValueError):
+        db.execute(f"COPY nope FROM '{path}'")
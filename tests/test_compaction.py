@@ -0,0 +1,79 @@
+# test_compaction.py
+import pytest
+
+from rdbms import Database
+
+
+def make_table(db, storage, count):
+    db.execute(f"CREATE TABLE t (id INT PRIMARY KEY, code TEXT UNIQUE, grp INT, score INT) "
+               f"STORAGE {storage.upper()} WITH AGGREGATES")
+    db.execute("CREATE INDEX t_grp ON t(grp)")
+    db.execute("CREATE ORDERED INDEX t_score ON t(score)")
+    rows = [[i, f"c{i}", i % 7, (i * 37) % 1000] for i in range(count)]
+    db.insert_many("t", rows)
+    return {row[0]: dict(zip(("id", "code", "grp", "score"), row)) for row in rows}
+
+
+def check(db, expected):
+    live = sorted(expected.values(), key=lambda row: row["id"])
+    assert db.execute("SELECT * FROM t ORDER BY id") == live
+    assert db.execute("SELECT COUNT(*) AS n, MAX(score) AS hi FROM t") == [
+        {"n": len(live), "hi": max(row["score"] for row in live)}]
+    # Hash, unique and ordered index lookups all see the renumbered rows
+    for grp in range(7):
+        found = db.execute("SELECT id FROM t WHERE grp = ? ORDER BY id", (grp,))
+        assert found == [{"id": row["id"]} for row in live if row["grp"] == grp]
+    for row in live[::97]:
+        assert db.execute("SELECT * FROM t WHERE id = ?", (row["id"],)) == [row]
+        assert db.execute("SELECT id FROM t WHERE code = ?", (row["code"],)) == [{"id": row["id"]}]
+    found = db.execute("SELECT id, score FROM t WHERE score BETWEEN 100 AND 200 ORDER BY score")
+    assert [row["score"] for row in found] == sorted(row["score"] for row in found)
+    assert sorted(row["id"] for row in found) == [row["id"] for row in live if 100 <= row["score"] <= 200]
+    lowest = db.execute("SELECT id, score FROM t ORDER BY score LIMIT 5")
+    assert [row["score"] for row in lowest] == sorted(row["score"] for row in live)[:5]
+
+
+@pytest.mark.parametrize("storage", ["columnar", "rows", "paged"])
+def test_deletes_compact_and_indexes_follow(storage):
+    db = Database()
+    expected = make_table(db, storage, 3000)
+    table = db.tables["t"]
+    # Below the threshold deleted rows stay behind as tombstones
+    db.execute("DELETE FROM t WHERE grp = 0")
+    expected = {key: row for key, row in expected.items() if row["grp"] != 0}
+    assert table.compactions == 0 and table.deleted
+    check(db, expected)
+    # Enough tombstones compact the table and renumber the survivors
+    db.execute("DELETE FROM t WHERE id < 1500")
+    expected = {key: row for key, row in expected.items() if key >= 1500}
+    assert table.compactions == 1 and not table.deleted
+    assert len(table.store) == len(expected)
+    check(db, expected)
+    # Keys freed by the deletes can be reused, live keys are still unique
+    db.execute("INSERT INTO t VALUES (1, 'c1', 3, 5)")
+    expected[1] = {"id": 1, "code": "c1", "grp": 3, "score": 5}
+    with pytest.raises(ValueError):
+        db.execute("INSERT INTO t VALUES (2, 'c2000', 0, 0)")
+    db.execute("UPDATE t SET score = 999 WHERE id = 2999")
+    expected[2999]["score"] = 999
+    check(db, expected)
+    db.close()
+
+
+def test_compacted_table_recovers(tmp_path):
+    db = Database(str(tmp_path))
+    expected = make_table(db, "columnar", 3000)
+    db.execute("DELETE FROM t WHERE grp = 1")
+    db.execute("DELETE FROM t WHERE id >= 1000")
+    db.execute("UPDATE t SET grp = 6 WHERE id = 2")
+    db.close()
+    expected = {key: row for key, row in expected.items() if row["grp"] != 1 and key < 1000}
+    expected[2]["grp"] = 6
+
+    db = Database(str(tmp_path))
+    check(db, expected)
+    db.execute("CHECKPOINT")
+    db.close()
+    db = Database(str(tmp_path))
+    check(db, expected)
+    db.close()
@@ -0,0 +1,84 @@
+# test_dashboard.py
+import re
+
+import pytest
+
+ORDERS = 'id="ordersTable"'
+JOIN = "Users + Orders"
+
+
+def page(dashboard, url):
+    response = dashboard.get(url)
+    body = response.get_data(as_text=True)
+    response.close()
+    return response.status_code, body
+
+
+def walk(dashboard, url, marker, column=0):
+    # The ids in the given column of the table after marker on every page, following the Next links
+    pages = []
+    while url:
+        status, body = page(dashboard, url)
+        assert status == 200
+        table, pager = body.split(marker)[1].split("</table>")[:2]
+        rows = re.findall(r"<tr[^>]*>\s*((?:<td>.*?</td>\s*)+)", table, re.DOTALL)
+        pages.append([int(re.findall(r"<td>(.*?)</td>", row, re.DOTALL)[column]) for row in rows])
+        link = re.search(r'<a href="([^"]*)">Next', pager.split("</div>")[0])
+        url = link.group(1).replace("&amp;", "&") if link else None
+    return pages
+
+
+@pytest.fixture
+def orders(app_module, dashboard):
+    # 60 orders, with the item of every third one NULL and many equal items
+    db = app_module.db
+    db.execute("INSERT INTO users (name, email) VALUES ('ada', 'ada@example.com')")
+    user = db.execute("SELECT MAX(id) AS id FROM users")[0]["id"]
+    for i in range(60):
+        db.execute("INSERT INTO orders (user_id, item) VALUES (?, ?)", (user, None if i % 3 == 0 else f"item{i % 4}"))
+    return db.execute("SELECT * FROM orders")
+
+
+def expected(rows, descending):
+    # (item IS NULL, item, id), reversed when descending
+    order = sorted(rows, key=lambda row: (row["item"] is None, row["item"] or "", row["id"]), reverse=descending)
+    return [row["id"] for row in order]
+
+
+@pytest.mark.parametrize("direction", ["asc", "desc"])
+def test_pages_cover_rows_with_null_sort_values(app_module, dashboard, orders, direction):
+    pages = walk(dashboard, f"/?orders_sort=item&orders_dir={direction}", ORDERS)
+    assert [len(ids) for ids in pages] == [25, 25, 10]
+    assert sum(pages, []) == expected(orders, direction == "desc")
+
+
+def test_a_full_last_page_still_links_to_an_empty_one(app_module, dashboard):
+    db = app_module.db
+    for _ in range(50):
+        db.execute("INSERT INTO orders (user_id, item) VALUES (1, NULL)")
+    pages = walk(dashboard, "/?orders_sort=item", ORDERS)
+    assert [len(ids) for ids in pages] == [25, 25]
+
+
+def test_search_is_a_prefix_match_on_the_sort_column(app_module, dashboard, orders):
+    pages = walk(dashboard, "/?orders_sort=item&orders_q=item1", ORDERS)
+    assert sum(pages, []) == sorted(row["id"] for row in orders if row["item"] == "item1")
+
+
+@pytest.mark.parametrize("query", [
+    "orders_sort=item&orders_skip=2",
+    "orders_sort=id&orders_after=x",
+    "orders_null_after=x",
+    "orders_sort=item&orders_after=a&orders_null_after=3",
+    "join_after=x",
+])
+def test_bad_cursors_are_rejected(dashboard, query):
+    assert page(dashboard, "/?" + query)[0] == 400
+
+
+def test_the_join_is_paged_from_the_view_index(app_module, dashboard, orders):
+    pages = walk(dashboard, "/", JOIN, column=3)
+    assert sum(pages, []) == sorted(row["id"] for row in orders)
+    plan = "\n".join(row["plan"] for row in app_module.db.execute(
+        "EXPLAIN SELECT * FROM users_orders WHERE orders.id > 5 ORDER BY orders.id LIMIT 26"))
+    assert "using users_orders_order_id" in plan
@@ -0,0 +1,90 @@
+# test_indexes.py
+import pytest
+
+from rdbms import Database
+
+
+def make_database(storage):
+    db = Database(storage=storage, result_cache_bytes=0)
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, v INT, s TEXT UNIQUE)")
+    db.execute("INSERT INTO t VALUES " + ", ".join(f"({i}, {i % 10}, 's{i}')" for i in range(200)))
+    db.execute("CREATE INDEX t_v ON t(v)")
+    return db
+
+
+def run(db, text):
+    # The result of a statement and the QueryStats it recorded
+    records = []
+    db.add_hook(records.append)
+    try:
+        return db.execute(text), records[-1]
+    finally:
+        db.remove_hook(records.append)
+
+
+def plan(db, text):
+    return "\n".join(row["plan"] for row in db.execute("EXPLAIN " + text))
+
+
+def ids(rows):
+    return sorted(row["id"] for row in rows)
+
+
+@pytest.mark.parametrize("storage", ["columnar", "rows"])
+def test_equality_on_indexed_columns_is_a_lookup(storage):
+    db = make_database(storage)
+    for text, expected in [
+        ("SELECT * FROM t WHERE v = 3", list(range(3, 200, 10))),
+        ("SELECT * FROM t WHERE id = 42", [42]),
+        ("SELECT * FROM t WHERE s = 's7'", [7]),
+    ]:
+        assert "Index Lookup" in plan(db, text)
+        rows, record = run(db, text)
+        assert ids(rows) == expected
+        assert record.index_hits == 1 and record.rows_scanned == len(expected)
+
+
+@pytest.mark.parametrize("storage", ["columnar", "rows"])
+def test_update_and_delete_find_their_rows_through_indexes(storage):
+    db = make_database(storage)
+    count, record = run(db, "UPDATE t SET v = 99 WHERE v = 3")
+    assert count == 20 and record.index_hits == 1 and record.rows_scanned == 20
+    count, record = run(db, "DELETE FROM t WHERE v = 4")
+    assert count == 20 and record.index_hits == 1 and record.rows_scanned == 20
+    # The index follows both
+    assert ids(db.execute("SELECT * FROM t WHERE v = 99")) == list(range(3, 200, 10))
+    assert db.execute("SELECT * FROM t WHERE v = 3") == []
+    assert db.execute("SELECT * FROM t WHERE v = 4") == []
+    assert db.execute("SELECT * FROM t WHERE id = 14") == []
+
+
+@pytest.mark.parametrize("storage", ["columnar", "rows"])
+def test_indexes_stay_correct_across_changes(storage):
+    db = make_database(storage)
+    db.execute("INSERT INTO t VALUES (500, 3, 's500'), (501, NULL, 's501')")
+    db.execute("UPDATE t SET id = 600 WHERE id = 13")
+    db.execute("UPDATE t SET s = 's13' WHERE id = 600")
+    db.execute("DELETE FROM t WHERE id = 23")
+    table = db.execute("SELECT * FROM t")
+    for value in (3, None):
+        expected = ids(row for row in table if row["v"] == value)
+        text = "SELECT * FROM t WHERE v IS NULL" if value is None else f"SELECT * FROM t WHERE v = {value}"
+        assert ids(db.execute(text)) == expected
+    assert ids(db.execute("SELECT * FROM t WHERE id = 600")) == [600]
+    assert ids(db.execute("SELECT * FROM t WHERE s = 's13'")) == [600]
+    # Key constraints still hold after the rows moved
+    with pytest.raises(ValueError):
+        db.execute("INSERT INTO t VALUES (600, 1, 'other')")
+    with pytest.raises(ValueError):
+        db.execute("UPDATE t SET s = 's13' WHERE id = 1")
+
+
+def test_create_index_errors():
+    db = make_database("columnar")
+    with pytest.raises(ValueError):
+        db.execute("CREATE INDEX t_v ON t(s)")
+    with pytest.raises(ValueError):
+        db.execute("CREATE INDEX bad ON t(nope)")
+    with pytest.raises(ValueError):
+        db.execute("CREATE INDEX bad ON nope(v)")
+    assert db.schema()["tables"]["t"]["indexes"]["t_v"] == {"column": "v", "unique": False, "ordered": False}
@@ -0,0 +1,110 @@
+# test_instrumentation.py
+import json
+import tracemalloc
+
+import pytest
+
+from metrics import Histogram, Metrics
+from rdbms import Database
+
+
+def make_database(**options):
+    db = Database(result_cache_bytes=0, **options)
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, v INT)")
+    db.insert_many("t", [(i, i % 10) for i in range(100)])
+    return db
+
+
+def test_hooks_receive_one_record_per_statement():
+    db = make_database()
+    records = []
+    db.add_hook(records.append)
+    db.execute("SELECT * FROM t WHERE v = 3")
+    db.execute("SELECT * FROM t WHERE id = 5")
+    db.execute("UPDATE t SET v = 0 WHERE v = 1")
+    with pytest.raises(ValueError):
+        db.execute("SELECT * FROM nope")
+    list(db.prepare("SELECT * FROM t LIMIT 3").stream())
+    db.remove_hook(records.append)
+    db.execute("SELECT * FROM t")
+
+    assert [record.kind for record in records] == ["select", "select", "update", "select", "select"]
+    scan, lookup, update, failed, streamed = records
+    assert (scan.rows_scanned, scan.rows_returned, scan.index_hits) == (100, 10, 0)
+    assert (lookup.rows_scanned, lookup.rows_returned, lookup.index_hits) == (1, 1, 1)
+    assert (update.rows_scanned, update.rows_returned) == (100, 10)
+    assert failed.error is not None and "nope" in failed.error
+    assert streamed.rows_returned == 3
+    for record in records:
+        assert record.total_time == pytest.approx(record.parse_time + record.plan_time + record.execute_time)
+        assert record.total_time > 0
+    assert scan.as_dict()["sql"] == "SELECT * FROM t WHERE v = 3"
+    assert "rows scanned 100, returned 10, index hits 0" in scan.summary()
+
+
+def test_memory_is_recorded_when_traced():
+    tracing = tracemalloc.is_tracing()
+    try:
+        db = make_database(trace_memory=True)
+        records = []
+        db.add_hook(records.append)
+        db.execute("SELECT * FROM t")
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    assert records[0].memory > 0
+
+
+def test_the_slow_query_log_keeps_only_slow_statements(tmp_path):
+    path = tmp_path / "slow.log"
+    db = make_database(slow_query_log=str(path), slow_query_ms=0)
+    db.execute("SELECT * FROM t WHERE id = ?", (4,))
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert lines[-1]["sql"] == "SELECT * FROM t WHERE id = ?" and lines[-1]["params"] == [4]
+    quiet = tmp_path / "quiet.log"
+    db = make_database(slow_query_log=str(quiet), slow_query_ms=60_000)
+    db.execute("SELECT * FROM t")
+    assert not quiet.exists()
+
+
+def test_metrics_render_prometheus_histograms():
+    db = make_database()
+    metrics = Metrics()
+    db.add_hook(metrics)
+    db.execute("SELECT * FROM t")
+    db.execute("SELECT * FROM t WHERE id = 1")
+    db.execute("DELETE FROM t WHERE id = 1")
+    text = metrics.render()
+    assert 'rdbms_statement_duration_seconds_bucket{kind="select",le="+Inf"} 2' in text
+    assert 'rdbms_statement_duration_seconds_count{kind="delete"} 1' in text
+    assert 'rdbms_rows_scanned_total{kind="select"} 101' in text
+    assert 'rdbms_index_hits_total{kind="select"} 1' in text
+    assert 'rdbms_statement_phase_seconds_total{kind="select",phase="plan"}' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert list(histogram.cumulative()) == [("0.1", 2), ("1.0", 3), ("+Inf", 4)]
+    assert histogram.sum == pytest.approx(3.65)
+
+
+def test_repl_timing_toggle(monkeypatch, capsys):
+    monkeypatch.setenv("RDBMS_DATA_DIR", "")
+    repl = pytest.importorskip("repl")
+    monkeypatch.setattr(repl, "db", make_database())
+    repl.meta_command("\\timing on")
+    repl.execute("SELECT * FROM t WHERE id = 1")
+    out = capsys.readouterr().out
+    assert "Timing is on." in out and "rows scanned 1, returned 1, index hits 1" in out
+    repl.meta_command("\\timing")
+    repl.execute("SELECT * FROM t WHERE id = 1")
+    assert "Time:" not in capsys.readouterr().out
+
+
+def test_metrics_endpoint(app_module, dashboard):
+    dashboard.get("/api/tables/users").close()
+    response = dashboard.get("/metrics")
+    assert response.mimetype == "text/plain"
+    assert 'rdbms_statements_total{kind="select"}' in response.get_data(as_text=True)
@@ -0,0 +1,71 @@
+# test_joins.py
+import random
+
+import pytest
+
+from rdbms import Database
+
+
+def nested_loop(users, orders, left=False):
+    # The join the engine used to do, as the reference answer
+    result = []
+    for user in users:
+        matched = False
+        for order in orders:
+            if user["id"] == order["user_id"]:
+                result.append({**{f"users.{k}": v for k, v in user.items()},
+                               **{f"orders.{k}": v for k, v in order.items()}})
+                matched = True
+        if left and not matched:
+            result.append({**{f"users.{k}": v for k, v in user.items()},
+                           **{f"orders.{k}": None for k in ("id", "user_id", "amount")}})
+    return result
+
+
+def key(row):
+    return sorted((column, repr(value)) for column, value in row.items())
+
+
+@pytest.fixture(params=["none", "hash", "ordered"])
+def db(request):
+    rng = random.Random(5)
+    db = Database()
+    db.execute("CREATE TABLE users (id INT PRIMARY KEY, name TEXT)")
+    db.execute("CREATE TABLE orders (id INT PRIMARY KEY, user_id INT, amount INT)")
+    if request.param == "hash":
+        db.execute("CREATE INDEX orders_user ON orders(user_id)")
+    elif request.param == "ordered":
+        db.execute("CREATE ORDERED INDEX orders_user ON orders(user_id)")
+    db.insert_many("users", [(i, f"u{i}") for i in range(200)])
+    db.insert_many("orders", [(i, rng.choice([None] + list(range(250))), rng.randint(1, 100)) for i in range(1000)])
+    return db
+
+
+@pytest.mark.parametrize("join, left", [("JOIN", False), ("INNER JOIN", False), ("LEFT JOIN", True)])
+def test_joins_match_a_nested_loop(db, join, left):
+    users = db.execute("SELECT * FROM users")
+    orders = db.execute("SELECT * FROM orders")
+    found = db.execute(f"SELECT * FROM users {join} orders ON users.id = orders.user_id")
+    assert sorted(map(key, found)) == sorted(map(key, nested_loop(users, orders, left)))
+
+
+def test_join_with_filters_and_swapped_sides(db):
+    users = db.execute("SELECT * FROM users WHERE id < 50")
+    orders = db.execute("SELECT * FROM orders WHERE amount > 50")
+    expected = sorted(map(key, nested_loop(users, orders)))
+    for query in ["SELECT * FROM users JOIN orders ON users.id = orders.user_id "
+                  "WHERE users.id < 50 AND orders.amount > 50",
+                  "SELECT * FROM orders JOIN users ON orders.user_id = users.id "
+                  "WHERE users.id < 50 AND orders.amount > 50"]:
+        assert sorted(map(key, db.execute(query))) == expected
+
+
+def test_join_of_empty_tables():
+    db = Database()
+    db.execute("CREATE TABLE a (id INT PRIMARY KEY)")
+    db.execute("CREATE TABLE b (id INT PRIMARY KEY, a_id INT)")
+    assert db.execute("SELECT * FROM a JOIN b ON a.id = b.a_id") == []
+    db.execute("INSERT INTO a VALUES (1)")
+    assert db.execute("SELECT * FROM a LEFT JOIN b ON a.id = b.a_id") == [{"a.id": 1, "b.id": None, "b.a_id": None}]
+    with pytest.raises(ValueError):
+        db.execute("SELECT * FROM a JOIN nope ON a.id = nope.id")
@@ -0,0 +1,168 @@
+# test_locking.py
+import threading
+import time
+import tracemalloc
+
+from rdbms import Database, RWLock
+
+
+def make_database():
+    db = Database()
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, v INT)")
+    db.insert_many("t", [(i, i) for i in range(100)])
+    return db
+
+
+def test_a_paused_stream_does_not_block_writers():
+    db = make_database()
+    rows = db.prepare("SELECT * FROM t").stream()
+    assert next(rows) == {"id": 0, "v": 0}
+    writer = threading.Thread(target=db.execute, args=("UPDATE t SET v = -1 WHERE id = 50",))
+    writer.start()
+    writer.join(5)
+    assert not writer.is_alive()
+    # The stream goes on with the rows as they were when it started
+    assert [row["v"] for row in rows] == list(range(1, 100))
+    assert db.execute("SELECT v FROM t WHERE id = 50") == [{"v": -1}]
+
+
+def test_streams_keep_their_snapshot_through_writes_and_compaction():
+    db = make_database()
+    db.insert_many("t", [(i, i) for i in range(100, 5000)])
+    rows = db.prepare("SELECT id FROM t WHERE v >= 10").stream()
+    seen = [next(rows)["id"] for _ in range(300)]
+    db.execute("DELETE FROM t WHERE id >= 2000")
+    db.execute("INSERT INTO t VALUES (-1, 99)")
+    db.execute("UPDATE t SET v = 0 WHERE id < 1000")
+    seen += [row["id"] for row in rows]
+    assert seen == list(range(10, 5000))
+    assert db.tables["t"].compactions == 1
+
+
+def test_streams_produce_rows_lazily():
+    db = Database(result_cache_bytes=0)
+    db.execute("CREATE TABLE big (id INT PRIMARY KEY, v TEXT)")
+    db.insert_many("big", [(i, "x" * 20) for i in range(100_000)])
+    tracemalloc.start()
+    try:
+        rows = db.prepare("SELECT * FROM big").stream()
+        tracemalloc.reset_peak()
+        next(rows)
+        first = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        db.execute("SELECT * FROM big")
+        whole = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert first * 20 < whole
+    assert sum(1 for _ in rows) == 99_999
+
+
+def test_readers_do_not_queue_behind_a_waiting_writer():
+    lock = RWLock(patience=5)
+    lock.acquire_read()
+    writer = threading.Thread(target=lambda: (lock.acquire_write(), lock.release_write()), daemon=True)
+    writer.start()
+    while not lock.waiting_writers:
+        time.sleep(0.001)
+    reader = threading.Thread(target=lambda: (lock.acquire_read(), lock.release_read()), daemon=True)
+    reader.start()
+    reader.join(1)
+    assert not reader.is_alive()
+    lock.release_read()
+    writer.join(5)
+    assert not writer.is_alive()
+
+
+def test_a_writer_waiting_past_its_patience_goes_before_new_readers():
+    lock = RWLock(patience=0.05)
+    lock.acquire_read()
+    order = []
+
+    def write():
+        lock.acquire_write()
+        order.append("write")
+        lock.release_write()
+
+    def read():
+        lock.acquire_read()
+        order.append("read")
+        lock.release_read()
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    while not lock.waiting_writers:
+        time.sleep(0.001)
+    time.sleep(0.1)
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    reader.join(0.2)
+    # The new reader queues behind the writer, which waits for the first reader
+    assert order == []
+    lock.release_read()
+    writer.join(5)
+    reader.join(5)
+    assert order == ["write", "read"]
+
+
+def test_atomic_groups_and_concurrent_writers():
+    db = make_database()
+
+    def move(times):
+        for _ in range(times):
+            with db.locked(writes=["t"]):
+                (row,) = db.execute("SELECT v FROM t WHERE id = 0")
+                db.execute("UPDATE t SET v = ? WHERE id = 0", (row["v"] + 1,))
+
+    threads = [threading.Thread(target=move, args=(200,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert db.execute("SELECT v FROM t WHERE id = 0") == [{"v": 800}]
+
+
+def test_batches_with_ddl_do_not_deadlock_with_schema_reads(tmp_path):
+    db = Database(str(tmp_path))
+    db.execute("CREATE TABLE t (a INT)")
+    stop = threading.Event()
+    errors = []
+
+    def batches():
+        for i in range(200):
+            db.execute_batch([("INSERT INTO t VALUES (?)", (i,)), (f"CREATE TABLE x{i} (a INT)", ())])
+
+    def schemas():
+        try:
+            while not stop.is_set():
+                db.schema()
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=schemas, daemon=True) for _ in range(2)]
+    writer = threading.Thread(target=batches, daemon=True)
+    for thread in readers + [writer]:
+        thread.start()
+    writer.join(30)
+    stop.set()
+    for thread in readers:
+        thread.join(5)
+    assert not writer.is_alive() and not errors
+    assert len(db.schema()["tables"]) == 201
+    db.close()
+
+
+def test_batches_may_read_a_table_then_checkpoint_or_create_a_view(tmp_path):
+    db = Database(str(tmp_path))
+    db.execute("CREATE TABLE t (a INT)")
+    db.execute("INSERT INTO t VALUES (1)")
+    results = db.execute_batch([
+        ("SELECT * FROM t", ()),
+        ("CREATE TABLE u (b INT)", ()),
+        ("INSERT INTO u VALUES (1)", ()),
+        ("CHECKPOINT", ()),
+        ("CREATE MATERIALIZED VIEW v AS SELECT * FROM t JOIN u ON t.a = u.b", ()),
+        ("SELECT * FROM v", ()),
+    ])
+    assert results == [[{"a": 1}], None, 1, None, None, [{"t.a": 1, "u.b": 1}]]
+    db.close()
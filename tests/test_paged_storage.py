@@ -0,0 +1,75 @@
+# test_paged_storage.py
+import os
+
+import pytest
+
+from rdbms import Database
+
+QUERIES = [
+    "SELECT * FROM t",
+    "SELECT * FROM t WHERE n > 500 AND s LIKE 'b%'",
+    "SELECT * FROM t WHERE id = 777",
+    "SELECT * FROM t WHERE n = 42",
+    "SELECT s, COUNT(*) AS c, MAX(n) AS hi FROM t GROUP BY s",
+    "SELECT * FROM t ORDER BY n DESC LIMIT 9",
+]
+
+
+def fill(db, storage):
+    db.execute(f"CREATE TABLE t (id INT PRIMARY KEY, n INT, s TEXT) STORAGE {storage}")
+    db.execute("CREATE INDEX t_n ON t(n)")
+    db.insert_many("t", [(i, i * 37 % 1000, "abc"[i % 3] * (5 + i % 40)) for i in range(5000)])
+    db.execute("UPDATE t SET s = 'bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb' WHERE n < 50")
+    db.execute("DELETE FROM t WHERE n > 950")
+    db.execute("INSERT INTO t VALUES (9000, 42, 'late'), (9001, NULL, NULL)")
+
+
+def results(db):
+    return [sorted(map(repr, db.execute(text))) for text in QUERIES]
+
+
+def test_paged_tables_agree_with_columnar_ones():
+    columnar = Database(result_cache_bytes=0)
+    fill(columnar, "COLUMNAR")
+    paged = Database(result_cache_bytes=0, buffer_pool_pages=8)
+    fill(paged, "PAGED")
+    assert results(paged) == results(columnar)
+
+
+def test_the_buffer_pool_stays_within_its_capacity():
+    db = Database(result_cache_bytes=0, buffer_pool_pages=8)
+    fill(db, "PAGED")
+    for _ in range(3):
+        for i in range(0, 5000, 97):
+            db.execute("SELECT * FROM t WHERE id = ?", (i,))
+    stats = db.buffer_pool.stats()
+    assert stats["capacity"] == 8
+    assert stats["resident"] <= 8
+    assert stats["hits"] > 0 and stats["misses"] > 0
+    # Changed pages went back to the file when they were evicted
+    assert stats["writes"] > 0
+
+
+def test_paged_is_the_default_storage_when_asked():
+    db = Database(storage="paged")
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, s TEXT)")
+    db.execute("INSERT INTO t VALUES (1, 'a')")
+    assert type(db.tables["t"].store).__name__ == "PagedStore"
+    assert db.execute("SELECT * FROM t") == [{"id": 1, "s": "a"}]
+
+
+@pytest.mark.parametrize("checkpoint", [False, True])
+def test_paged_tables_survive_a_restart(tmp_path, checkpoint):
+    db = Database(str(tmp_path), buffer_pool_pages=8)
+    fill(db, "PAGED")
+    if checkpoint:
+        db.execute("CHECKPOINT")
+        assert os.path.exists(tmp_path / "t.pages")
+        # Changes after the checkpoint never overwrite the pages it refers to
+        db.execute("UPDATE t SET n = 0 WHERE id < 100")
+        db.execute("DELETE FROM t WHERE id > 4000")
+    expected = results(db)
+    db.close()
+    db = Database(str(tmp_path), buffer_pool_pages=8)
+    assert results(db) == expected
+    db.close()
@@ -0,0 +1,61 @@
+# test_parallel.py
+import random
+
+import pytest
+
+from rdbms import Database
+
+QUERIES = [
+    "SELECT * FROM o WHERE qty = 3",
+    "SELECT id, item FROM o WHERE qty > 7 AND item = 'pen'",
+    "SELECT item, COUNT(*), SUM(qty), MAX(qty) FROM o GROUP BY item",
+    "SELECT COUNT(*), MIN(qty) FROM o WHERE item IS NULL",
+    "SELECT u.grp, COUNT(*), SUM(o.qty) FROM u JOIN o ON u.id = o.uid GROUP BY u.grp",
+    "SELECT o.item, u.grp, COUNT(*) FROM o JOIN u ON o.uid = u.id GROUP BY o.item, u.grp",
+    "SELECT o.item, COUNT(*) FROM u JOIN o ON u.id = o.uid WHERE u.age > 30 GROUP BY o.item",
+    "SELECT u.grp, COUNT(o.id) FROM u LEFT JOIN o ON u.id = o.uid GROUP BY u.grp",
+    "SELECT o.item, COUNT(*) FROM o LEFT JOIN u ON o.uid = u.id GROUP BY o.item",
+    "SELECT * FROM o JOIN u ON o.uid = u.id WHERE o.qty = 3",
+    "SELECT * FROM u JOIN o ON u.id = o.uid WHERE o.qty = 3",
+]
+
+
+def build(workers):
+    db = Database(parallel_workers=workers, parallel_min_rows=1000, result_cache_bytes=0)
+    db.execute("CREATE TABLE u (id INT PRIMARY KEY, grp TEXT, age INT)")
+    db.execute("CREATE TABLE o (id INT PRIMARY KEY, uid INT, item TEXT, qty INT)")
+    rng = random.Random(7)
+    db.insert_many("u", [(i, rng.choice("abcdefgh"), rng.randint(1, 90)) for i in range(3000)])
+    db.insert_many("o", [(i, rng.randint(0, 3500), rng.choice(["pen", "cup", "box", None]), rng.randint(1, 9))
+                         for i in range(60000)])
+    db.execute("ANALYZE")
+    return db
+
+
+@pytest.fixture(scope="module")
+def databases():
+    serial, parallel = build(0), build(2)
+    yield serial, parallel
+    serial.close()
+    parallel.close()
+
+
+def test_some_plans_are_parallel(databases):
+    _, parallel = databases
+    plans = [" ".join(line["plan"] for line in parallel.execute("EXPLAIN " + query)) for query in QUERIES]
+    assert sum("Parallel" in plan for plan in plans) >= len(QUERIES) // 2
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_parallel_matches_serial_in_order(databases, query):
+    serial, parallel = databases
+    assert parallel.execute(query) == serial.execute(query)
+
+
+def test_parallel_sees_writes(databases):
+    serial, parallel = databases
+    query = "SELECT item, COUNT(*), SUM(qty) FROM o GROUP BY item"
+    for db in databases:
+        db.execute("UPDATE o SET qty = 100 WHERE uid = 7")
+        db.execute("DELETE FROM o WHERE qty = 1")
+    assert parallel.execute(query) == serial.execute(query)
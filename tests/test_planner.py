@@ -0,0 +1,78 @@
+# test_planner.py
+import re
+
+import pytest
+
+from rdbms import Database
+
+
+@pytest.fixture
+def db():
+    db = Database(result_cache_bytes=0)
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, v INT, s TEXT)")
+    db.insert_many("t", [(i, i % 1000 if i % 10 else None, f"s{i % 3}") for i in range(20000)])
+    db.execute("CREATE ORDERED INDEX t_v ON t(v)")
+    db.execute("CREATE TABLE small (id INT PRIMARY KEY, tid INT)")
+    db.insert_many("small", [(i, i * 7) for i in range(20)])
+    return db
+
+
+def plan(db, text):
+    return [row["plan"] for row in db.execute("EXPLAIN " + text)]
+
+
+def test_analyze_collects_column_statistics(db):
+    assert db.statistics() == {}
+    db.execute("ANALYZE t")
+    assert set(db.statistics()) == {"t"}
+    stats = db.statistics()["t"]
+    assert stats.rows == 20000
+    v = stats.columns["v"]
+    assert (v.count, v.nulls, v.distinct) == (18000, 2000, 900)
+    assert v.bounds[0] == 1 and v.bounds[-1] == 999
+    assert stats.columns["s"].distinct == 3
+    db.execute("ANALYZE")
+    assert set(db.statistics()) == {"t", "small"}
+
+
+def test_statistics_pick_the_access_path(db):
+    text = "SELECT * FROM t WHERE v > 995"
+    db.execute("ANALYZE")
+    selective = plan(db, text)
+    assert "Index Range Scan on t using t_v" in selective[-1]
+    estimate = int(re.search(r"rows=(\d+)", selective[-1]).group(1))
+    assert abs(estimate - len(db.execute(text))) < 30
+    # A range that matches most rows is cheaper to scan
+    assert "Column Scan" in plan(db, "SELECT * FROM t WHERE v > 5")[-1]
+    assert db.execute(text) == [row for row in db.execute("SELECT * FROM t") if row["v"] is not None and row["v"] > 995]
+
+
+def test_the_smaller_table_drives_a_join(db):
+    db.execute("ANALYZE")
+    for text in ["SELECT * FROM small JOIN t ON small.tid = t.id", "SELECT * FROM t JOIN small ON t.id = small.tid"]:
+        lines = plan(db, text)
+        assert lines[0].startswith("Index Nested Loop")
+        assert "Seq Scan on small" in lines[1]
+        assert len(db.execute(text)) == 20
+
+
+def test_statistics_survive_a_restart(tmp_path):
+    db = Database(str(tmp_path))
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, v INT)")
+    db.insert_many("t", [(i, i % 7) for i in range(100)])
+    db.execute("ANALYZE t")
+    db.close()
+    db = Database(str(tmp_path))
+    assert db.statistics()["t"].columns["v"].distinct == 7
+    db.close()
+
+
+def test_explain_analyze_reports_actual_rows(db):
+    lines = plan(db, "ANALYZE SELECT * FROM t WHERE v > 995 LIMIT 4")
+    assert all("actual rows=4 loops=1" in line for line in lines[:3])
+    assert lines[-3].startswith("Planning time: ") and lines[-2].startswith("Execution time: ")
+    assert lines[-1] == "Rows: 4"
+    with pytest.raises(ValueError):
+        db.execute("EXPLAIN DELETE FROM t")
+    with pytest.raises(ValueError):
+        db.execute("ANALYZE nope")
@@ -0,0 +1,70 @@
+# test_predicates.py
+import pytest
+
+from rdbms import Database
+
+
+@pytest.fixture
+def db():
+    db = Database()
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, v INT, s TEXT)")
+    db.execute("INSERT INTO t VALUES (1, 1, 'apple'), (2, NULL, 'banana'), (3, 3, NULL), (4, 4, 'apricot')")
+    return db
+
+
+@pytest.mark.parametrize("where, ids", [
+    ("v = NULL", []),
+    ("v <> NULL", []),
+    ("v IS NULL", [2]),
+    ("v IS NOT NULL", [1, 3, 4]),
+    ("v > 1", [3, 4]),
+    # NOT of UNKNOWN is still UNKNOWN, so rows with a NULL v stay out
+    ("NOT v > 1", [1]),
+    ("v BETWEEN 2 AND 4", [3, 4]),
+    ("NOT v BETWEEN 2 AND 4", [1]),
+    ("v IN (1, NULL)", [1]),
+    ("v NOT IN (1)", [3, 4]),
+    ("v NOT IN (1, NULL)", []),
+    ("s LIKE 'ap%'", [1, 4]),
+    ("s LIKE '_pple'", [1]),
+    ("NOT s LIKE 'ap%'", [2]),
+    ("s NOT LIKE 'ap%'", [2]),
+    ("v > 1 OR s IS NULL", [3, 4]),
+    ("v > 3 OR s = 'banana'", [2, 4]),
+    ("NOT (v > 1 OR s IS NULL)", [1]),
+    ("v > 1 AND s LIKE 'a%'", [4]),
+    ("NOT (v > 1 AND s LIKE 'a%')", [1, 2]),
+])
+def test_three_valued_logic(db, where, ids):
+    assert [row["id"] for row in db.execute(f"SELECT id FROM t WHERE {where} ORDER BY id")] == ids
+
+
+@pytest.mark.parametrize("index", ["CREATE INDEX t_v ON t(v)", "CREATE ORDERED INDEX t_v ON t(v)",
+                                   "CREATE ORDERED INDEX t_s ON t(s)"])
+def test_indexes_give_the_same_answers(db, index):
+    queries = ["v = 3", "v IN (1, 4, NULL)", "v BETWEEN 1 AND 3", "v > 1 AND s IS NOT NULL", "s LIKE 'ap%'",
+               "s = 'banana'"]
+    before = [db.execute(f"SELECT id FROM t WHERE {where} ORDER BY id") for where in queries]
+    db.execute(index)
+    assert [db.execute(f"SELECT id FROM t WHERE {where} ORDER BY id") for where in queries] == before
+
+
+def test_update_and_delete_use_the_same_predicates(db):
+    assert db.execute("UPDATE t SET s = 'x' WHERE NOT v > 1") == 1
+    assert db.execute("DELETE FROM t WHERE v NOT IN (1, NULL)") == 0
+    assert db.execute("DELETE FROM t WHERE s IS NULL OR v IS NULL") == 2
+    assert [row["id"] for row in db.execute("SELECT id FROM t ORDER BY id")] == [1, 4]
+
+
+@pytest.mark.parametrize("where", ["v = 'abc'", "v LIKE 'a%'", "v IN (1, 'two')", "nope = 1"])
+def test_type_errors_are_reported(db, where):
+    with pytest.raises(ValueError):
+        db.execute(f"SELECT * FROM t WHERE {where}")
+
+
+def test_parameters_are_converted_once(db):
+    stmt = db.prepare("SELECT id FROM t WHERE v BETWEEN ? AND ? ORDER BY id")
+    assert stmt.execute((1, 3)) == [{"id": 1}, {"id": 3}]
+    assert stmt.execute(("3", "4")) == [{"id": 3}, {"id": 4}]
+    with pytest.raises(ValueError):
+        stmt.execute(("low", 4))
@@ -0,0 +1,69 @@
+# test_result_cache.py
+from rdbms import Database
+
+
+def make_database(**options):
+    db = Database(**options)
+    db.execute("CREATE TABLE users (id INT PRIMARY KEY, name TEXT)")
+    db.execute("CREATE TABLE orders (id INT PRIMARY KEY, user_id INT)")
+    db.execute("INSERT INTO users VALUES (1, 'ada'), (2, 'bob')")
+    db.execute("INSERT INTO orders VALUES (1, 1), (2, 2), (3, 2)")
+    db.execute("CREATE MATERIALIZED VIEW joined AS SELECT * FROM users JOIN orders ON users.id = orders.user_id")
+    return db
+
+
+def counts(db):
+    stats = db.cache_stats()
+    return stats["hits"], stats["misses"], stats["invalidations"]
+
+
+def test_repeated_selects_are_served_from_the_cache():
+    db = make_database()
+    first = db.execute("SELECT * FROM users WHERE id = ?", (1,))
+    assert counts(db) == (0, 1, 0)
+    # Spelling and whitespace do not matter, parameters do
+    assert db.execute("select *   from users where id = ?", (1,)) == first
+    assert counts(db) == (1, 1, 0)
+    assert db.execute("SELECT * FROM users WHERE id = ?", (2,)) == [{"id": 2, "name": "bob"}]
+    assert counts(db) == (1, 2, 0)
+    # Callers get their own copies of cached rows
+    first[0]["name"] = "changed"
+    assert db.execute("SELECT * FROM users WHERE id = ?", (1,)) == [{"id": 1, "name": "ada"}]
+
+
+def test_writes_invalidate_only_the_results_that_read_the_table():
+    db = make_database()
+    queries = ["SELECT * FROM users", "SELECT * FROM orders",
+               "SELECT * FROM users JOIN orders ON users.id = orders.user_id", "SELECT * FROM joined"]
+    for text in queries:
+        db.execute(text)
+    db.execute("UPDATE orders SET user_id = 1 WHERE id = 3")
+    before = counts(db)
+    results = [db.execute(text) for text in queries]
+    hits, misses, invalidations = counts(db)
+    # Only the users result is still valid; the join and the view read orders
+    assert (hits - before[0], misses - before[1], invalidations - before[2]) == (1, 3, 3)
+    assert results[3] == results[2]
+    assert [row["orders.user_id"] for row in results[2]] == [1, 2, 1]
+
+
+def test_the_cache_stays_within_its_budget():
+    db = make_database(result_cache_bytes=20_000)
+    db.execute("CREATE TABLE big (id INT PRIMARY KEY, s TEXT)")
+    db.insert_many("big", [(i, "x" * 50) for i in range(200)])
+    for i in range(50):
+        db.execute("SELECT * FROM big WHERE id < ?", (i * 4,))
+    stats = db.cache_stats()
+    assert stats["bytes"] <= stats["budget"] == 20_000
+    assert stats["evictions"] > 0
+    # Too large for the budget: never stored
+    db.execute("SELECT * FROM big")
+    db.execute("SELECT * FROM big")
+    assert db.cache_stats()["hits"] == 0
+
+
+def test_a_zero_budget_turns_the_cache_off():
+    db = make_database(result_cache_bytes=0)
+    db.execute("SELECT * FROM users")
+    assert db.execute("SELECT * FROM users") == [{"id": 1, "name": "ada"}, {"id": 2, "name": "bob"}]
+    assert db.cache_stats() is None
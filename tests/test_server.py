@@ -0,0 +1,125 @@
+# test_server.py
+import asyncio
+import threading
+
+import pytest
+
+from client import Client, ServerError
+from rdbms import Database
+from server import Server
+
+
+@pytest.fixture
+def server(tmp_path):
+    db = Database()
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, v TEXT)")
+    db.insert_many("t", [(i, f"v{i}") for i in range(2500)])
+    (tmp_path / "imports").mkdir()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = Server(db, port=0, chunk_rows=100, import_dir=tmp_path / "imports")
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(10)
+    yield server
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    loop.close()
+    db.close()
+
+
+@pytest.fixture
+def client(server):
+    client = Client(f"127.0.0.1:{server.port}", pool_size=2)
+    yield client
+    client.close()
+
+
+def test_execute_round_trips(client):
+    assert client.ping() == "pong"
+    assert client.execute("SELECT * FROM t WHERE id = ?", (7,)) == [{"id": 7, "v": "v7"}]
+    assert client.execute("SELECT * FROM t WHERE id < 0") == []
+    assert client.execute("INSERT INTO t VALUES (?, ?), (?, NULL)", (5000, "new", 5001)) == 2
+    assert client.execute("UPDATE t SET v = 'changed' WHERE id >= 5000") == 2
+    assert client.execute("SELECT * FROM t WHERE id >= 5000 ORDER BY id") == [
+        {"id": 5000, "v": "changed"}, {"id": 5001, "v": "changed"}]
+    assert client.execute("DELETE FROM t WHERE id >= 5000") == 2
+    assert client.execute("CREATE INDEX t_v ON t(v)") is None
+    assert "t_v" in client.schema()["tables"]["t"]["indexes"]
+
+
+def test_results_larger_than_a_frame(client):
+    rows = client.execute("SELECT * FROM t")
+    assert len(rows) == 2500
+    assert rows[0] == {"id": 0, "v": "v0"} and rows[-1] == {"id": 2499, "v": "v2499"}
+    assert [row["id"] for row in client.stream("SELECT id FROM t WHERE id < ?", (250,))] == list(range(250))
+    # A stream abandoned halfway does not disturb the next request
+    stream = client.stream("SELECT * FROM t")
+    assert next(stream) == {"id": 0, "v": "v0"}
+    stream.close()
+    assert client.execute("SELECT COUNT(*) AS n FROM t") == [{"n": 2500}]
+
+
+def test_prepared_statements(client):
+    stmt = client.prepare("SELECT v FROM t WHERE id = ?")
+    assert stmt.execute((3,)) == [{"v": "v3"}]
+    assert list(stmt.stream((4,))) == [{"v": "v4"}]
+    with pytest.raises(ValueError):
+        stmt.execute(())
+
+
+def test_errors_are_raised_and_the_connection_reused(client):
+    with pytest.raises(ServerError, match="does not exist"):
+        client.execute("SELECT * FROM nope")
+    with pytest.raises(ServerError):
+        client.execute("INSERT INTO t VALUES (1, 'dup')")
+    with pytest.raises(ServerError):
+        list(client.stream("SELECT * FROM t WHERE id = 'x'"))
+    assert client.execute("SELECT v FROM t WHERE id = 1") == [{"v": "v1"}]
+
+
+def test_batches_and_pipelines(client):
+    results = client.execute_batch([("INSERT INTO t VALUES (?, ?)", (9000, "a")),
+                                    ("UPDATE t SET v = 'b' WHERE id = ?", (9000,)),
+                                    ("SELECT v FROM t WHERE id = 9000", ())])
+    assert results == [1, 1, [{"v": "b"}]]
+    queries = [("SELECT v FROM t WHERE id = ?", (i,)) for i in range(20)]
+    assert client.pipeline(queries) == [[{"v": f"v{i}"}] for i in range(20)]
+    # The first error is raised after every answer has been read
+    with pytest.raises(ServerError):
+        client.pipeline([("SELECT * FROM t WHERE id = 1", ()), ("SELECT * FROM nope", ()),
+                         ("DELETE FROM t WHERE id = 2", ())])
+    assert client.execute("SELECT * FROM t WHERE id = 2") == []
+
+
+def test_copy_is_limited_to_the_import_directory(client, tmp_path):
+    (tmp_path / "imports" / "ok.csv").write_text("id,v\n7000,ok\n")
+    (tmp_path / "secret.csv").write_text("id,v\n7001,secret\n")
+    for text, params in [(f"COPY t FROM '{tmp_path / 'secret.csv'}' CSV HEADER", ()),
+                         ("COPY t FROM ? CSV HEADER", (str(tmp_path / "imports" / ".." / "secret.csv"),))]:
+        with pytest.raises(ServerError):
+            client.execute(text, params)
+    with pytest.raises(ServerError):
+        client.execute_batch([("COPY t FROM ? CSV HEADER", (str(tmp_path / "secret.csv"),))])
+    assert client.execute("COPY t FROM ? CSV HEADER", (str(tmp_path / "imports" / "ok.csv"),)) == 1
+    assert client.execute("SELECT id FROM t WHERE id >= 7000") == [{"id": 7000}]
+
+
+def test_concurrent_clients(client):
+    errors = []
+
+    def work(offset):
+        try:
+            for i in range(20):
+                client.execute("INSERT INTO t VALUES (?, ?)", (10000 + offset * 100 + i, "c"))
+                assert len(client.execute("SELECT * FROM t WHERE v = 'c'")) >= i + 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert client.execute("SELECT COUNT(*) AS n FROM t WHERE v = 'c'") == [{"n": 80}]
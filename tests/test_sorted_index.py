@@ -0,0 +1,64 @@
+# test_sorted_index.py
+import random
+
+from rdbms import SortedIndex
+
+
+class SmallIndex(SortedIndex):
+    # Tiny blocks so a few hundred rows exercise splits and merges
+    BLOCK_SIZE = 4
+
+
+def check(index, pairs):
+    expected = sorted(pairs)
+    assert [pair for block in index.blocks for pair in block] == expected
+    assert index.maxes == [block[-1] for block in index.blocks]
+    assert all(0 < len(block) <= 2 * index.BLOCK_SIZE for block in index.blocks)
+    assert index.min() == (expected[0][0] if expected else None)
+    assert index.max() == (expected[-1][0] if expected else None)
+
+
+def test_random_adds_and_removes_keep_blocks_sorted():
+    rng = random.Random(7)
+    index = SmallIndex("i", "v")
+    pairs = set()
+    for rid in range(2000):
+        if pairs and rng.random() < 0.45:
+            pair = rng.choice(sorted(pairs))
+            pairs.discard(pair)
+            index.remove(*pair)
+        else:
+            pair = (rng.randrange(50), rid)
+            pairs.add(pair)
+            index.add(*pair)
+        if rid % 50 == 0:
+            check(index, pairs)
+    check(index, pairs)
+    # Removing a pair that is not there changes nothing
+    index.remove(1000, 1)
+    check(index, pairs)
+    while pairs:
+        pair = pairs.pop()
+        index.remove(*pair)
+    check(index, pairs)
+
+
+def test_lookups_and_ranges():
+    rng = random.Random(3)
+    pairs = [(rng.randrange(30), rid) for rid in range(500)]
+    index = SmallIndex("i", "v")
+    index.build(pairs + [(None, 500), (None, 501)])
+    assert index.nulls == {500, 501}
+    for value in range(-1, 31):
+        assert index.lookup(value) == sorted(rid for v, rid in pairs if v == value)
+    assert index.lookup(None) == []
+    for low, high in [(None, None), (5, 10), (10, 5), (None, 3), (27, None), (12, 12)]:
+        for low_inclusive in (True, False):
+            for high_inclusive in (True, False):
+                def inside(v):
+                    if low is not None and (v < low or (v == low and not low_inclusive)):
+                        return False
+                    return high is None or v < high or (v == high and high_inclusive)
+                expected = [rid for v, rid in sorted(pairs) if inside(v)]
+                assert list(index.range(low, high, low_inclusive, high_inclusive)) == expected
+                assert list(index.range(low, high, low_inclusive, high_inclusive, reverse=True)) == expected[::-1]
@@ -0,0 +1,64 @@
+# test_sql.py
+import pytest
+
+from rdbms import Database
+from sql import Parser, parse, tokenize
+
+
+def test_contextual_keywords_are_names_elsewhere():
+    db = Database()
+    db.execute("CREATE TABLE index (key INT PRIMARY KEY, view TEXT UNIQUE, header TEXT, storage INT) STORAGE ROWS")
+    db.execute("CREATE TABLE csv (key INT PRIMARY KEY, desc INT, left TEXT)")
+    db.execute("CREATE ORDERED INDEX table ON index(storage)")
+    db.execute("INSERT INTO index (key, view, header, storage) VALUES (1, 'a', 'h', 3), (2, 'b', NULL, 1)")
+    db.execute("INSERT INTO csv VALUES (1, 20, 'x'), (2, 10, 'y')")
+    assert db.execute("SELECT key FROM index WHERE header IS NULL") == [{"key": 2}]
+    assert [row["key"] for row in db.execute("SELECT * FROM index ORDER BY storage desc")] == [1, 2]
+    assert [row["desc"] for row in db.execute("SELECT desc FROM csv ORDER BY desc DESC")] == [20, 10]
+    rows = db.execute("SELECT index.view, csv.left FROM index left JOIN csv ON index.key = csv.key WHERE csv.desc < 15")
+    assert rows == [{"index.view": "b", "csv.left": "y"}]
+    db.execute("CREATE MATERIALIZED VIEW view AS SELECT * FROM index JOIN csv ON index.key = csv.key")
+    assert len(db.execute("SELECT * FROM view")) == 2
+    assert "table" in db.schema()["tables"]["index"]["indexes"]
+
+
+def test_copy_into_columns_named_like_its_options(tmp_path):
+    path = tmp_path / "rows.csv"
+    path.write_text("header,csv\n1,a\n2,b\n")
+    db = Database()
+    db.execute("CREATE TABLE jsonl (header INT, csv TEXT)")
+    assert db.execute(f"COPY jsonl (header, csv) FROM '{path}' CSV HEADER") == 2
+    assert db.execute("SELECT csv FROM jsonl WHERE header = 2") == [{"csv": "b"}]
+
+
+def test_prepared_statements_with_contextual_names():
+    db = Database()
+    db.execute("CREATE TABLE key (index INT, unique TEXT)")
+    insert = db.prepare("INSERT INTO key (index, unique) VALUES (?, ?)")
+    for i in range(3):
+        insert.execute((i, str(i)))
+    select = db.prepare("SELECT unique FROM key WHERE index = ?")
+    assert select.execute((2,)) == [{"unique": "2"}]
+    # The plan cache key upper-cases reserved words but keeps names verbatim
+    assert db.prepare("select unique from key where index = ?").statement is select.statement
+    assert db.prepare("SELECT unique FROM KEY WHERE index = ?").statement is not select.statement
+
+
+def test_keywords_still_parse_in_any_case():
+    statement = parse("create ordered index by_view on t(view)")
+    assert (statement.name, statement.table, statement.column, statement.ordered) == ("by_view", "t", "view", True)
+    table = parse("create table t (id int primary key auto_increment, key text unique) storage rows with aggregates")
+    assert (table.primary_key, table.auto_increment, table.unique_keys) == ("id", "id", ["key"])
+    assert (table.storage, table.aggregates) == ("rows", True)
+
+
+@pytest.mark.parametrize("text", [
+    "CREATE TABLE select (id INT)",
+    "SELECT from FROM t",
+    "SELECT * FROM t WHERE not = 1",
+    "CREATE TABLE t (id INT) STORAGE",
+    "CREATE INDEX ON t(id)",
+])
+def test_reserved_words_and_incomplete_statements_are_rejected(text):
+    with pytest.raises(ValueError):
+        Parser(tokenize(text)).parse()
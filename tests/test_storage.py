@@ -0,0 +1,75 @@
+# test_storage.py
+import sys
+
+import pytest
+
+from rdbms import Database
+
+QUERIES = [
+    "SELECT * FROM t",
+    "SELECT * FROM t WHERE n > 50 AND s LIKE 'b%'",
+    "SELECT * FROM t WHERE n IS NULL OR s = 'c'",
+    "SELECT s, COUNT(*) AS c, SUM(n) AS total FROM t GROUP BY s",
+    "SELECT * FROM t ORDER BY n DESC LIMIT 7",
+]
+
+
+def make_table(db, storage):
+    db.execute(f"CREATE TABLE t (id INT PRIMARY KEY, n INT, s TEXT) STORAGE {storage}")
+    rows = [(i, None if i % 9 == 0 else i * 7 % 100, "abcd"[i % 4] * (1 + i % 3)) for i in range(300)]
+    db.insert_many("t", rows)
+
+
+def test_columnar_and_row_storage_agree():
+    results = []
+    for storage in ("COLUMNAR", "ROWS"):
+        db = Database()
+        make_table(db, storage)
+        db.execute("UPDATE t SET s = 'c' WHERE n < 10")
+        db.execute("DELETE FROM t WHERE id > 250")
+        results.append([sorted(map(repr, db.execute(text))) for text in QUERIES])
+    assert results[0] == results[1]
+
+
+def test_columnar_values_are_converted_to_the_column_types():
+    db = Database()
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, n INT, s TEXT)")
+    db.execute("INSERT INTO t VALUES ('1', ' 12 ', 34)")
+    db.execute("INSERT INTO t VALUES (2, 3.0, NULL)")
+    assert db.execute("SELECT * FROM t") == [{"id": 1, "n": 12, "s": "34"}, {"id": 2, "n": 3, "s": None}]
+    for values in ["(3, 'abc', 'x')", "(3, 1.5, 'x')", f"(3, {1 << 63}, 'x')"]:
+        with pytest.raises(ValueError):
+            db.execute(f"INSERT INTO t VALUES {values}")
+    with pytest.raises(ValueError):
+        db.execute("UPDATE t SET n = 'abc' WHERE id = 1")
+    assert len(db.execute("SELECT * FROM t")) == 2
+
+
+def test_row_storage_keeps_values_as_given():
+    db = Database()
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, n INT, s TEXT) STORAGE ROWS")
+    db.execute("INSERT INTO t VALUES (1, 12, 34)")
+    assert db.execute("SELECT * FROM t") == [{"id": 1, "n": 12, "s": 34}]
+
+
+def test_columnar_rows_take_far_less_memory():
+    db = Database()
+    make_table(db, "COLUMNAR")
+    table = db.tables["t"]
+    rows = db.execute("SELECT * FROM t")
+    as_dicts = sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row.values())) for row in rows)
+    assert table.store.nbytes() * 5 < as_dicts
+
+
+@pytest.mark.parametrize("storage", ["COLUMNAR", "ROWS"])
+def test_storage_survives_a_checkpoint(tmp_path, storage):
+    db = Database(str(tmp_path))
+    make_table(db, storage)
+    db.execute("CHECKPOINT")
+    db.execute("UPDATE t SET s = NULL WHERE id = 5")
+    expected = db.execute("SELECT * FROM t")
+    db.close()
+    db = Database(str(tmp_path))
+    assert db.execute("SELECT * FROM t") == expected
+    assert type(db.tables["t"].store).__name__ == ("ColumnStore" if storage == "COLUMNAR" else "RowStore")
+    db.close()
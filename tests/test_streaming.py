@@ -0,0 +1,74 @@
+# test_streaming.py
+import pytest
+
+from rdbms import Database
+
+
+@pytest.fixture
+def db():
+    db = Database(result_cache_bytes=0)
+    db.execute("CREATE TABLE users (id INT PRIMARY KEY, name TEXT)")
+    db.execute("CREATE TABLE orders (id INT PRIMARY KEY, user_id INT, amount INT)")
+    db.insert_many("users", [(i, f"u{i % 50}") for i in range(2000)])
+    db.insert_many("orders", [(i, i % 2000, i % 97) for i in range(10000)])
+    db.execute("CREATE INDEX orders_user ON orders(user_id)")
+    return db
+
+
+def scanned(db, text, params=()):
+    records = []
+    db.add_hook(records.append)
+    try:
+        rows = db.execute(text, params)
+    finally:
+        db.remove_hook(records.append)
+    return rows, records[-1].rows_scanned
+
+
+@pytest.mark.parametrize("text, most", [
+    ("SELECT * FROM orders LIMIT 5", 5),
+    ("SELECT * FROM orders WHERE amount = 3 LIMIT 5", 500),
+    # An index nested loop join probes for only as many users as it needs
+    ("SELECT * FROM users JOIN orders ON users.id = orders.user_id LIMIT 5", 50),
+])
+def test_limit_stops_the_scan(db, text, most):
+    rows, count = scanned(db, text)
+    assert len(rows) == 5
+    assert count <= most
+
+
+def test_limited_results_match_the_full_ones(db):
+    full = db.execute("SELECT * FROM orders WHERE amount > 90")
+    assert db.execute("SELECT * FROM orders WHERE amount > 90 LIMIT 7") == full[:7]
+    # ORDER BY without an index keeps only the top rows
+    top = sorted(full, key=lambda row: row["amount"], reverse=True)
+    assert [row["amount"] for row in db.execute("SELECT * FROM orders WHERE amount > 90 ORDER BY amount DESC LIMIT 7")] \
+        == [row["amount"] for row in top[:7]]
+    assert db.execute("SELECT * FROM orders LIMIT 0") == []
+
+
+def test_streams_are_lazy(db):
+    stream = db.prepare("SELECT * FROM orders WHERE amount = ?").stream((5,))
+    assert iter(stream) is stream
+    first = next(stream)
+    assert first["amount"] == 5
+    rest = list(stream)
+    assert [first] + rest == db.execute("SELECT * FROM orders WHERE amount = 5")
+    # An abandoned stream does not keep the table from being written
+    stream = db.prepare("SELECT * FROM orders").stream()
+    next(stream)
+    db.execute("DELETE FROM orders WHERE id = 1")
+    stream.close()
+
+
+def test_repl_prints_rows_as_they_stream(monkeypatch, capsys):
+    monkeypatch.setenv("RDBMS_DATA_DIR", "")
+    repl = pytest.importorskip("repl")
+    monkeypatch.setattr(repl, "db", Database())
+    repl.execute("CREATE TABLE t (id INT, s TEXT)")
+    repl.execute("INSERT INTO t VALUES (1, 'a'), (2, 'b')")
+    capsys.readouterr()
+    repl.execute("SELECT * FROM t")
+    assert capsys.readouterr().out.splitlines() == ["{'id': 1, 's': 'a'}", "{'id': 2, 's': 'b'}"]
+    repl.execute("SELECT * FROM nope")
+    assert capsys.readouterr().out.startswith("Error:")
@@ -0,0 +1,144 @@
+# test_views.py
+import pytest
+
+from rdbms import Database
+
+QUERIES = {
+    "joined": "SELECT * FROM users JOIN orders ON users.id = orders.user_id",
+    "all_users": "SELECT * FROM users LEFT JOIN orders ON users.id = orders.user_id",
+    "filtered": "SELECT users.name, orders.amount FROM users JOIN orders ON users.id = orders.user_id "
+                "WHERE orders.amount > 10",
+}
+
+
+def key(row):
+    return sorted((column, repr(value)) for column, value in row.items())
+
+
+def check(db):
+    for name, query in QUERIES.items():
+        view = sorted(map(key, db.execute(f"SELECT * FROM {name}")))
+        assert view == sorted(map(key, db.execute(query))), name
+
+
+def make_database(path=None):
+    db = Database(path)
+    db.execute("CREATE TABLE users (id INT PRIMARY KEY, name TEXT)")
+    db.execute("CREATE TABLE orders (id INT PRIMARY KEY, user_id INT, amount INT)")
+    db.execute("CREATE INDEX orders_user ON orders(user_id)")
+    db.execute("INSERT INTO users VALUES (1, 'ada'), (2, 'bob'), (3, 'cy')")
+    db.execute("INSERT INTO orders VALUES (10, 1, 5), (11, 1, 20), (12, 2, 15), (13, 9, 30)")
+    for name, query in QUERIES.items():
+        db.execute(f"CREATE MATERIALIZED VIEW {name} AS {query}")
+    return db
+
+
+def test_views_start_equal_to_their_query():
+    db = make_database()
+    check(db)
+    assert len(db.execute("SELECT * FROM all_users")) == 4
+
+
+@pytest.mark.parametrize("statement", [
+    "INSERT INTO users VALUES (9, 'dee')",
+    "INSERT INTO orders VALUES (14, 3, 40), (15, 3, 1)",
+    "UPDATE users SET name = 'ann' WHERE id = 1",
+    "UPDATE users SET id = 4 WHERE id = 3",
+    "UPDATE orders SET user_id = 2 WHERE id = 10",
+    "UPDATE orders SET amount = 50 WHERE user_id = 1",
+    "UPDATE orders SET user_id = NULL WHERE id = 12",
+    "DELETE FROM users WHERE id = 1",
+    "DELETE FROM orders WHERE user_id = 1",
+    "DELETE FROM orders",
+])
+def test_views_follow_each_change(statement):
+    db = make_database()
+    db.execute(statement)
+    check(db)
+
+
+def test_views_follow_a_sequence_of_changes_and_compaction():
+    db = make_database()
+    db.execute("INSERT INTO orders VALUES (14, 3, 40)")
+    db.execute("DELETE FROM users WHERE id = 2")
+    db.execute("INSERT INTO users VALUES (2, 'bea')")
+    db.execute("UPDATE orders SET user_id = 3 WHERE amount > 10")
+    check(db)
+    # Compacting renumbers the rows the views point at
+    for table in db.tables.values():
+        table.compact()
+    check(db)
+    db.execute("UPDATE users SET name = 'cyd' WHERE id = 3")
+    db.execute("DELETE FROM orders WHERE id = 14")
+    check(db)
+
+
+def test_views_survive_a_restart(tmp_path):
+    db = make_database(str(tmp_path))
+    db.execute("CHECKPOINT")
+    db.execute("UPDATE orders SET user_id = 3 WHERE id = 11")
+    db.execute("DELETE FROM users WHERE id = 2")
+    db.close()
+    db = Database(str(tmp_path))
+    check(db)
+    db.execute("INSERT INTO orders VALUES (20, 2, 99)")
+    check(db)
+    db.close()
+
+
+def index_views(db):
+    db.execute("CREATE ORDERED INDEX joined_amount ON joined(orders.amount)")
+    db.execute("CREATE ORDERED INDEX all_users_amount ON all_users(orders.amount)")
+
+
+def check_indexes(db):
+    # Range and ordered reads through the view indexes match a sort of the whole view
+    for name in ("joined", "all_users"):
+        rows = db.execute(f"SELECT * FROM {name}")
+        ranged = sorted((row for row in rows if row["orders.amount"] is not None and row["orders.amount"] > 10),
+                        key=lambda row: row["orders.amount"])
+        assert db.execute(f"SELECT * FROM {name} WHERE orders.amount > 10 ORDER BY orders.amount") == ranged
+        amounts = [row["orders.amount"] for row in db.execute(f"SELECT * FROM {name} ORDER BY orders.amount DESC")]
+        values = sorted(amount for amount in amounts if amount is not None)
+        assert amounts == [None] * (len(amounts) - len(values)) + values[::-1]
+
+
+def test_view_indexes_serve_ordered_reads():
+    db = make_database()
+    index_views(db)
+    plan = "\n".join(row["plan"] for row in db.execute(
+        "EXPLAIN SELECT * FROM joined WHERE orders.amount > 10 ORDER BY orders.amount LIMIT 1"))
+    assert "Index Scan on joined using joined_amount" in plan
+    assert "Sort" not in plan
+    check_indexes(db)
+    assert db.schema()["views"]["joined"]["indexes"]["joined_amount"]["column"] == "orders.amount"
+    with pytest.raises(ValueError):
+        db.execute("CREATE ORDERED INDEX bad ON joined(users.nope)")
+
+
+@pytest.mark.parametrize("statement", [
+    "INSERT INTO orders VALUES (14, 3, 40), (15, 3, 1)",
+    "UPDATE orders SET amount = 50 WHERE user_id = 1",
+    "UPDATE orders SET user_id = NULL WHERE id = 12",
+    "DELETE FROM users WHERE id = 1",
+    "DELETE FROM orders",
+])
+def test_view_indexes_follow_each_change(statement):
+    db = make_database()
+    index_views(db)
+    db.execute(statement)
+    check(db)
+    check_indexes(db)
+
+
+def test_view_indexes_survive_a_restart(tmp_path):
+    db = make_database(str(tmp_path))
+    db.execute("CREATE ORDERED INDEX joined_amount ON joined(orders.amount)")
+    db.execute("CHECKPOINT")
+    db.execute("CREATE ORDERED INDEX all_users_amount ON all_users(orders.amount)")
+    db.execute("UPDATE orders SET amount = 1 WHERE id = 11")
+    db.close()
+    db = Database(str(tmp_path))
+    assert set(db.schema()["views"]["all_users"]["indexes"]) == {"all_users_amount"}
+    check_indexes(db)
+    db.close()
@@ -0,0 +1,152 @@
+# wal.py
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+FRAME = struct.Struct("<II")  # payload length, crc32 of payload
+
+
+def encode(record):
+    payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_log(path):
+    # Returns (records, offset of the end of the last intact frame). A torn or
+    # corrupt tail from a crash mid-write ends the log there.
+    records = []
+    offset = 0
+    if not os.path.exists(path):
+        return records, offset
+    with open(path, "rb") as f:
+        data = f.read()
+    while offset + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, offset)
+        start = offset + FRAME.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append(pickle.loads(payload))
+        offset = start + length
+    return records, offset
+
+
+class WriteAheadLog:
+    # Append-only log with group commit. append() buffers a record and returns
+    # its LSN; commit(lsn) returns once that record is on disk. The committer
+    # that finds the log not yet synced that far writes and fsyncs everything
+    # buffered so far, so commits that queued up behind one fsync share the next.
+    #
+    # With synchronous=False commits do not wait (relaxed durability): records
+    # are written with one fsync once sync_every are pending or sync_interval
+    # seconds have passed, and a crash can lose the writes of that window.
+    def __init__(self, path, lsn=0, sync_every=64, sync_interval=0.05, synchronous=True):
+        self.path = path
+        self.lsn = lsn
+        self.synced_lsn = lsn
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.synchronous = synchronous
+        self.buffer = bytearray()
+        self.pending = 0
+        self.written = os.path.getsize(path) if os.path.exists(path) else 0
+        self.last_sync = time.monotonic()
+        # lock guards the buffer and counters; io is held by whoever writes and fsyncs
+        self.lock = threading.Lock()
+        self.io = threading.Lock()
+        self.file = open(path, "ab")
+        self.closed = threading.Event()
+        self.flusher = None
+        if not synchronous and sync_interval:
+            # Makes sure a quiet period after the last write still gets synced
+            self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flusher.start()
+
+    def _flush_loop(self):
+        while not self.closed.wait(self.sync_interval):
+            with self.io:
+                if self.pending and not self.file.closed:
+                    self._sync()
+
+    def append(self, record):
+        with self.lock:
+            self.lsn += 1
+            lsn = self.lsn
+            self.buffer += encode((lsn, *record))
+            self.pending += 1
+            due = not self.synchronous and (
+                self.pending >= self.sync_every or time.monotonic() - self.last_sync >= self.sync_interval)
+        if due:
+            self.sync()
+        return lsn
+
+    def commit(self, lsn):
+        if not self.synchronous or self.synced_lsn >= lsn:
+            return
+        with self.io:
+            # The fsync this thread waited on may already have covered it
+            if self.synced_lsn < lsn:
+                self._sync()
+
+    def _sync(self):
+        # Callers hold io
+        with self.lock:
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            lsn = self.lsn
+            self.pending = 0
+        if data:
+            self.file.write(data)
+            self.written += len(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.synced_lsn = lsn
+        self.last_sync = time.monotonic()
+
+    def sync(self):
+        with self.io:
+            self._sync()
+
+    def size(self):
+        with self.lock:
+            return self.written + len(self.buffer)
+
+    def reset(self):
+        # Called once a snapshot covers everything logged so far
+        with self.io, self.lock:
+            self.buffer.clear()
+            self.pending = 0
+            self.file.truncate(0)
+            self.file.seek(0)
+            os.fsync(self.file.fileno())
+            self.written = 0
+            self.synced_lsn = self.lsn
+
+    def close(self):
+        self.closed.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        with self.io:
+            if not self.file.closed:
+                self._sync()
+                self.file.close()
+
+
+def write_snapshot(path, state):
+    # Write-then-rename so a crash never leaves a half-written snapshot behind
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)